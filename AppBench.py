@@ -0,0 +1,252 @@
+import os
+import sys
+import json
+import time
+import random
+import itertools
+import argparse
+import tempfile
+import statistics
+from AppMain import AppMain, STORE_UNITS, RECIPE_UNITS
+from AppImports import lazy_import
+from AppStorage import CsvStorage, INGREDIENT_COLUMNS, open_storage
+
+pd = lazy_import("pandas")
+
+BRANDS = ["Finis", "Spar", "Lidl", "Aldi", "Jumbo", "Metro"]
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "BenchBaseline.json")
+
+def generate_dataset(path, ingredient_count=1000, product_count=100, lines_per_recipe=12, seed=0):
+    rng = random.Random(seed)
+    storage = CsvStorage(path)
+    os.makedirs(f"{path}/products", exist_ok=True)
+
+    ingredients = {column: [] for column in INGREDIENT_COLUMNS}
+    ingredient_units = []
+    for i in range(ingredient_count):
+        store_unit = rng.choice(list(STORE_UNITS))
+        basis = STORE_UNITS[store_unit][0]
+        ingredients["Ingredient"].append(f"Ingredient {i:06d}")
+        ingredients["Density (g/ml)"].append(round(rng.uniform(0.4, 1.6), 2))
+        ingredients["Store Brand"].append(rng.choice(BRANDS))
+        ingredients["Store Price (€)"].append(round(rng.uniform(0.2, 25.0), 2))
+        ingredients["Store Amount"].append(rng.choice([1, 6, 12]) if basis == "pc" else rng.choice([0.25, 0.5, 1, 250, 500, 1000]))
+        ingredients["Store Unit"].append(store_unit)
+        ingredient_units.append([unit for unit, (recipe_basis, _) in RECIPE_UNITS.items()
+                                 if (recipe_basis == "pc") == (basis == "pc")])
+
+    storage.save_ingredients(pd.DataFrame(ingredients, columns=INGREDIENT_COLUMNS))
+
+    products = []
+    for i in range(product_count):
+        positions = rng.sample(range(ingredient_count), min(lines_per_recipe, ingredient_count))
+        recipe = {
+            "Ingredient": [ingredients["Ingredient"][pos] for pos in positions],
+            "Amount Used": [round(rng.uniform(1, 500), 1) for _ in positions],
+            "Amount Unit": [rng.choice(ingredient_units[pos]) for pos in positions]
+        }
+        products.append((f"Product {i:05d}", float(rng.choice([1, 4, 8, 12, 24])), rng.choice([1.5, 2.0, 3.5, 4.0]),
+                         recipe))
+
+    storage.save_products(products)
+    return path
+
+def time_call(fn, repeat=5, number=1):
+    fn()
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        timings.append((time.perf_counter() - start) / number)
+    return {"median": statistics.median(timings), "min": min(timings), "repeat": repeat, "number": number}
+
+def run_core_benchmarks(app_main, repeat=5):
+    ingredient_names = app_main.get_ingredient_list()
+    product_names = app_main.get_products_list()
+    units = list(RECIPE_UNITS)
+    rng = random.Random(0)
+    lookups = [(rng.choice(ingredient_names), rng.choice(units)) for _ in range(1000)]
+    sample_products = [rng.choice(product_names) for _ in range(20)]
+
+    results = {}
+    results["get_ingredient_cost"] = time_call(
+        lambda: [app_main.get_ingredient_cost(name, unit) for name, unit in lookups], repeat
+    )
+    results["get_ingredient_cost"]["calls"] = len(lookups)
+
+    results["get_product_data"] = time_call(
+        lambda: [app_main.get_product_data(name) for name in sample_products], repeat
+    )
+    results["get_product_data"]["calls"] = len(sample_products)
+
+    # Unchanged saves are skipped, so each timed save alternates between two versions of the data
+    product_data = app_main.get_product_data(product_names[0])
+    copies = []
+    for extra in [0.0, 1.0]:
+        ingredients = product_data["ingredients"].to_dict(orient="records")
+        ingredients[0]["Amount Used"] += extra
+        copies.append({"product_name": "Benchmark Copy", "pieces_made": product_data["pieces_made"],
+                       "multiplier": product_data["multiplier"], "ingredients": ingredients})
+    saves = itertools.cycle(copies)
+    results["save_product_data"] = time_call(lambda: app_main.save_product_data(next(saves)), repeat)
+    app_main.delete_product_data("Benchmark Copy")
+
+    catalogs = []
+    for extra in [0.01, 0.0]:
+        catalog = app_main.get_ingredients_df()
+        catalog.loc[0, "Store Price (€)"] = catalog.loc[0, "Store Price (€)"] + extra
+        catalogs.append(catalog.to_dict(orient="list"))
+    updates = itertools.cycle(catalogs)
+    results["update_ingredients_file"] = time_call(lambda: app_main.update_ingredients_file(next(updates)), repeat)
+
+    results["cost_all_products"] = time_call(
+        lambda: sum(1 for _ in app_main.cost_all_products(processes=1)), max(1, repeat // 2)
+    )
+    return results
+
+def run_gui_benchmarks(app_main, repeat=5):
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    from PySide6.QtWidgets import QApplication, QMessageBox
+    from AppGUI import BackgroundTasks, IngredientsPage, ProductsPage
+
+    app = QApplication.instance() or QApplication([])
+    tasks = BackgroundTasks()
+
+    # load_product_info reports success in a modal box, which would block an offscreen run
+    information = QMessageBox.information
+    QMessageBox.information = staticmethod(lambda *args, **kwargs: QMessageBox.Ok)
+    try:
+        ingredients_page = IngredientsPage(tasks, app_main)
+        tasks.wait()
+
+        def load_ingredients():
+            ingredients_page.load_data()
+            tasks.wait()
+
+        products_page = ProductsPage(tasks, app_main)
+        tasks.wait()
+        products_page.product_name_dropdown.setCurrentText(app_main.get_products_list()[0])
+
+        def load_product():
+            products_page.load_product_info()
+            tasks.wait()
+
+        results = {
+            "IngredientsPage.load_data": time_call(load_ingredients, repeat),
+            "ProductsPage.load_product_info": time_call(load_product, repeat)
+        }
+    finally:
+        QMessageBox.information = information
+    app.processEvents()
+    return results
+
+def median_run(runs):
+    # Each benchmark's timings from the run with its median fastest time
+    return {name: dict(sorted((run[name] for run in runs), key=lambda timing: timing["min"])[len(runs) // 2],
+                       runs=len(runs))
+            for name in runs[0]}
+
+def compare_results(results, baseline, tolerance, floor=0.01):
+    # Compares the fastest runs, the least noisy; a few ms either way is noise for the quick benchmarks
+    if baseline.get("dataset") != results["dataset"]:
+        print(f"Warning: baseline dataset {baseline.get('dataset')} differs from {results['dataset']}.", file=sys.stderr)
+
+    regressions = []
+    for name, timing in baseline["benchmarks"].items():
+        current = results["benchmarks"].get(name)
+        if current is None:
+            continue
+
+        ratio = current["min"] / timing["min"] if timing["min"] else 1.0
+        slower = ratio > 1 + tolerance and current["min"] - timing["min"] > floor
+        status = "REGRESSION" if slower else "ok"
+        print(f"{name:<32} {timing['min'] * 1000:>10.3f} ms -> {current['min'] * 1000:>10.3f} ms "
+              f"({ratio:.2f}x) {status}", file=sys.stderr)
+        if status != "ok":
+            regressions.append(name)
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m AppBench", description="Dahlia's Delights benchmarks")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    for name, help_text in [("generate", "write a synthetic dataset"), ("run", "run the benchmarks")]:
+        subparser = subparsers.add_parser(name, help=help_text)
+        subparser.add_argument("--ingredients", type=int, default=1000, help="number of ingredients")
+        subparser.add_argument("--products", type=int, default=100, help="number of products")
+        subparser.add_argument("--lines", type=int, default=12, help="recipe lines per product")
+        subparser.add_argument("--seed", type=int, default=0, help="random seed")
+        if name == "generate":
+            subparser.add_argument("path", help="directory to write the dataset to")
+        else:
+            subparser.add_argument("--path", help="benchmark this dataset instead of generating one "
+                                                  "(its files are modified)")
+            subparser.add_argument("--repeat", type=int, default=5, help="timed repetitions per benchmark")
+            subparser.add_argument("--runs", type=int, default=1,
+                                   help="run every benchmark this many times and keep its median run, for a "
+                                        "steadier baseline (default: 1)")
+            subparser.add_argument("--no-gui", action="store_true", help="skip the offscreen GUI benchmarks")
+            subparser.add_argument("-o", "--output", help="write results to this JSON file")
+            subparser.add_argument("--baseline", help="compare against this results JSON file (default: "
+                                                      "BenchBaseline.json, when it was run on the same dataset)")
+            subparser.add_argument("--no-baseline", action="store_true", help="don't compare against any baseline")
+            subparser.add_argument("--tolerance", type=float, default=0.5,
+                                   help="allowed slowdown of the fastest run against the baseline's "
+                                        "(default: 0.5 = 50%%)")
+            subparser.add_argument("--floor", type=float, default=10.0,
+                                   help="slowdowns of at most this many ms are never regressions (default: 10)")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "generate":
+        generate_dataset(args.path, args.ingredients, args.products, args.lines, args.seed)
+        print(f"Generated {args.ingredients} ingredients and {args.products} products in {args.path}.", file=sys.stderr)
+        return 0
+
+    dataset = {"path": args.path}
+    if args.path is None:
+        dataset = {"ingredients": args.ingredients, "products": args.products, "lines": args.lines, "seed": args.seed}
+
+    # Read before the run, so writing new results over the stored baseline still compares against the old one
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as baseline_file:
+            baseline = json.load(baseline_file)
+    elif not args.no_baseline and os.path.exists(BASELINE_FILE):
+        with open(BASELINE_FILE, encoding="utf-8") as baseline_file:
+            baseline = json.load(baseline_file)
+        # The stored baseline only says something about the dataset it was run on
+        if baseline.get("dataset") != dataset:
+            baseline = None
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = args.path
+        if path is None:
+            path = generate_dataset(temp_dir, args.ingredients, args.products, args.lines, args.seed)
+
+        app_main = AppMain(open_storage(path))
+        runs = []
+        for _ in range(max(1, args.runs)):
+            benchmarks = run_core_benchmarks(app_main, args.repeat)
+            if not args.no_gui:
+                benchmarks.update(run_gui_benchmarks(app_main, args.repeat))
+            runs.append(benchmarks)
+        benchmarks = runs[0] if len(runs) == 1 else median_run(runs)
+
+    results = {"dataset": dataset, "python": sys.version.split()[0], "benchmarks": benchmarks}
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as output:
+            json.dump(results, output, indent=2)
+    else:
+        print(json.dumps(results, indent=2))
+
+    if baseline is not None:
+        regressions = compare_results(results, baseline, args.tolerance, args.floor / 1000)
+        if regressions:
+            print(f"{len(regressions)} benchmark(s) regressed: {', '.join(regressions)}.", file=sys.stderr)
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,167 @@
+import json
+import time
+import sqlite3
+import threading
+from AppImports import lazy_import
+
+np = lazy_import("numpy")
+
+class CostCache:
+    """On-disk cache of recipe line costs, keyed by the content of the recipe and the catalog rows it uses"""
+    cache_file = "CostCache.db"
+    touch_batch = 256
+    schema = """
+        CREATE TABLE IF NOT EXISTS costs (
+            key BLOB PRIMARY KEY,
+            costs BLOB,
+            status BLOB,
+            size INTEGER,
+            used REAL
+        );
+        CREATE INDEX IF NOT EXISTS costs_used ON costs(used);
+        CREATE TABLE IF NOT EXISTS recipes (
+            product TEXT PRIMARY KEY,
+            stamp TEXT,
+            digest BLOB,
+            names TEXT
+        );
+    """
+
+    def __init__(self, db_path, max_bytes=64 * 1024 * 1024, verify=False):
+        self.db_path = db_path
+        self.max_bytes = max_bytes
+        self.verify = verify
+        self.hits = 0
+        self.misses = 0
+        self.mismatches = 0
+
+        self._lock = threading.RLock()
+        self._connection = None
+        self._touched = {}
+        self._pending = {}
+        self._pending_recipes = {}
+        self._recipes = None
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state["_lock"] = None
+        state["_connection"] = None
+        state["_touched"] = {}
+        state["_pending"] = {}
+        state["_pending_recipes"] = {}
+        state["_recipes"] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.RLock()
+
+    @property
+    def connection(self):
+        if self._connection is None:
+            # Batch runs write from several worker processes at once, which wait their turn on the lock. The catalog
+            # folder may be on a network drive, where WAL mode can't lock, so the cache keeps the rollback journal
+            self._connection = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False)
+            self._connection.execute("PRAGMA journal_mode = DELETE")
+            self._connection.executescript(self.schema)
+        return self._connection
+
+    def get(self, key):
+        with self._lock:
+            row = self._pending.get(key)
+            if row is None:
+                row = self.connection.execute("SELECT costs, status FROM costs WHERE key = ?", (key,)).fetchone()
+                if row is None:
+                    self.misses += 1
+                    return None
+                self._touched[key] = time.time()
+            self.hits += 1
+        return np.frombuffer(row[0], dtype=np.float64).copy(), np.frombuffer(row[1], dtype=np.int8).astype(np.intp)
+
+    def put(self, key, costs, status):
+        # Writes are held until flush, which stores them in one transaction
+        costs = np.asarray(costs, dtype=np.float64).tobytes()
+        status = np.asarray(status, dtype=np.int8).tobytes()
+        with self._lock:
+            self._pending[key] = costs, status
+            self._touched.pop(key, None)
+
+    def get_recipe(self, product_name, stamp):
+        # Entries are read all at once; one another process has replaced since then just misses on its stamp
+        with self._lock:
+            if self._recipes is None:
+                self._recipes = {product: (stamp, digest, names) for product, stamp, digest, names
+                                 in self.connection.execute("SELECT product, stamp, digest, names FROM recipes")}
+            entry = self._recipes.get(product_name)
+        if entry is None or entry[0] != json.dumps(stamp):
+            return None
+        return entry[1], entry[2].split("\0") if entry[2] else []
+
+    def put_recipe(self, product_name, stamp, digest, names):
+        entry = json.dumps(stamp), digest, "\0".join(names)
+        with self._lock:
+            self._pending_recipes[product_name] = entry
+            if self._recipes is not None:
+                self._recipes[product_name] = entry
+
+    def flush(self, force=False):
+        # Hits only refresh the entries' LRU order, so they are written in batches unless forced
+        with self._lock:
+            if not self._pending and not self._pending_recipes and (
+                    not self._touched or (not force and len(self._touched) < self.touch_batch)):
+                return
+            connection = self.connection
+            connection.executemany("UPDATE costs SET used = ? WHERE key = ?",
+                                   [(used, key) for key, used in self._touched.items()])
+            now = time.time()
+            connection.executemany("INSERT OR REPLACE INTO costs VALUES (?, ?, ?, ?, ?)",
+                                   [(key, costs, status, len(key) + len(costs) + len(status), now)
+                                    for key, (costs, status) in self._pending.items()])
+            connection.executemany("INSERT OR REPLACE INTO recipes VALUES (?, ?, ?, ?)",
+                                   [(product_name, *entry) for product_name, entry in self._pending_recipes.items()])
+            if self._pending:
+                self._evict()
+            connection.commit()
+            self._touched = {}
+            self._pending = {}
+            self._pending_recipes = {}
+
+    def _evict(self):
+        # Least recently used entries go first, down to 90% of the limit so evictions don't run on every flush
+        if self.max_bytes is None:
+            return
+        excess = self.connection.execute("SELECT COALESCE(SUM(size), 0) FROM costs").fetchone()[0] - self.max_bytes
+        if excess <= 0:
+            return
+        excess += self.max_bytes // 10
+
+        stale = []
+        for key, size in self.connection.execute("SELECT key, size FROM costs ORDER BY used"):
+            stale.append((key,))
+            excess -= size
+            if excess <= 0:
+                break
+        self.connection.executemany("DELETE FROM costs WHERE key = ?", stale)
+
+    def clear(self):
+        with self._lock:
+            self.connection.execute("DELETE FROM costs")
+            self.connection.execute("DELETE FROM recipes")
+            self.connection.commit()
+            self._recipes = None
+            self._touched = {}
+            self._pending = {}
+            self._pending_recipes = {}
+
+    def get_stats(self):
+        with self._lock:
+            entries, size = self.connection.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM costs").fetchone()
+        return {"entries": entries, "bytes": size, "hits": self.hits, "misses": self.misses,
+                "mismatches": self.mismatches}
+
+    def close(self):
+        with self._lock:
+            if self._connection is not None:
+                self.flush(force=True)
+                self._connection.close()
+                self._connection = None
@@ -1,10 +1,23 @@
+import os
 import sys
-import pandas as pd
-from PySide6.QtCore import Qt
-from AppMain import AppMain
+import time
+
+STARTUP_TIMING = os.environ.get("DAHLIA_STARTUP_TIMING", "")
+startup_started = time.perf_counter()
+
+from PySide6.QtCore import (Qt, QTimer, QAbstractTableModel, QModelIndex, QStringListModel, QObject, QRunnable,
+                            QThreadPool, Signal, QEvent)
+import AppProfile
+from AppMain import AppMain, PLAN_COLUMNS
+from AppWatch import CatalogWatcher
+from AppImports import lazy_import, is_loaded
 from PySide6.QtWidgets import (QTabWidget, QMainWindow, QApplication, QWidget, QVBoxLayout, QLabel, QTableWidget,
                                QHBoxLayout, QPushButton, QTableWidgetItem, QComboBox, QMessageBox, QGridLayout,
-                               QCompleter, QLineEdit)
+                               QCompleter, QLineEdit, QTableView, QHeaderView, QStyledItemDelegate, QProgressBar,
+                               QFileDialog)
+
+pd = lazy_import("pandas")
+imports_finished = time.perf_counter()
 
 class AppGUI(QMainWindow):
     """Main app window"""
@@ -16,21 +29,385 @@ class AppGUI(QMainWindow):
         self.tabs = QTabWidget()
         self.tabs.setTabPosition(QTabWidget.North)
 
-        self.first_page = IngredientsPage()
-        self.second_page = ProductsPage()
+        self.tasks = BackgroundTasks(self)
+        self.progress_bar = QProgressBar()
+        self.progress_bar.setRange(0, 0)
+        self.progress_bar.setMaximumWidth(120)
+        self.progress_bar.hide()
+        self.statusBar().addPermanentWidget(self.progress_bar)
+        self.tasks.status_changed.connect(self.statusBar().showMessage)
+        self.tasks.busy_changed.connect(self.progress_bar.setVisible)
+
+        if AppProfile.enabled:
+            self.profile_label = QLabel(AppProfile.status_text())
+            self.statusBar().addPermanentWidget(self.profile_label)
+            self.profile_timer = QTimer(self)
+            self.profile_timer.timeout.connect(lambda: self.profile_label.setText(AppProfile.status_text()))
+            self.profile_timer.start(500)
 
-        self.tabs.addTab(self.first_page, "Ingredients")
-        self.tabs.addTab(self.second_page, "Products/Costing")
+        self.app_main = AppMain()
+        self.catalog_events = CatalogEvents(self)
+        self.app_main.add_change_listener(self.catalog_events.changed.emit)
+        self.watch_task = None
+        self.watcher = CatalogWatcher(self.app_main, on_change=self.check_for_changes)
+        self.watcher.start()
+
+        self.first_page = None
+        self.second_page = None
+        self.third_page = None
+        self.page_classes = [("first_page", IngredientsPage), ("second_page", ProductsPage),
+                             ("third_page", PlanningPage)]
+
+        self.tabs.addTab(self.page_placeholder(), "Ingredients")
+        self.tabs.addTab(self.page_placeholder(), "Products/Costing")
+        self.tabs.addTab(self.page_placeholder(), "Production Planning")
+        self.tabs.currentChanged.connect(self.build_page)
+        self.build_page(self.tabs.currentIndex())
 
         self.setCentralWidget(self.tabs)
 
+    def page_placeholder(self):
+        placeholder = QWidget()
+        layout = QVBoxLayout(placeholder)
+        layout.setContentsMargins(0, 0, 0, 0)
+        return placeholder
+
+    def build_page(self, index):
+        attribute, page_class = self.page_classes[index]
+        if getattr(self, attribute) is None:
+            page = page_class(self.tasks, self.app_main)
+            self.catalog_events.changed.connect(page.on_catalog_changed)
+            setattr(self, attribute, page)
+            self.tabs.widget(index).layout().addWidget(page)
+
+    def check_for_changes(self):
+        if self.watch_task not in self.tasks.tasks:
+            self.watch_task = self.tasks.run(None, self.app_main.check_for_changes)
+
+class CatalogEvents(QObject):
+    """Carries AppMain change events from whichever thread noticed them to the pages"""
+    changed = Signal(object)
+
+class StartupTimer(QObject):
+    """Reports import time and time to first paint when DAHLIA_STARTUP_TIMING is set"""
+    def __init__(self, window, exit_after_paint=False):
+        super().__init__(window)
+        self.window = window
+        self.exit_after_paint = exit_after_paint
+        self.window_built = None
+        window.installEventFilter(self)
+
+    def eventFilter(self, watched, event):
+        if watched is self.window and event.type() == QEvent.Paint:
+            self.window.removeEventFilter(self)
+            QTimer.singleShot(0, lambda: self.report(time.perf_counter()))
+        return False
+
+    def report(self, first_paint):
+        print("Startup timing:", file=sys.stderr)
+        print(f"  imports: {(imports_finished - startup_started) * 1000:.1f} ms", file=sys.stderr)
+        if self.window_built is not None:
+            print(f"  window built: {(self.window_built - imports_finished) * 1000:.1f} ms", file=sys.stderr)
+        print(f"  first paint: {(first_paint - startup_started) * 1000:.1f} ms", file=sys.stderr)
+        print(f"  pandas loaded: {'yes' if is_loaded('pandas') else 'no'}", file=sys.stderr)
+        if self.exit_after_paint:
+            QApplication.quit()
+
+class WorkerSignals(QObject):
+    """Signals a Worker uses to report back to the main thread"""
+    finished = Signal(int, object)
+    failed = Signal(int, str)
+
+class Worker(QRunnable):
+    """Runs one AppMain call on the thread pool"""
+    def __init__(self, task_id, fn, *args):
+        super().__init__()
+        self.task_id = task_id
+        self.fn = fn
+        self.args = args
+        self.cancelled = False
+        self.action = AppProfile.current_action()
+        self.signals = WorkerSignals()
+
+    def run(self):
+        try:
+            result = AppProfile.run_task(self.action, self.fn, *self.args)
+        except Exception as e:
+            self.signals.failed.emit(self.task_id, str(e))
+            return
+        self.signals.finished.emit(self.task_id, result)
+
+class BackgroundTasks(QObject):
+    """Runs AppMain I/O off the main thread and hands results back to the pages"""
+    status_changed = Signal(str)
+    busy_changed = Signal(bool)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.pool = QThreadPool.globalInstance()
+        self.tasks = {}
+        self.next_task_id = 0
+
+    def run(self, description, fn, *args, on_finished=None, on_error=None):
+        self.next_task_id += 1
+        worker = Worker(self.next_task_id, fn, *args)
+        worker.signals.finished.connect(self.on_task_finished)
+        worker.signals.failed.connect(self.on_task_failed)
+        self.tasks[worker.task_id] = (worker, description, on_finished, on_error)
+
+        if description is not None:
+            self.status_changed.emit(f"{description}...")
+            self.busy_changed.emit(True)
+        self.pool.start(worker)
+        return worker.task_id
+
+    def cancel(self, task_id):
+        task = self.tasks.get(task_id)
+        if task is not None and not task[0].cancelled:
+            task[0].cancelled = True
+            if task[1] is not None:
+                self.status_changed.emit(f"{task[1]} cancelled.")
+            self.busy_changed.emit(self.is_busy())
+
+    def is_busy(self):
+        return any(not worker.cancelled and description is not None for worker, description, _, _ in self.tasks.values())
+
+    def wait(self):
+        self.pool.waitForDone()
+        QApplication.processEvents()
+
+    def _finish(self, task_id):
+        worker, description, on_finished, on_error = self.tasks.pop(task_id)
+        self.busy_changed.emit(self.is_busy())
+        return worker.cancelled, description, on_finished, on_error
+
+    def on_task_finished(self, task_id, result):
+        cancelled, description, on_finished, _ = self._finish(task_id)
+        if cancelled:
+            return
+
+        if description is not None:
+            self.status_changed.emit(f"{description} done.")
+        if on_finished:
+            on_finished(result)
+
+    def on_task_failed(self, task_id, error):
+        cancelled, description, _, on_error = self._finish(task_id)
+        if cancelled:
+            return
+
+        self.status_changed.emit(f"{description or 'Background task'} failed: {error}")
+        if on_error:
+            on_error(error)
+
+class IngredientsModel(QAbstractTableModel):
+    """Table model over the ingredient catalog columns"""
+    columns = ["Ingredient", "Density (g/ml)", "Store Brand", "Store Price (€)", "Store Amount", "Store Unit"]
+    numeric_columns = ["Density (g/ml)", "Store Price (€)", "Store Amount"]
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.data_columns = {column: [] for column in self.columns}
+        self.loads = 0
+        self.reset_modified()
+
+    @property
+    def modified(self):
+        changes = self.changes()
+        return bool(changes["rows"] or changes["removed"])
+
+    def reset_modified(self):
+        # Takes the table as it is now as the saved state. Every row keeps an id for as long as it is in the table;
+        # rows with no saved name were inserted since
+        names = self.data_columns["Ingredient"]
+        self.row_ids = list(range(len(names)))
+        self.original_names = dict(zip(self.row_ids, names))
+        self.next_row_id = len(names)
+        self.dirty_ids = set()
+        self.loads += 1
+
+    def snapshot(self):
+        # The rows as a save submitted now stores them
+        return self.loads, dict(zip(self.row_ids, zip(*self.data_columns.values())))
+
+    def mark_saved(self, snapshot):
+        # Rows edited, inserted or removed while the save was running stay changed against what it stored; a table
+        # reloaded in the meantime has new row ids and already shows the saved state
+        loads, rows = snapshot
+        if loads != self.loads:
+            return
+        name_column = self.columns.index("Ingredient")
+        self.original_names = {row_id: row[name_column] for row_id, row in rows.items()}
+        self.dirty_ids = {row_id for row_id, row in zip(self.row_ids, zip(*self.data_columns.values()))
+                          if row_id in rows and row != rows[row_id]}
+
+    def load_df(self, df):
+        self.beginResetModel()
+        self.data_columns = {column: self._column_values(df, column) for column in self.columns}
+        self.reset_modified()
+        self.endResetModel()
+
+    def to_dict(self):
+        return {column: list(values) for column, values in self.data_columns.items()}
+
+    def changes(self):
+        rows = []
+        removed = set(self.original_names).difference(self.row_ids)
+        renamed = []
+        for pos, row_id in enumerate(self.row_ids):
+            if row_id not in self.original_names or row_id in self.dirty_ids:
+                rows.append(pos)
+            if (row_id in self.dirty_ids and row_id in self.original_names
+                    and self.data_columns["Ingredient"][pos] != self.original_names[row_id]):
+                renamed.append(self.original_names[row_id])
+        return {"rows": rows, "removed": [self.original_names[row_id] for row_id in sorted(removed)] + renamed}
+
+    def _column_values(self, df, column):
+        if column not in df:
+            return [""] * len(df)
+
+        values = df[column]
+        if values.dtype.kind != "f":
+            return values.astype(object).where(values.notna(), "").tolist()
+
+        # Whole-number columns read as they were written, and float32 by its shortest text, not as widened float64
+        if values.notna().all() and (values % 1 == 0).all():
+            return values.astype("int64").astype(str).tolist()
+        return values.astype(str).where(values.notna(), "").tolist()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.data_columns["Ingredient"])
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.columns)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or role not in (Qt.DisplayRole, Qt.EditRole):
+            return None
+        return str(self.data_columns[self.columns[index.column()]][index.row()])
+
+    def setData(self, index, value, role=Qt.EditRole):
+        if not index.isValid() or role != Qt.EditRole:
+            return False
+        values = self.data_columns[self.columns[index.column()]]
+        if values[index.row()] == value:
+            return True
+        values[index.row()] = value
+        self.dirty_ids.add(self.row_ids[index.row()])
+        self.dataChanged.emit(index, index, [Qt.DisplayRole, Qt.EditRole])
+        return True
+
+    def flags(self, index):
+        return super().flags(index) | Qt.ItemIsEditable
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return self.columns[section]
+        return super().headerData(section, orientation, role)
+
+    def insertRows(self, row, count, parent=QModelIndex(), unit=""):
+        self.beginInsertRows(parent, row, row + count - 1)
+        for column, values in self.data_columns.items():
+            values[row:row] = [unit if column == "Store Unit" else ""] * count
+        self.row_ids[row:row] = range(self.next_row_id, self.next_row_id + count)
+        self.next_row_id += count
+        self.endInsertRows()
+        return True
+
+    def removeRows(self, row, count, parent=QModelIndex()):
+        self.beginRemoveRows(parent, row, row + count - 1)
+        for values in self.data_columns.values():
+            del values[row:row + count]
+        del self.row_ids[row:row + count]
+        self.endRemoveRows()
+        return True
+
+    def validate_numeric_fields(self):
+        invalid = {}
+        for column in self.numeric_columns:
+            text = pd.Series(self.data_columns[column], dtype=object).astype(str).str.strip()
+            invalid[column] = (text != "") & pd.to_numeric(text, errors="coerce").isna()
+        return pd.DataFrame(invalid)
+
+class UnitDelegate(QStyledItemDelegate):
+    """Unit dropdown editor, created only while a cell is being edited"""
+    store_units = ["g", "kg", "ml", "l", "oz", "lb", "pc"]
+    recipe_units = ["g", "kg", "oz", "lb", "ml", "l", "cup", "tsp", "tbsp", "pc"]
+
+    def __init__(self, units, parent=None):
+        super().__init__(parent)
+        self.units = units
+
+    def createEditor(self, parent, option, index):
+        return QComboBox(parent)
+
+    def setEditorData(self, editor, index):
+        current_value = index.data(Qt.EditRole)
+        editor.clear()
+        editor.addItems(self.units)
+        if current_value and current_value not in self.units:
+            editor.addItem(current_value)
+        if current_value:
+            editor.setCurrentText(current_value)
+
+    def setModelData(self, editor, model, index):
+        model.setData(index, editor.currentText(), Qt.EditRole)
+
+class SearchCompleter(QCompleter):
+    """Completer whose popup lists the top matches from an AppMain search index"""
+    def __init__(self, search, limit=20, parent=None):
+        self.matches = QStringListModel()
+        super().__init__(self.matches, parent)
+        self.matches.setParent(self)
+        self.search = search
+        self.limit = limit
+        self.setCaseSensitivity(Qt.CaseInsensitive)
+        self.setCompletionMode(QCompleter.UnfilteredPopupCompletion)
+
+    def attach(self, combo_box):
+        combo_box.setCompleter(self)
+        combo_box.lineEdit().textEdited.connect(self.update_matches)
+
+    def update_matches(self, text):
+        self.matches.setStringList(self.search(text, self.limit) if text.strip() else [])
+        if self.matches.rowCount():
+            self.complete()
+
+class IngredientDelegate(QStyledItemDelegate):
+    """Editable ingredient dropdown sharing one name model and completer across all rows"""
+    def __init__(self, name_model, completer, parent=None):
+        super().__init__(parent)
+        self.name_model = name_model
+        self.completer = completer
+
+    def createEditor(self, parent, option, index):
+        editor = QComboBox(parent)
+        editor.setEditable(True)
+        editor.setInsertPolicy(QComboBox.NoInsert)
+        editor.setModel(self.name_model)
+        self.completer.attach(editor)
+        return editor
+
+    def setEditorData(self, editor, index):
+        editor.setCurrentText(index.data(Qt.EditRole) or "")
+
+    def setModelData(self, editor, model, index):
+        model.setData(index, editor.currentText(), Qt.EditRole)
+
 class IngredientsPage(QWidget):
     """App page for Ingredients Management"""
-    def __init__(self):
+    def __init__(self, tasks=None, app_main=None):
         super().__init__()
-        self.app_main = AppMain()
+        self.app_main = app_main if app_main is not None else AppMain()
+        self.tasks = tasks if tasks is not None else BackgroundTasks(self)
+        self.save_btn = QPushButton("Save Ingredients Page")
+        self.import_btn = QPushButton("Import Price List")
 
-        self.table = QTableWidget()
+        self.model = IngredientsModel(self)
+        self.table = QTableView()
+        self.table.setModel(self.model)
+        self.unit_delegate = UnitDelegate(UnitDelegate.store_units, self.table)
+        self.table.setItemDelegateForColumn(5, self.unit_delegate)
 
         self.init_ui()
         self.load_data()
@@ -45,11 +422,6 @@ class IngredientsPage(QWidget):
         description = QLabel("This is where you edit your ingredients database")
         layout.addWidget(description)
 
-        self.table.setColumnCount(6)
-        self.table.setHorizontalHeaderLabels([
-            "Ingredient", "Density (g/ml)", "Store Brand", "Store Price (€)", "Store Amount", "Store Unit"
-        ])
-
         self.table.setColumnWidth(0, 180)  # Ingredient - wider for names
         self.table.setColumnWidth(1, 110)  # Density
         self.table.setColumnWidth(2, 150)  # Store Brand
@@ -57,7 +429,7 @@ class IngredientsPage(QWidget):
         self.table.setColumnWidth(4, 110)  # Store Amount
         self.table.setColumnWidth(5, 80)  # Store Unit
 
-        self.table.setRowCount(1)
+        self.table.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)
 
         layout.addWidget(self.table, stretch=1)
 
@@ -71,56 +443,57 @@ class IngredientsPage(QWidget):
         remove_row_btn.setStyleSheet("background-color: lightpink;")
         remove_row_btn.clicked.connect(self.remove_row)
 
-        save_btn = QPushButton("Save Ingredients Page")
-        save_btn.setStyleSheet("background-color: lightgreen;")
-        save_btn.clicked.connect(self.save_page)
+        self.save_btn.setStyleSheet("background-color: lightgreen;")
+        self.save_btn.clicked.connect(self.save_page)
+
+        self.import_btn.setStyleSheet("background-color: khaki;")
+        self.import_btn.clicked.connect(self.import_price_list)
 
         button_layout.addWidget(add_row_btn)
         button_layout.addWidget(remove_row_btn)
-        button_layout.addWidget(save_btn)
+        button_layout.addWidget(self.save_btn)
         button_layout.addStretch()
+        button_layout.addWidget(self.import_btn)
 
         layout.addLayout(button_layout)
 
         self.setLayout(layout)
 
     def load_data(self):
-        df = self.app_main.get_ingredients_df()
+        self.tasks.run("Loading ingredients", self.app_main.get_ingredients_df,
+                       on_finished=self.on_data_loaded, on_error=self.on_load_error)
 
+    def on_data_loaded(self, df):
         if df is None or df.empty:
+            self.model.insertRows(0, 1)
             return
 
-        self.table.setRowCount(len(df))
+        self.model.load_df(df)
 
-        for row_idx, row in df.iterrows():
-            for col_idx, column_name in enumerate(df.columns):
-                if col_idx == 5:
-                    self.add_unit_dropdown(row_idx, str(row[column_name])) if pd.notna(row[column_name]) else ""
-                else:
-                    value = str(row[column_name]) if pd.notna(row[column_name]) else ""
-                    item = QTableWidgetItem(value)
-                    self.table.setItem(row_idx, col_idx, item)
+    def on_load_error(self, error):
+        QMessageBox.critical(self, "Load Error", f"Failed to load ingredients: {error}.")
 
-    def add_unit_dropdown(self, row, current_value=""):
-        combo = QComboBox()
-        units = ["g", "kg", "ml", "l", "oz", "lb", "pc"]
-        combo.addItems(units)
+    def on_catalog_changed(self, change):
+        if change["source"] != "external" or not change["catalog"]:
+            return
 
-        if current_value in units:
-            combo.setCurrentText(current_value)
-        elif current_value:
-            combo.addItem(current_value)
-            combo.setCurrentText(current_value)
+        if self.model.modified:
+            reply = QMessageBox.question(
+                self, "Ingredients Changed",
+                "The ingredients file was changed outside the app.\n\nReload it and discard your unsaved edits?",
+                QMessageBox.Yes | QMessageBox.No, QMessageBox.No
+            )
+            if reply != QMessageBox.Yes:
+                return
 
-        self.table.setCellWidget(row, 5, combo)
+        self.load_data()
 
     def add_row(self):
-        row_position = self.table.rowCount()
-        self.table.insertRow(row_position)
-        self.add_unit_dropdown(row_position)
+        row_position = self.model.rowCount()
+        self.model.insertRows(row_position, 1, unit=UnitDelegate.store_units[0])
 
     def remove_row(self):
-        current_row = self.table.currentRow()
+        current_row = self.table.currentIndex().row()
 
         reply = QMessageBox.question(
             self, "Confirm Row Removal",
@@ -129,7 +502,7 @@ class IngredientsPage(QWidget):
         )
 
         if reply == QMessageBox.Yes and current_row >= 0:
-            self.table.removeRow(current_row)
+            self.model.removeRows(current_row, 1)
 
     def save_page(self):
         validation_errors = self.validate_numeric_fields()
@@ -139,70 +512,117 @@ class IngredientsPage(QWidget):
             QMessageBox.warning(self, "Validation Error", error_message)
             return
 
-        data = {}
-        headers = []
+        self.save_btn.setEnabled(False)
+        snapshot = self.model.snapshot()
+        self.tasks.run("Saving ingredients", self.app_main.update_ingredients_file, self.model.to_dict(),
+                       self.model.changes(), on_error=self.on_save_error,
+                       on_finished=lambda price_impact: self.on_page_saved(price_impact, snapshot))
+
+    def on_page_saved(self, price_impact, snapshot):
+        self.save_btn.setEnabled(True)
+        self.model.mark_saved(snapshot)
+
+        QMessageBox.information(self, "Success", "Ingredients saved successfully!" + self.price_impact_text(price_impact))
+
+    def on_save_error(self, error):
+        self.save_btn.setEnabled(True)
+        QMessageBox.critical(self, "Save Error", f"Failed to save ingredients: {error}.")
+
+    def price_impact_text(self, price_impact):
+        if not price_impact:
+            return ""
+
+        changes = [
+            f"{row['Product']}: €{row['Old Cost (€)']:.2f} → €{row['New Cost (€)']:.2f}" for row in price_impact[:10]
+        ]
+        if len(price_impact) > 10:
+            changes.append(f"...and {len(price_impact) - 10} more.")
+        return f"\n\nProduct costs changed for {len(price_impact)} product(s):\n" + "\n".join(changes)
+
+    def import_price_list(self):
+        if self.model.modified:
+            reply = QMessageBox.question(
+                self, "Unsaved Changes",
+                "Importing a price list reloads the ingredients.\n\nDiscard your unsaved edits?",
+                QMessageBox.Yes | QMessageBox.No, QMessageBox.No
+            )
+            if reply != QMessageBox.Yes:
+                return
 
-        for col in range(self.table.columnCount()):
-            header = self.table.horizontalHeaderItem(col).text()
-            headers.append(header)
-            data[header] = []
+        file_path, _ = QFileDialog.getOpenFileName(self, "Import Price List", "", "CSV files (*.csv)")
+        if not file_path:
+            return
 
-        for row in range(self.table.rowCount()):
-            for col in range(self.table.columnCount()):
-                if col == 5:
-                    widget = self.table.cellWidget(row, col)
-                    value = widget.currentText() if widget else ""
-                else:
-                    item = self.table.item(row, col)
-                    value = item.text() if item else ""
-                data[headers[col]].append(value)
+        rejects_path = f"{os.path.splitext(file_path)[0]}_rejects.csv"
+        self.import_btn.setEnabled(False)
+        self.tasks.run("Importing price list", self.app_main.import_price_list, file_path, rejects_path,
+                       on_finished=lambda summary: self.on_price_list_imported(summary, rejects_path),
+                       on_error=self.on_import_error)
+
+    def on_price_list_imported(self, summary, rejects_path):
+        self.import_btn.setEnabled(True)
+        self.load_data()
 
-        self.app_main.update_ingredients_file(data)
+        message = (f"Read {summary['rows']} lines: {summary['updated']} updated, {summary['unchanged']} unchanged, "
+                   f"{summary['added']} added, {summary['offers']} store offers added or updated, "
+                   f"{summary['rejected']} rejected.")
+        if summary["rejected"]:
+            message += f"\n\nRejected lines were written to {rejects_path}."
+        QMessageBox.information(self, "Price List Imported", message + self.price_impact_text(summary["price_impact"]))
 
-        QMessageBox.information(self, "Success", "Ingredients saved successfully!")
+    def on_import_error(self, error):
+        self.import_btn.setEnabled(True)
+        QMessageBox.critical(self, "Import Error", f"Failed to import price list: {error}.")
 
     def validate_numeric_fields(self):
-        errors = []
+        invalid = self.model.validate_numeric_fields()
+        labels = {
+            "Density (g/ml)": "Density",
+            "Store Price (€)": "Store Price",
+            "Store Amount": "Store Amount"
+        }
 
-        for row in range(self.table.rowCount()):
-            row_num = row + 1
-
-            density_item = self.table.item(row, 1)
-            if density_item and density_item.text().strip():
-                try:
-                    float(density_item.text().strip())
-                except ValueError:
-                    errors.append(f"Row {row_num}: Density must be a valid number.")
-
-            price_item = self.table.item(row, 3)
-            if price_item and price_item.text().strip():
-                try:
-                    float(price_item.text().strip())
-                except ValueError:
-                    errors.append(f"Row {row_num}: Store Price must be a valid number.")
-
-            amount_item = self.table.item(row, 4)
-            if amount_item and amount_item.text().strip():
-                try:
-                    float(amount_item.text().strip())
-                except ValueError:
-                    errors.append(f"Row {row_num}: Store Amount must be a valid number.")
+        errors = []
+        for row in invalid.index[invalid.any(axis=1)]:
+            for column, label in labels.items():
+                if invalid.at[row, column]:
+                    errors.append(f"Row {row + 1}: {label} must be a valid number.")
 
         return errors
 
 class ProductsPage(QWidget):
     """App page for Products Management"""
-    def __init__(self):
+    def __init__(self, tasks=None, app_main=None):
         super().__init__()
-        self.app_main = AppMain()
+        self.app_main = app_main if app_main is not None else AppMain()
+        self.tasks = tasks if tasks is not None else BackgroundTasks(self)
+        self.load_task = None
+        self.load_task_product = None
+        self.loaded_product = None
 
         self.product_name_dropdown = QComboBox()
         self.pieces_made_input = QLineEdit()
         self.multiplier_dropdown = QComboBox()
         self.product_cost_output = QLabel("0.00")
         self.product_price_output = QLabel("0.00")
+        self.offer_dropdown = QComboBox()
         self.table = QTableWidget()
 
+        self.ingredient_names = QStringListModel(self)
+        self.ingredient_names_version = None
+        self.ingredient_completer = SearchCompleter(self.search_components, parent=self)
+        self.product_completer = SearchCompleter(self.app_main.search_products, parent=self)
+        self.refresh_ingredient_names()
+
+        self.dirty_rows = set()
+        self.cost_task = None
+        self.cost_task_rows = []
+        self.total_cost = 0.0
+        self.recalculate_timer = QTimer(self)
+        self.recalculate_timer.setSingleShot(True)
+        self.recalculate_timer.setInterval(0)
+        self.recalculate_timer.timeout.connect(self.calculate_row_cost)
+
         self.init_ui()
 
     def init_ui(self):
@@ -218,9 +638,9 @@ class ProductsPage(QWidget):
         parameters_layout = QGridLayout()
 
         product_name_label = QLabel("Product Name:")
-        self.product_name_dropdown.addItems(self.app_main.get_products_list())
         self.product_name_dropdown.setEditable(True)
-        self.product_name_dropdown.completer().setCompletionMode(QCompleter.UnfilteredPopupCompletion)
+        self.product_name_dropdown.currentTextChanged.connect(self.cancel_stale_load)
+        self.product_completer.attach(self.product_name_dropdown)
         self.product_name_dropdown.setMinimumWidth(200)
         self.product_name_dropdown.setMaximumWidth(300)
         parameters_layout.addWidget(product_name_label, 0, 0)
@@ -257,9 +677,19 @@ class ProductsPage(QWidget):
         parameters_layout.setColumnMinimumWidth(1, 120)  # Pieces Made
         parameters_layout.setColumnMinimumWidth(2, 100)  # Multiplier
         parameters_layout.setColumnMinimumWidth(3, 150)  # Production Cost
+        offer_label = QLabel("Offer:")
+        self.offer_dropdown.setToolTip("Price the ingredients from their catalog offer, their cheapest offer, "
+                                       "or one store's offers where it has them")
+        self.offer_dropdown.setMinimumWidth(150)
+        self.refresh_offers()
+        self.offer_dropdown.currentIndexChanged.connect(self.on_offer_changed)
+        parameters_layout.addWidget(offer_label, 0, 5)
+        parameters_layout.addWidget(self.offer_dropdown, 1, 5)
+
         parameters_layout.setColumnMinimumWidth(4, 150)  # Product Price
+        parameters_layout.setColumnMinimumWidth(5, 170)  # Offer
 
-        parameters_layout.setColumnStretch(5, 1)
+        parameters_layout.setColumnStretch(6, 1)
 
         layout.addLayout(parameters_layout)
 
@@ -294,7 +724,11 @@ class ProductsPage(QWidget):
         self.table.setColumnWidth(2, 100)  # Amount Unit
         self.table.setColumnWidth(3, 180)  # Ingredient Cost
 
-        self.table.itemChanged.connect(self.calculate_row_cost)
+        self.table.setItemDelegateForColumn(0, IngredientDelegate(self.ingredient_names, self.ingredient_completer, self.table))
+        self.table.setItemDelegateForColumn(2, UnitDelegate(UnitDelegate.recipe_units, self.table))
+        self.table.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)
+
+        self.table.itemChanged.connect(self.on_item_changed)
 
         self.add_row()
 
@@ -320,6 +754,22 @@ class ProductsPage(QWidget):
 
         self.setLayout(layout)
 
+        self.tasks.run("Loading product list", self.app_main.get_products_list, on_finished=self.on_products_listed)
+
+    def on_products_listed(self, product_list):
+        current_text = self.product_name_dropdown.currentText()
+        self.product_name_dropdown.blockSignals(True)
+        self.product_name_dropdown.clear()
+        self.product_name_dropdown.addItems(product_list)
+        self.product_name_dropdown.setCurrentText(current_text or self.product_name_dropdown.itemText(0))
+        self.product_name_dropdown.blockSignals(False)
+        self.tasks.run(None, self.app_main.get_product_index)
+
+    def cancel_stale_load(self, product_name):
+        if self.load_task is not None and product_name != self.load_task_product:
+            self.tasks.cancel(self.load_task)
+            self.load_task = None
+
     def load_product_info(self):
         product_name = self.product_name_dropdown.currentText()
 
@@ -327,13 +777,28 @@ class ProductsPage(QWidget):
             QMessageBox.warning(self, "No Product Selected", "Please select a \"Product Name\" first")
             return
 
-        product_data_dict = self.app_main.get_product_data(product_name)
+        if self.load_task is not None:
+            self.tasks.cancel(self.load_task)
+        self.load_task_product = product_name
+        self.load_task = self.tasks.run(
+            f"Loading {product_name}", self.app_main.get_product_data, product_name,
+            on_finished=lambda product_data_dict: self.on_product_loaded(product_name, product_data_dict),
+            on_error=self.on_product_load_error
+        )
+
+    def on_product_load_error(self, error):
+        self.load_task = None
+        QMessageBox.critical(self, "Load Error", f"Failed to load product: {error}.")
+
+    def on_product_loaded(self, product_name, product_data_dict):
+        self.load_task = None
 
         if product_data_dict is None:
             QMessageBox.warning(self, "Product Not Found", f"No data found for product: {product_name}.")
             return
 
-        self.table.setRowCount(0)
+        self.clear_table()
+        self.loaded_product = product_name
 
         self.pieces_made_input.setText(str(product_data_dict["pieces_made"]))
 
@@ -347,24 +812,24 @@ class ProductsPage(QWidget):
 
         ingredients_df = product_data_dict["ingredients"]
 
+        self.refresh_ingredient_names()
+        self.table.blockSignals(True)
         for i, row in ingredients_df.iterrows():
             self.add_row()
 
             current_row = self.table.rowCount() - 1
-
-            ingredient_widget = self.table.cellWidget(current_row, 0)
-            if ingredient_widget:
-                ingredient_widget.setCurrentText(row["Ingredient"])
-
-            amount_item = self.table.item(current_row, 1)
-            if amount_item:
-                amount_item.setText(str(row["Amount Used"]))
-
-            unit_widget = self.table.cellWidget(current_row, 2)
-            if unit_widget:
-                unit_widget.setCurrentText(row["Amount Unit"])
-
-        self.calculate_row_cost()
+            self.table.item(current_row, 0).setText(row["Ingredient"])
+            self.table.item(current_row, 1).setText(str(row["Amount Used"]))
+            self.table.item(current_row, 2).setText(row["Amount Unit"])
+        self.table.blockSignals(False)
+
+        # The loaded costs are for the catalog offers; any other offer is costed afresh
+        if self.offer_dropdown.currentData() is None:
+            self.set_row_costs(range(self.table.rowCount()), product_data_dict["costs"], product_data_dict["status"])
+            self.calculate_totals()
+        else:
+            self.dirty_rows.update(range(self.table.rowCount()))
+            self.calculate_row_cost()
 
         QMessageBox.information(self, "Success", f"Loaded product: {product_name}.")
 
@@ -395,15 +860,15 @@ class ProductsPage(QWidget):
 
         ingredients_data = []
         for row in range(self.table.rowCount()):
-            ingredient_widget = self.table.cellWidget(row, 0)
+            ingredient_item = self.table.item(row, 0)
             amount_item = self.table.item(row, 1)
-            unit_widget = self.table.cellWidget(row, 2)
-            if not ingredient_widget or not amount_item or not unit_widget:
+            unit_item = self.table.item(row, 2)
+            if not ingredient_item or not amount_item or not unit_item:
                 continue
 
-            ingredient_name = ingredient_widget.currentText().strip()
+            ingredient_name = ingredient_item.text().strip()
             amount_text = amount_item.text().strip()
-            unit = unit_widget.currentText()
+            unit = unit_item.text()
             if not ingredient_name or not amount_text:
                 continue
 
@@ -429,15 +894,18 @@ class ProductsPage(QWidget):
             "ingredients": ingredients_data
         }
 
-        try:
-            self.app_main.save_product_data(product_data)
+        self.tasks.run(
+            f"Saving {product_name}", self.app_main.save_product_data, product_data,
+            on_finished=lambda result: self.on_product_saved(product_name),
+            on_error=lambda error: QMessageBox.critical(self, "Save Error", f"Failed to save product: {error}.")
+        )
 
-            if self.product_name_dropdown.findText(product_name) == -1:
-                self.product_name_dropdown.addItem(product_name)
+    def on_product_saved(self, product_name):
+        if self.product_name_dropdown.findText(product_name) == -1:
+            self.product_name_dropdown.addItem(product_name)
+        self.tasks.run(None, self.app_main.get_product_index)
 
-            QMessageBox.information(self, "Success", f"Product \"{product_name}\" saved successfully.")
-        except Exception as e:
-            QMessageBox.critical(self, "Save Error", f"Failed to save product: {str(e)}.")
+        QMessageBox.information(self, "Success", f"Product \"{product_name}\" saved successfully.")
 
     def delete_product_info(self):
         product_name = self.product_name_dropdown.currentText().strip()
@@ -445,7 +913,13 @@ class ProductsPage(QWidget):
             QMessageBox.warning(self, "No Product Selected", "Please select a \"Product Name\" first.")
             return
 
-        product_data = self.app_main.get_product_data(product_name)
+        self.tasks.run(
+            f"Checking {product_name}", self.app_main.get_product_data, product_name,
+            on_finished=lambda product_data: self.confirm_delete(product_name, product_data),
+            on_error=lambda error: QMessageBox.critical(self, "Delete Error", f"Failed to delete product: {error}.")
+        )
+
+    def confirm_delete(self, product_name, product_data):
         if product_data is None:
             QMessageBox.warning(self, "Product Not Found", f"Product: {product_name} does not exist.")
             return
@@ -459,89 +933,197 @@ class ProductsPage(QWidget):
         )
 
         if reply == QMessageBox.Yes:
-            try:
-                self.app_main.delete_product_data(product_name)
-
-                self.pieces_made_input.clear()
-                self.multiplier_dropdown.setCurrentIndex(5)
-                self.table.setRowCount(0)
-                self.add_row()
-                self.product_cost_output.setText("0.00")
-                self.product_price_output.setText("0.00")
+            self.tasks.run(
+                f"Deleting {product_name}", self.app_main.delete_product_data, product_name,
+                on_finished=lambda result: self.on_product_deleted(product_name),
+                on_error=lambda error: QMessageBox.critical(self, "Delete Error", f"Failed to delete product: {error}.")
+            )
+
+    def on_product_deleted(self, product_name):
+        self.loaded_product = None
+        self.pieces_made_input.clear()
+        self.multiplier_dropdown.setCurrentIndex(5)
+        self.clear_table()
+        self.add_row()
+        self.product_cost_output.setText("0.00")
+        self.product_price_output.setText("0.00")
 
-                index = self.product_name_dropdown.findText(product_name)
-                if index >= 0:
-                    self.product_name_dropdown.removeItem(index)
+        index = self.product_name_dropdown.findText(product_name)
+        if index >= 0:
+            self.product_name_dropdown.removeItem(index)
+        self.tasks.run(None, self.app_main.get_product_index)
+
+        QMessageBox.information(self, "Success", f"Product \"{product_name}\" deleted successfully.")
+
+    def on_catalog_changed(self, change):
+        if change["catalog"]:
+            self.refresh_ingredient_names()
+            self.refresh_offers()
+        if change["catalog"] or change["products"] or change["recipes"]:
+            # Sub-recipe lines (names not in the catalog) may change with any ingredient or product below them
+            changed = set(change["ingredients"])
+            ingredients = set(self.ingredient_names.stringList())
+            for row in range(self.table.rowCount()):
+                ingredient_item = self.table.item(row, 0)
+                if ingredient_item and (ingredient_item.text() in changed or ingredient_item.text() not in ingredients):
+                    self.mark_row_dirty(row)
+
+        if change["source"] != "external":
+            return
 
-                QMessageBox.information(self, "Success", f"Product \"{product_name}\" deleted successfully.")
-            except Exception as e:
-                QMessageBox.critical(self, "Delete Error", f"Failed to delete product: {str(e)}.")
+        if change["products"]:
+            self.tasks.run("Loading product list", self.app_main.get_products_list, on_finished=self.on_products_listed)
+        if self.loaded_product in change["recipes"]:
+            self.tasks.status_changed.emit(
+                f"\"{self.loaded_product}\" was changed outside the app. Load it again to see the changes."
+            )
+
+    def search_components(self, text, limit):
+        matches = self.app_main.search_ingredients(text, limit)
+        if len(matches) < limit:
+            matches += [name for name in self.app_main.search_products(text, limit - len(matches)) if name not in matches]
+        return matches
+
+    def refresh_offers(self):
+        # A catalog that can't be read leaves only the catalog and cheapest choices
+        self.tasks.run(None, self.app_main.get_offer_brands, on_finished=self.on_offer_brands_loaded,
+                       on_error=lambda error: self.on_offer_brands_loaded([]))
+
+    def on_offer_brands_loaded(self, brands):
+        offer = self.offer_dropdown.currentData()
+        self.offer_dropdown.blockSignals(True)
+        self.offer_dropdown.clear()
+        self.offer_dropdown.addItem("Catalog", None)
+        self.offer_dropdown.addItem("Cheapest", "cheapest")
+        for brand in brands:
+            self.offer_dropdown.addItem(brand, brand)
+        self.offer_dropdown.setCurrentIndex(max(self.offer_dropdown.findData(offer), 0))
+        self.offer_dropdown.blockSignals(False)
+
+        if self.offer_dropdown.currentData() != offer:
+            self.on_offer_changed()
+
+    def on_offer_changed(self):
+        for row in range(self.table.rowCount()):
+            self.mark_row_dirty(row)
+
+    def refresh_ingredient_names(self):
+        self.tasks.run(None, self.load_ingredient_names, self.ingredient_names_version,
+                       on_finished=self.on_ingredient_names_loaded)
+
+    def load_ingredient_names(self, known_version):
+        # Runs on the worker; the names are only listed again, and the search index built, for a new catalog version
+        catalog_version = self.app_main.get_catalog_version()
+        if catalog_version == known_version:
+            return None
+        ingredient_list = self.app_main.get_ingredient_list()
+        self.app_main.get_ingredient_index()
+        return catalog_version, ingredient_list
+
+    def on_ingredient_names_loaded(self, result):
+        if result is not None and result[0] != self.ingredient_names_version:
+            self.ingredient_names_version, ingredient_list = result
+            self.ingredient_names.setStringList(ingredient_list)
 
     def add_row(self):
         row_position = self.table.rowCount()
         self.table.insertRow(row_position)
 
-        ingredient_dropdown = QComboBox()
-        ingredient_dropdown.addItems(self.app_main.get_ingredient_list())
-        ingredient_dropdown.setEditable(True)
-        ingredient_dropdown.completer().setCompletionMode(QCompleter.UnfilteredPopupCompletion)
-        ingredient_dropdown.currentTextChanged.connect(self.calculate_row_cost)
-        self.table.setCellWidget(row_position, 0, ingredient_dropdown)
+        default_ingredient = self.ingredient_names.index(0).data() if self.ingredient_names.rowCount() else ""
+        ingredient_item = QTableWidgetItem(default_ingredient)
+        self.table.setItem(row_position, 0, ingredient_item)
 
         amount_item = QTableWidgetItem("0.00")
         self.table.setItem(row_position, 1, amount_item)
 
-        unit_dropdown = QComboBox()
-        unit_dropdown.addItems(["g", "kg", "oz", "lb", "ml", "l", "cup", "tsp", "tbsp", "pc"])
-        unit_dropdown.currentTextChanged.connect(self.calculate_row_cost)
-        self.table.setCellWidget(row_position, 2, unit_dropdown)
+        unit_item = QTableWidgetItem(UnitDelegate.recipe_units[0])
+        self.table.setItem(row_position, 2, unit_item)
 
         cost_item = QTableWidgetItem("0.00")
+        cost_item.setData(Qt.UserRole, 0.0)
         cost_item.setFlags(cost_item.flags() & ~Qt.ItemIsEditable)
         cost_item.setBackground(Qt.lightGray)
         self.table.setItem(row_position, 3, cost_item)
 
+    def clear_table(self):
+        self.cancel_row_costs()
+        self.table.setRowCount(0)
+        self.dirty_rows.clear()
+        self.total_cost = 0.0
+
+    def on_item_changed(self, item):
+        if item.column() != 3:
+            self.mark_row_dirty(item.row())
+
+    def mark_row_dirty(self, row):
+        self.dirty_rows.add(row)
+        self.recalculate_timer.start()
+
+    def cancel_row_costs(self):
+        # Rows still being costed are costed again with the next batch
+        if self.cost_task is not None:
+            self.tasks.cancel(self.cost_task)
+            self.dirty_rows.update(self.cost_task_rows)
+            self.cost_task = None
+
     def calculate_row_cost(self):
-        for row in range(self.table.rowCount()):
-            ingredient_widget = self.table.cellWidget(row, 0)
-            if not ingredient_widget:
-                continue
-            ingredient_name = ingredient_widget.currentText()
+        self.recalculate_timer.stop()
+        self.cancel_row_costs()
 
-            amount_item = self.table.item(row, 1)
-            if not amount_item or not amount_item.text().strip():
-                continue
-            try:
-                amount_used = float(amount_item.text().strip())
-            except ValueError:
-                continue
+        rows = []
+        recipe_lines = {"Ingredient": [], "Amount Used": [], "Amount Unit": []}
 
-            unit_widget = self.table.cellWidget(row, 2)
-            if not unit_widget:
+        for row in sorted(self.dirty_rows):
+            if row >= self.table.rowCount():
+                continue
+            ingredient_item = self.table.item(row, 0)
+            amount_item = self.table.item(row, 1)
+            unit_item = self.table.item(row, 2)
+            if not ingredient_item or not unit_item or not amount_item or not amount_item.text().strip():
                 continue
-            unit = unit_widget.currentText()
 
-            cost_per_unit = self.app_main.get_ingredient_cost(ingredient_name, unit)
+            rows.append(row)
+            recipe_lines["Ingredient"].append(ingredient_item.text())
+            recipe_lines["Amount Used"].append(amount_item.text().strip())
+            recipe_lines["Amount Unit"].append(unit_item.text())
+        self.dirty_rows.clear()
 
-            if cost_per_unit is not None:
-                ingredient_cost = amount_used * cost_per_unit
+        if not rows:
+            self.calculate_totals()
+            return
 
-                cost_item = self.table.item(row, 3)
-                if cost_item:
-                    cost_item.setText(f"{ingredient_cost:.4f}")
+        self.cost_task_rows = rows
+        self.cost_task = self.tasks.run(
+            None, self.app_main.cost_recipe, pd.DataFrame(recipe_lines), self.offer_dropdown.currentData(),
+            on_finished=lambda result: self.on_row_costs(rows, result), on_error=self.on_row_cost_error
+        )
 
+    def on_row_costs(self, rows, result):
+        self.cost_task = None
+        self.set_row_costs(rows, result["costs"], result["status"])
         self.calculate_totals()
 
-    def calculate_totals(self):
-        total_cost = 0.0
+    def on_row_cost_error(self, error):
+        # The pinned store left the offers before the watcher reported it; refreshing falls back to the catalog offers
+        # and costs every row again
+        self.cost_task = None
+        self.refresh_offers()
 
-        for row in range(self.table.rowCount()):
+    def set_row_costs(self, rows, costs, statuses):
+        self.table.blockSignals(True)
+        for row, ingredient_cost, status in zip(rows, costs, statuses):
             cost_item = self.table.item(row, 3)
-            if cost_item and cost_item.text():
-                try:
-                    total_cost += float(cost_item.text())
-                except ValueError:
-                    continue
+            if status != "ok" or not cost_item:
+                continue
+
+            self.total_cost += ingredient_cost - (cost_item.data(Qt.UserRole) or 0.0)
+            cost_item.setData(Qt.UserRole, float(ingredient_cost))
+            cost_item.setText(f"{ingredient_cost:.4f}")
+        self.table.blockSignals(False)
+        self.table.viewport().update()
+
+    def calculate_totals(self):
+        total_cost = self.total_cost
 
         pieces_text = self.pieces_made_input.text().strip()
         pieces_made = 1.0
@@ -576,14 +1158,191 @@ class ProductsPage(QWidget):
         )
 
         if reply == QMessageBox.Yes and current_row >= 0:
+            self.cancel_row_costs()
+            cost_item = self.table.item(current_row, 3)
+            if cost_item:
+                self.total_cost -= cost_item.data(Qt.UserRole) or 0.0
             self.table.removeRow(current_row)
+            self.dirty_rows = {row - (row > current_row) for row in self.dirty_rows if row != current_row}
+            if self.dirty_rows:
+                self.recalculate_timer.start()
             self.calculate_totals()
 
+class PlanningPage(QWidget):
+    """App page for turning an order book into a shopping list"""
+    def __init__(self, tasks=None, app_main=None):
+        super().__init__()
+        self.app_main = app_main if app_main is not None else AppMain()
+        self.tasks = tasks if tasks is not None else BackgroundTasks(self)
+        self.plan_btn = QPushButton("Plan Production")
+        self.ingredient_cost_output = QLabel("0.00")
+        self.shopping_cost_output = QLabel("0.00")
+        self.orders_table = QTableWidget()
+        self.plan_table = QTableWidget()
+
+        self.product_names = QStringListModel(self)
+        self.product_completer = SearchCompleter(self.app_main.search_products, parent=self)
+
+        self.init_ui()
+
+    def init_ui(self):
+        layout = QVBoxLayout()
+
+        title = QLabel("Production Planning")
+        title.setStyleSheet("font-size: 20px; font-weight: bold;")
+        layout.addWidget(title)
+
+        description = QLabel("This is where you turn your orders into a shopping list")
+        layout.addWidget(description)
+
+        self.orders_table.setColumnCount(2)
+        self.orders_table.setHorizontalHeaderLabels(["Product", "Quantity"])
+        self.orders_table.setColumnWidth(0, 300)  # Product - wider for names
+        self.orders_table.setColumnWidth(1, 120)  # Quantity
+        self.orders_table.setItemDelegateForColumn(0, IngredientDelegate(self.product_names, self.product_completer,
+                                                                         self.orders_table))
+        self.orders_table.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)
+        layout.addWidget(self.orders_table, stretch=1)
+
+        button_layout = QHBoxLayout()
+
+        add_row_btn = QPushButton("Add Row")
+        add_row_btn.setStyleSheet("background-color: lightskyblue;")
+        add_row_btn.clicked.connect(self.add_row)
+
+        remove_row_btn = QPushButton("Remove Selected Row")
+        remove_row_btn.setStyleSheet("background-color: lightpink;")
+        remove_row_btn.clicked.connect(self.remove_row)
+
+        self.plan_btn.setStyleSheet("background-color: lightgreen;")
+        self.plan_btn.clicked.connect(self.plan_production)
+
+        button_layout.addWidget(add_row_btn)
+        button_layout.addWidget(remove_row_btn)
+        button_layout.addWidget(self.plan_btn)
+        button_layout.addStretch()
+
+        layout.addLayout(button_layout)
+
+        totals_layout = QGridLayout()
+
+        ingredient_cost_label = QLabel("Ingredient Cost (€):")
+        self.ingredient_cost_output.setStyleSheet("font-size: 18px;")
+        totals_layout.addWidget(ingredient_cost_label, 0, 0)
+        totals_layout.addWidget(self.ingredient_cost_output, 1, 0)
+
+        shopping_cost_label = QLabel("Shopping Cost (€):")
+        self.shopping_cost_output.setStyleSheet("font-size: 18px; font-weight: bold;")
+        totals_layout.addWidget(shopping_cost_label, 0, 1)
+        totals_layout.addWidget(self.shopping_cost_output, 1, 1)
+
+        totals_layout.setColumnMinimumWidth(0, 150)  # Ingredient Cost
+        totals_layout.setColumnMinimumWidth(1, 150)  # Shopping Cost
+        totals_layout.setColumnStretch(2, 1)
+
+        layout.addLayout(totals_layout)
+
+        self.plan_table.setColumnCount(len(PLAN_COLUMNS))
+        self.plan_table.setHorizontalHeaderLabels(PLAN_COLUMNS)
+        self.plan_table.setColumnWidth(0, 180)  # Ingredient - wider for names
+        self.plan_table.setEditTriggers(QTableWidget.NoEditTriggers)
+        self.plan_table.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)
+        layout.addWidget(self.plan_table, stretch=2)
+
+        self.setLayout(layout)
+
+        self.add_row()
+        self.tasks.run("Loading product list", self.app_main.get_products_list, on_finished=self.on_products_listed)
+
+    def on_products_listed(self, product_list):
+        self.product_names.setStringList(product_list)
+
+    def on_catalog_changed(self, change):
+        if change["products"]:
+            self.tasks.run("Loading product list", self.app_main.get_products_list, on_finished=self.on_products_listed)
+
+    def add_row(self):
+        row_position = self.orders_table.rowCount()
+        self.orders_table.insertRow(row_position)
+        self.orders_table.setItem(row_position, 0, QTableWidgetItem(""))
+        self.orders_table.setItem(row_position, 1, QTableWidgetItem("1"))
+
+    def remove_row(self):
+        current_row = self.orders_table.currentRow()
+        if current_row >= 0:
+            self.orders_table.removeRow(current_row)
+
+    def plan_production(self):
+        orders = []
+        for row in range(self.orders_table.rowCount()):
+            product_item = self.orders_table.item(row, 0)
+            quantity_item = self.orders_table.item(row, 1)
+            if not product_item or not quantity_item or not product_item.text().strip():
+                continue
+
+            try:
+                quantity = float(quantity_item.text().strip())
+            except ValueError:
+                QMessageBox.warning(self, "Invalid Quantity", f"Row: {row + 1}: \"Quantity\" must be a valid number.")
+                return
+            orders.append((product_item.text().strip(), quantity))
+
+        if not orders:
+            QMessageBox.warning(self, "No Orders", "Please add at least one product to plan.")
+            return
+
+        self.plan_btn.setEnabled(False)
+        self.tasks.run("Planning production", self.app_main.plan_production, orders,
+                       on_finished=self.on_plan_ready, on_error=self.on_plan_error)
+
+    def on_plan_ready(self, plan):
+        self.plan_btn.setEnabled(True)
+
+        shopping_list = plan["shopping_list"]
+        self.plan_table.setRowCount(len(shopping_list))
+        for row, values in enumerate(shopping_list.itertuples(index=False)):
+            for column, value in enumerate(values):
+                if pd.isna(value):
+                    text = ""
+                elif PLAN_COLUMNS[column] == "Packs":
+                    text = str(int(value))
+                elif isinstance(value, float):
+                    text = f"{value:.2f}"
+                else:
+                    text = str(value)
+                self.plan_table.setItem(row, column, QTableWidgetItem(text))
+
+        self.ingredient_cost_output.setText(f"{plan['total_cost']:.2f}")
+        self.shopping_cost_output.setText(f"{plan['pack_cost']:.2f}")
+
+        problems = [f"Unknown product: {product_name}" for product_name in plan["unknown_products"]]
+        problems += [f"{line['Product']}: {line['Ingredient']} ({line['Status']})" for line in plan["invalid_lines"]]
+        if problems:
+            message = "Some orders could not be fully planned:\n\n" + "\n".join(problems[:10])
+            if len(problems) > 10:
+                message += f"\n...and {len(problems) - 10} more."
+            QMessageBox.warning(self, "Incomplete Plan", message)
+
+    def on_plan_error(self, error):
+        self.plan_btn.setEnabled(True)
+        QMessageBox.critical(self, "Planning Error", f"Failed to plan production: {error}.")
+
+if AppProfile.enabled:
+    AppProfile.instrument_class(IngredientsPage, action=True)
+    AppProfile.instrument_class(ProductsPage, action=True)
+    AppProfile.instrument_class(PlanningPage, action=True)
+
 def main():
     app = QApplication(sys.argv)
     window = AppGUI()
+    if STARTUP_TIMING:
+        startup_timer = StartupTimer(window, exit_after_paint=STARTUP_TIMING == "exit")
+        startup_timer.window_built = time.perf_counter()
     window.show()
-    sys.exit(app.exec())
+    exit_code = app.exec()
+    window.watcher.stop()
+    window.tasks.pool.waitForDone()
+    sys.exit(exit_code)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,99 @@
+import os
+import json
+import time
+import threading
+from AppImports import lazy_import
+from AppProfile import record_read, record_write
+from AppStorage import file_stamp, write_atomic
+
+np = lazy_import("numpy")
+
+class PriceHistory:
+    """Append-only snapshots of the catalog prices, storing only the price rows that changed since the last one"""
+    history_file = "PriceHistory.bin"
+    index_file = "PriceHistory.json"
+    record_dtype = [("snapshot", "<i4"), ("ingredient", "<i4"), ("prices", "<f8", (3,))]
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.RLock()
+        self._state = None
+        self._stamps = None
+
+    def load(self):
+        # Returns the snapshot times, the ingredient names and the records, in snapshot order
+        with self._lock:
+            history_path = f"{self.path}/{self.history_file}"
+            index_path = f"{self.path}/{self.index_file}"
+            stamps = file_stamp(history_path), file_stamp(index_path)
+            if self._state is not None and stamps == self._stamps:
+                return self._state
+
+            index = {"snapshots": [], "ingredients": []}
+            if stamps[1] is not None:
+                with open(index_path, encoding="utf-8") as index_file:
+                    index = json.load(index_file)
+            data = b""
+            if stamps[0] is not None:
+                with open(history_path, "rb") as history_file:
+                    data = history_file.read()
+
+            # Records a save wrote before it could add its snapshot to the index are left out
+            dtype = np.dtype(self.record_dtype)
+            records = np.frombuffer(data, dtype=dtype, count=len(data) // dtype.itemsize)
+            records = records[:np.searchsorted(records["snapshot"], len(index["snapshots"]))]
+            record_read(history_path, len(records))
+
+            self._state = np.array(index["snapshots"], dtype=float), index["ingredients"], records
+            self._stamps = stamps
+            return self._state
+
+    def price_tensor(self):
+        # prices[snapshot, ingredient, basis] as of each snapshot, carrying every row forward until it changes
+        times, names, records = self.load()
+        latest = np.full((len(times), len(names)), -1, dtype=np.intp)
+        latest[records["snapshot"], records["ingredient"]] = np.arange(len(records))
+        np.maximum.accumulate(latest, axis=0, out=latest)
+
+        rows = np.concatenate([records["prices"], np.full((1, 3), np.nan)])
+        return times, names, rows[latest]
+
+    def record(self, price_table, timestamp=None):
+        positions, prices = price_table
+        with self._lock:
+            times, names, records = self.load()
+            known = dict(zip(names, range(len(names))))
+            names = names + [name for name in positions if name not in known]
+            name_pos = {name: pos for pos, name in enumerate(names)}
+
+            latest = np.full(len(names), -1, dtype=np.intp)
+            np.maximum.at(latest, records["ingredient"], np.arange(len(records)))
+            recorded = latest >= 0
+            last = np.concatenate([records["prices"], np.full((1, 3), np.nan)])[latest]
+
+            current = np.full((len(names), 3), np.nan)
+            current[[name_pos[name] for name in positions]] = prices[list(positions.values())]
+            same = (last == current) | (np.isnan(last) & np.isnan(current))
+            changed = np.flatnonzero(~recorded | ~same.all(axis=1))
+            if len(times) and not len(changed):
+                return 0
+
+            new_records = np.zeros(len(changed), dtype=self.record_dtype)
+            new_records["snapshot"] = len(times)
+            new_records["ingredient"] = changed
+            new_records["prices"] = current[changed]
+
+            # Append the rows first and publish the snapshot in the index after, so a crash in between only leaves
+            # records that the next save cuts off again
+            history_path = f"{self.path}/{self.history_file}"
+            with open(history_path, "ab") as history_file:
+                history_file.truncate(records.nbytes)
+                history_file.write(new_records.tobytes())
+                history_file.flush()
+                os.fsync(history_file.fileno())
+            index = {"snapshots": times.tolist() + [time.time() if timestamp is None else float(timestamp)],
+                     "ingredients": names}
+            write_atomic(f"{self.path}/{self.index_file}", json.dumps(index, ensure_ascii=False).encode("utf-8"))
+            record_write(history_path, len(new_records))
+            self._state = None
+            return len(new_records)
@@ -0,0 +1,28 @@
+import sys
+import types
+import threading
+import importlib
+import importlib.util
+
+_import_lock = threading.RLock()
+
+class LazyModule(types.ModuleType):
+    """Stands in for a module until one of its attributes is first used, then imports it once"""
+    def __getattr__(self, attr):
+        # Only reached for names not copied over yet; the lock keeps a worker thread and the GUI thread that touch
+        # the module at the same moment from both running its import
+        with _import_lock:
+            module = importlib.import_module(self.__name__)
+            self.__dict__.update(module.__dict__)
+        return getattr(module, attr)
+
+def lazy_import(name):
+    if name in sys.modules:
+        return sys.modules[name]
+
+    if importlib.util.find_spec(name) is None:
+        raise ImportError(f"No module named \"{name}\".")
+    return LazyModule(name)
+
+def is_loaded(name):
+    return name in sys.modules
@@ -1,166 +1,1821 @@
 import os
-import pandas as pd
+import sys
+import csv
+import json
+import math
+import time
+import sqlite3
+import argparse
+import threading
+import functools
+import AppProfile
+from AppImports import lazy_import
+from AppSearch import SearchIndex
+from AppCostCache import CostCache
+from AppHistory import PriceHistory
+from AppStorage import (CsvStorage, ColumnarStorage, SqliteStorage, INGREDIENT_SCHEMA, INGREDIENT_COLUMNS,
+                        RECIPE_COLUMNS, OFFER_SCHEMA, OFFER_COLUMNS, content_digest, decimal_floats, open_storage,
+                        copy_storage, read_csv_schema)
 
-class AppMain:
+np = lazy_import("numpy")
+pd = lazy_import("pandas")
+
+# Store unit -> (basis, amount of the basis unit in one store unit)
+STORE_UNITS = {
+    "g": ("g", 1),
+    "kg": ("g", 1E3),
+    "lb": ("g", 453.592),
+    "oz": ("g", 28.3495),
+    "ml": ("ml", 1),
+    "l": ("ml", 1E3),
+    "pc": ("pc", 1)
+}
+
+# Recipe unit -> (basis, amount of the basis unit in one recipe unit)
+RECIPE_UNITS = {
+    "g": ("g", 1),
+    "kg": ("g", 1E3),
+    "lb": ("g", 453.592),
+    "oz": ("g", 28.3495),
+    "ml": ("ml", 1),
+    "l": ("ml", 1E3),
+    "cup": ("ml", 236.588),
+    "tsp": ("ml", 4.92892),
+    "tbsp": ("ml", 14.7868),
+    "pc": ("pc", 1)
+}
+
+def build_price_index(df):
+    price_index = {}
+    columns = ["Ingredient", "Density (g/ml)", "Store Price (€)", "Store Amount", "Store Unit"]
+    for name, density, price, amount, unit in zip(*(decimal_floats(df[column]) for column in columns)):
+        if name in price_index:
+            continue
+        # A pack without a positive amount has no unit price to give
+        if unit not in STORE_UNITS or not amount > 0:
+            price_index[name] = None
+            continue
+
+        basis, factor = STORE_UNITS[unit]
+        base_price = price / amount / factor
+
+        if basis == "g":
+            unit_prices = {"g": base_price, "ml": base_price * density, "pc": None}
+        elif basis == "ml":
+            unit_prices = {"g": base_price / density if density > 0 else None, "ml": base_price, "pc": None}
+        else:
+            unit_prices = {"g": None, "ml": None, "pc": base_price}
+        price_index[name] = unit_prices
+
+    return price_index
+
+PRICE_BASES = ["g", "ml", "pc"]
+
+RECIPE_UNIT_POSITIONS = {unit: pos for pos, unit in enumerate(RECIPE_UNITS)}
+RECIPE_UNIT_BASES = [PRICE_BASES.index(basis) for basis, _ in RECIPE_UNITS.values()] + [0]
+RECIPE_UNIT_FACTORS = [factor for _, factor in RECIPE_UNITS.values()] + [float("nan")]
+
+@functools.cache
+def recipe_unit_arrays():
+    return np.array(RECIPE_UNIT_BASES), np.array(RECIPE_UNIT_FACTORS)
+
+LINE_STATUSES = ["ok", "unknown ingredient", "unknown unit", "invalid amount", "no price for unit", "recipe cycle"]
+
+def build_price_table(price_index):
+    names = [name for name, unit_prices in price_index.items() if unit_prices is not None]
+    positions = {name: pos for pos, name in enumerate(names)}
+    prices = np.array([
+        [np.nan if price_index[name][basis] is None else price_index[name][basis] for basis in PRICE_BASES]
+        for name in names
+    ] + [[np.nan] * len(PRICE_BASES)], dtype=float)
+    return positions, prices
+
+OFFER_PRICE_COLUMNS = ["Price per g (€)", "Price per ml (€)", "Price per pc (€)"]
+
+def build_offer_index(catalog, offers):
+    # Every ingredient's own store data is its first offer, followed by any extra offers for it
+    catalog = catalog.drop_duplicates("Ingredient")
+    all_offers = pd.concat([frame[OFFER_COLUMNS].astype({"Store Brand": object, "Store Unit": object})
+                            for frame in (catalog, offers)], ignore_index=True)
+    densities = pd.Series(decimal_floats(catalog["Density (g/ml)"]), index=catalog["Ingredient"], dtype=float)
+    density = all_offers["Ingredient"].map(densities).to_numpy(dtype=float)
+    basis = all_offers["Store Unit"].map({unit: basis for unit, (basis, _) in STORE_UNITS.items()}).to_numpy()
+    factor = all_offers["Store Unit"].map({unit: factor for unit, (_, factor) in STORE_UNITS.items()})
+
+    for column in ["Store Price (€)", "Store Amount"]:
+        all_offers[column] = np.array(decimal_floats(all_offers[column]), dtype=float)
+
+    # Normalized the same way build_price_index does it, so the catalog offer prices identically
+    amounts = all_offers["Store Amount"].to_numpy()
+    with np.errstate(divide="ignore", invalid="ignore"):
+        base = np.where(amounts > 0, all_offers["Store Price (€)"].to_numpy() / amounts / factor.to_numpy(dtype=float),
+                        np.nan)
+        unit_prices = np.column_stack([
+            np.select([basis == "g", (basis == "ml") & (density > 0)], [base, base / density], np.nan),
+            np.select([basis == "g", basis == "ml"], [base * density, base], np.nan),
+            np.where(basis == "pc", base, np.nan)
+        ])
+
+    codes, names = pd.factorize(all_offers["Ingredient"])
+    for column, prices in zip(OFFER_PRICE_COLUMNS, unit_prices.T):
+        all_offers[column] = prices
+    return {
+        "offers": all_offers,
+        "unit_prices": unit_prices,
+        "codes": codes,
+        "positions": {name: pos for pos, name in enumerate(names.tolist())},
+        "catalog_offers": len(catalog),
+        "tables": {}
+    }
+
+def select_offers(offer_index, brand=None):
+    unit_prices = offer_index["unit_prices"]
+    codes = offer_index["codes"]
+    rows = np.arange(len(codes))
+    valid = np.isfinite(unit_prices) & (unit_prices >= 0)
+    if brand is None:
+        rank = np.zeros(len(codes), dtype=np.intp)
+    else:
+        # A pinned store's offers come first; ingredients it doesn't sell keep their catalog offer
+        brands = offer_index["offers"]["Store Brand"].to_numpy()
+        rank = np.where(brands == brand, 0, np.where(rows < offer_index["catalog_offers"], 1, 2))
+
+    prices = np.full((len(offer_index["positions"]) + 1, len(PRICE_BASES)), np.nan)
+    chosen = np.full(prices.shape, -1, dtype=np.intp)
+    for basis in range(len(PRICE_BASES)):
+        eligible = valid[:, basis] & (rank < 2)
+        order = np.lexsort((unit_prices[:, basis], rank, ~eligible, codes))
+        first = order[np.r_[True, codes[order][1:] != codes[order][:-1]]] if len(order) else order
+        first = first[eligible[first]]
+        prices[codes[first], basis] = unit_prices[first, basis]
+        chosen[codes[first], basis] = first
+    return (offer_index["positions"], prices), chosen
+
+def build_store_unit_table(df):
+    # Store units in one g, ml or pc of each ingredient: the price table of the catalog with every pack holding
+    # one store unit for €1, so the density and unit conversions are the ones costing uses
+    return build_price_table(build_price_index(df.assign(**{"Store Price (€)": 1.0, "Store Amount": 1.0})))
+
+def _column_values(column):
+    return column.tolist() if hasattr(column, "tolist") else list(column)
+
+def recipe_amounts(recipe):
+    amounts = recipe["Amount Used"]
+    if getattr(amounts, "dtype", None) == "float32":
+        # Typed recipes hold float32; widened back to the decimals they were read from, they digest and cost the same
+        # as the parsed text
+        return np.array(decimal_floats(pd.Series(amounts)), dtype=float)
+    amounts = np.asarray(amounts)
+    if amounts.dtype.kind not in "iuf":
+        try:
+            return amounts.astype(float)
+        except (TypeError, ValueError):
+            amounts = pd.to_numeric(amounts, errors="coerce")
+    return np.asarray(amounts, dtype=float)
+
+def cost_recipe_lines(price_table, recipe, unit_costs=None):
+    positions, prices = price_table
+    missing_ingredient = len(prices) - 1
+    missing_unit = len(RECIPE_UNITS)
+    line_count = len(recipe["Ingredient"])
+    names = _column_values(recipe["Ingredient"])
+
+    ingredient_pos = np.fromiter(
+        (positions.get(name, missing_ingredient) for name in names),
+        dtype=np.intp, count=line_count
+    )
+    unit_pos = np.fromiter(
+        (RECIPE_UNIT_POSITIONS.get(unit, missing_unit) for unit in _column_values(recipe["Amount Unit"])),
+        dtype=np.intp, count=line_count
+    )
+    amounts = recipe_amounts(recipe)
+
+    unit_bases, unit_factors = recipe_unit_arrays()
+    unit_prices = prices[ingredient_pos, unit_bases[unit_pos]]
+
+    # Lines naming another product (a sub-recipe) are priced per piece of it, at that product's production cost
+    unknown = ingredient_pos == missing_ingredient
+    cyclic = np.zeros(line_count, dtype=bool)
+    if unit_costs:
+        for line in np.flatnonzero(unknown).tolist():
+            if names[line] not in unit_costs:
+                continue
+            unknown[line] = False
+            if unit_costs[names[line]] is None:
+                cyclic[line] = True
+            elif unit_pos[line] == RECIPE_UNIT_POSITIONS["pc"]:
+                unit_prices[line] = unit_costs[names[line]]
+    costs = amounts * unit_prices * unit_factors[unit_pos]
+
+    status = np.zeros(line_count, dtype=np.intp)
+    status[np.isnan(unit_prices)] = 4
+    status[np.isnan(amounts)] = 3
+    status[unit_pos == missing_unit] = 2
+    status[unknown] = 1
+    status[cyclic] = 5
+    costs[status != 0] = np.nan
+
+    return costs, status
+
+def cost_recipe_tree(price_table, recipe, unit_costs, get_product, load_recipe, stack=()):
+    costs, status = cost_recipe_lines(price_table, recipe)
+    unknown = np.flatnonzero(status == 1)
+    if not len(unknown):
+        return costs, status
+
+    names = _column_values(recipe["Ingredient"])
+    components = {names[line] for line in unknown.tolist()}
+    components = [name for name in components if isinstance(name, str) and get_product(name) is not None]
+    if not components:
+        return costs, status
+
+    sub_costs = {
+        name: recipe_unit_cost(name, price_table, unit_costs, get_product, load_recipe, stack) for name in components
+    }
+    return cost_recipe_lines(price_table, recipe, sub_costs)
+
+def recipe_unit_cost(product_name, price_table, unit_costs, get_product, load_recipe, stack=()):
+    # unit_costs memoizes (production cost per piece, names the recipe uses); None marks a product that is part of,
+    # or depends on, a recipe cycle
+    if product_name in unit_costs:
+        return unit_costs[product_name][0]
+    if product_name in stack:
+        return None
+
+    try:
+        recipe = load_recipe(product_name)
+    except FileNotFoundError:
+        unit_costs[product_name] = float("nan"), set()
+        return float("nan")
+
+    costs, status = cost_recipe_tree(price_table, recipe, unit_costs, get_product, load_recipe, (*stack, product_name))
+    uses = set(_column_values(recipe["Ingredient"]))
+    if (status == 5).any():
+        unit_costs[product_name] = None, uses
+    else:
+        unit_costs[product_name] = product_prices(float(np.nansum(costs)), *get_product(product_name))[0], uses
+    return unit_costs[product_name][0]
+
+class UnitCostMemo(dict):
+    """recipe_unit_cost memo that also keeps, for every name, the memoized products whose recipes use it"""
     def __init__(self):
-        self.path = os.getcwd()
-        self.ingredients_file = "Ingredients.csv"
-        self.products_file = "Products.csv"
+        super().__init__()
+        self.used_by = {}
+
+    def __setitem__(self, product_name, entry):
+        if product_name in self:
+            del self[product_name]
+        super().__setitem__(product_name, entry)
+        for name in entry[1]:
+            self.used_by.setdefault(name, set()).add(product_name)
+
+    def __delitem__(self, product_name):
+        _, uses = self[product_name]
+        super().__delitem__(product_name)
+        for name in uses:
+            users = self.used_by[name]
+            users.discard(product_name)
+            if not users:
+                del self.used_by[name]
+
+    def clear(self):
+        super().clear()
+        self.used_by.clear()
+
+def _parsed_recipe(recipe):
+    # Parses the amounts once for both the digest and the costing
+    return {"Ingredient": recipe["Ingredient"], "Amount Used": recipe_amounts(recipe), "Amount Unit": recipe["Amount Unit"]}
+
+def recipe_digest(recipe):
+    return content_digest(b"\1".join([
+        "\0".join(map(str, _column_values(recipe["Ingredient"]))).encode(),
+        recipe_amounts(recipe).tobytes(),
+        "\0".join(map(str, _column_values(recipe["Amount Unit"]))).encode()
+    ]))
+
+def recipe_cost_key(digest, names, price_table, unit_costs, get_product, load_recipe):
+    # The lines' costs only depend on the lines themselves, the price rows of the ingredients they name and the
+    # production cost of the products they use as sub-recipes
+    positions, prices = price_table
+    missing_ingredient = len(prices) - 1
+    ingredient_pos = np.fromiter((positions.get(name, missing_ingredient) for name in names), dtype=np.intp,
+                                 count=len(names))
+    rows = prices[ingredient_pos]
+    kinds = np.zeros(len(names), dtype=np.int8)
+    for i in np.flatnonzero(ingredient_pos == missing_ingredient).tolist():
+        if get_product(names[i]) is not None:
+            unit_cost = recipe_unit_cost(names[i], price_table, unit_costs, get_product, load_recipe)
+            kinds[i] = 1 if unit_cost is None else 2
+            rows[i, 0] = np.nan if unit_cost is None else unit_cost
+    return content_digest(digest + rows.tobytes() + kinds.tobytes())
+
+def cached_recipe_costs(product_name, price_table, unit_costs, storage, cost_cache, recipe=None):
+    # With a stable recipe stamp a cache hit doesn't even read the recipe
+    stamp = entry = None
+    if recipe is None and storage.stable_recipe_stamps:
+        stamp = storage.recipe_stamps([product_name])[product_name]
+        if stamp is not None:
+            entry = cost_cache.get_recipe(product_name, stamp)
+    if entry is None:
+        recipe = _parsed_recipe(storage.load_recipe_columns(product_name) if recipe is None else recipe)
+        entry = recipe_digest(recipe), sorted(set(map(str, _column_values(recipe["Ingredient"]))))
+        if stamp is not None:
+            cost_cache.put_recipe(product_name, stamp, *entry)
+
+    key = recipe_cost_key(*entry, price_table, unit_costs, storage.get_product, storage.load_recipe_columns)
+    cached = cost_cache.get(key)
+    if cached is not None and not cost_cache.verify:
+        return cached
+
+    if recipe is None:
+        recipe = storage.load_recipe_columns(product_name)
+    costs, status = cost_recipe_tree(price_table, recipe, unit_costs, storage.get_product, storage.load_recipe_columns)
+    if cached is not None:
+        if np.array_equal(cached[0], costs, equal_nan=True) and np.array_equal(cached[1], status):
+            return cached
+        cost_cache.mismatches += 1
+        print(f"Error in the cost cache: stale costs for \"{product_name}\" were replaced.", file=sys.stderr)
+    cost_cache.put(key, costs, status)
+    return costs, status
+
+def find_recipe_cycle(product_name, recipe, price_table, get_product, load_recipe):
+    positions = price_table[0]
+    paths = [[product_name, name] for name in set(_column_values(recipe["Ingredient"]))
+             if name not in positions and (name == product_name or get_product(name) is not None)]
+    seen = set()
+    while paths:
+        path = paths.pop()
+        if path[-1] == product_name:
+            return path
+        if path[-1] in seen:
+            continue
+        seen.add(path[-1])
+        try:
+            names = set(_column_values(load_recipe(path[-1])["Ingredient"]))
+        except FileNotFoundError:
+            continue
+        paths.extend(path + [name] for name in names
+                     if name not in positions and (name == product_name or get_product(name) is not None))
+    return None
+
+def changed_ingredients(old_price_table, new_price_table):
+    old_positions, old_prices = old_price_table
+    new_positions, new_prices = new_price_table
+
+    changed = set(old_positions.keys() ^ new_positions.keys())
+    common = list(old_positions.keys() & new_positions.keys())
+    if common:
+        old_rows = old_prices[[old_positions[name] for name in common]]
+        new_rows = new_prices[[new_positions[name] for name in common]]
+        same = (old_rows == new_rows) | (np.isnan(old_rows) & np.isnan(new_rows))
+        changed.update(name for name, row_same in zip(common, same.all(axis=1)) if not row_same)
+
+    return changed
+
+def product_prices(total_cost, pieces_made, multiplier):
+    pieces_made = 1.0 if pd.isna(pieces_made) else float(pieces_made)
+    multiplier = 1.0 if pd.isna(multiplier) else float(multiplier)
+
+    production_cost = total_cost / pieces_made if pieces_made > 0 else 0.0
+    return production_cost, production_cost * multiplier
+
+PLAN_COLUMNS = ["Ingredient", "Store Brand", "Amount Needed", "Store Unit", "Store Amount", "Packs", "Store Price (€)",
+                "Cost (€)", "Pack Cost (€)"]
+
+PRICE_LIST_COLUMNS = ["Ingredient", "Store Brand", "Store Price (€)", "Store Amount", "Store Unit"]
+PRICE_LIST_NUMBERS = ["Density (g/ml)", "Store Price (€)", "Store Amount"]
+
+def parse_numbers(text):
+    # Price lists repeat the same prices and pack sizes, so each distinct text is only parsed once
+    codes, uniques = pd.factorize(text)
+    numbers = pd.to_numeric(pd.Series(uniques, dtype=object), errors="coerce").to_numpy(dtype=float)
+    return pd.Series(numbers[codes], index=text.index)
+
+def validate_price_list(chunk):
+    names = chunk["Ingredient"].str.strip()
+    brands = chunk["Store Brand"].str.strip()
+    prices = parse_numbers(chunk["Store Price (€)"])
+    amounts = parse_numbers(chunk["Store Amount"])
+    units = chunk["Store Unit"].str.strip()
+    density_text = chunk["Density (g/ml)"] if "Density (g/ml)" in chunk else pd.Series("", index=chunk.index)
+    densities = parse_numbers(density_text)
+    bad_densities = densities.isna() & density_text.str.strip().ne("")
+
+    reasons = np.select(
+        [
+            names == "",
+            brands == "",
+            prices.isna(),
+            ~(prices > 0),
+            amounts.isna(),
+            ~(amounts > 0),
+            ~units.isin(list(STORE_UNITS)),
+            bad_densities | (densities < 0)
+        ],
+        [
+            "missing ingredient name",
+            "missing store brand",
+            "store price must be a valid number",
+            "store price must be positive",
+            "store amount must be a valid number",
+            "store amount must be positive",
+            "unknown store unit",
+            "density must be a valid number"
+        ],
+        default=""
+    )
+
+    parsed = pd.DataFrame({
+        "Ingredient": names,
+        "Density (g/ml)": densities,
+        "Store Brand": brands,
+        "Store Price (€)": prices,
+        "Store Amount": amounts,
+        "Store Unit": units
+    })
+    return parsed, pd.Series(reasons, index=chunk.index)
+
+_worker_price_table = None
+_worker_unit_costs = {}
+_worker_cost_cache = None
+
+def _init_cost_worker(price_table, unit_costs=None, cost_cache=None):
+    global _worker_price_table, _worker_unit_costs, _worker_cost_cache
+    _worker_price_table = price_table
+    _worker_unit_costs = {} if unit_costs is None else dict(unit_costs)
+    _worker_cost_cache = cost_cache
+
+def _cost_products(storage, products):
+    results = []
+    for product_name, pieces_made, multiplier in products:
+        result = {"Product": product_name, "Pieces Made": pieces_made, "Multiplier": multiplier}
+        try:
+            if _worker_cost_cache is None:
+                recipe = storage.load_recipe_columns(product_name)
+                costs, status = cost_recipe_tree(_worker_price_table, recipe, _worker_unit_costs, storage.get_product,
+                                                 storage.load_recipe_columns)
+            else:
+                costs, status = cached_recipe_costs(product_name, _worker_price_table, _worker_unit_costs, storage,
+                                                    _worker_cost_cache)
+        except FileNotFoundError:
+            result["Status"] = "missing recipe"
+            results.append(result)
+            continue
+        except Exception as e:
+            result["Status"] = f"unreadable recipe: {e}"
+            results.append(result)
+            continue
+
+        invalid_lines = int(np.count_nonzero(status))
+        if np.any(status == LINE_STATUSES.index("recipe cycle")):
+            # Any cost summed around a cycle is wrong, so none is given, as in the margin simulation
+            result.update({"Invalid Lines": invalid_lines, "Status": "recipe cycle"})
+            results.append(result)
+            continue
+
+        total_cost = float(np.nansum(costs))
+        production_cost, product_price = product_prices(total_cost, pieces_made, multiplier)
+
+        result.update({
+            "Total Cost (€)": round(total_cost, 4),
+            "Production Cost (€)": round(production_cost, 4),
+            "Product Price (€)": round(product_price, 4),
+            "Invalid Lines": invalid_lines,
+            "Status": "ok"
+        })
+        results.append(result)
+
+    if _worker_cost_cache is not None:
+        _worker_cost_cache.flush(force=True)
+    return results
+
+def build_recipe_quantities(positions, recipes, pieces_made):
+    # One row per (product, ingredient, price basis) amount a product's recipe uses, in g, ml or pieces, with
+    # sub-recipes flattened into the ingredients they use; a product's cost is these amounts times the prices.
+    # Also returns, per product, the lines it can't cost (as cost_recipe_tree counts them) and whether it is part of,
+    # or uses, a recipe cycle
+    product_codes = {name: code for code, name in enumerate(pieces_made)}
+    piece_scales = np.array([1.0 if pd.isna(pieces) else 1.0 / pieces if pieces > 0 else 0.0
+                             for pieces in pieces_made.values()], dtype=float)
+
+    lines = {column: [] for column in RECIPE_COLUMNS}
+    line_products = []
+    for code, recipe in enumerate(recipes):
+        if recipe is None:
+            continue
+        for column in RECIPE_COLUMNS:
+            lines[column].extend(_column_values(recipe[column]))
+        line_products.extend([code] * len(recipe["Ingredient"]))
+
+    line_products = np.array(line_products, dtype=np.intp)
+    names = np.array(lines["Ingredient"], dtype=object)
+    amounts = recipe_amounts(lines)
+    # Names and units repeat a lot across recipes, so each distinct one is looked up once
+    codes, uniques = pd.factorize(names, use_na_sentinel=False)
+    ingredient_pos = np.array([positions.get(name, -1) for name in uniques], dtype=np.intp)[codes]
+    sub_pos = np.array([-1 if name in positions else product_codes.get(name, -1) for name in uniques],
+                       dtype=np.intp)[codes]
+    codes, uniques = pd.factorize(np.array(lines["Amount Unit"], dtype=object), use_na_sentinel=False)
+    unit_pos = np.array([RECIPE_UNIT_POSITIONS.get(unit, len(RECIPE_UNITS)) for unit in uniques], dtype=np.intp)[codes]
+    unit_bases, unit_factors = recipe_unit_arrays()
+
+    ok = (ingredient_pos >= 0) & (unit_pos < len(RECIPE_UNITS)) & ~np.isnan(amounts)
+    direct = pd.DataFrame({
+        "product": line_products[ok],
+        "ingredient": ingredient_pos[ok],
+        "basis": unit_bases[unit_pos[ok]],
+        "quantity": amounts[ok] * unit_factors[unit_pos[ok]]
+    })
+
+    # Sub-recipes are used by the piece, and one without a recipe has no cost to give
+    has_recipe = np.array([recipe is not None for recipe in recipes] + [False], dtype=bool)
+    sub_lines = np.flatnonzero(has_recipe[sub_pos] & (unit_pos == RECIPE_UNIT_POSITIONS["pc"]) & ~np.isnan(amounts))
+
+    # A product can be costed once every sub-recipe it uses can; whatever never gets there is part of, or uses, a cycle
+    waiting = np.bincount(line_products[sub_lines], minlength=len(product_codes))
+    users = {}
+    for product, sub in zip(line_products[sub_lines].tolist(), sub_pos[sub_lines].tolist()):
+        users.setdefault(sub, []).append(product)
+    ready = np.flatnonzero(waiting == 0).tolist()
+    while ready:
+        for product in users.get(ready.pop(), ()):
+            waiting[product] -= 1
+            if not waiting[product]:
+                ready.append(product)
+    cyclic = waiting > 0
+
+    sub_lines = sub_lines[~cyclic[sub_pos[sub_lines]]]
+    valid = ok.copy()
+    valid[sub_lines] = True
+    invalid_lines = np.bincount(line_products[~valid], minlength=len(product_codes))
+
+    edges = pd.DataFrame({
+        "product": line_products[sub_lines],
+        "sub": sub_pos[sub_lines],
+        "weight": amounts[sub_lines] * piece_scales[sub_pos[sub_lines]]
+    })
+
+    # Each pass adds the ingredients of one more level of sub-recipes; the sub-recipes left are acyclic, and summing
+    # the paths that reach the same sub-recipe keeps a pass no bigger than the (product, sub-recipe) pairs
+    parts = [direct.assign(direct=True)]
+    pending = edges.groupby(["product", "sub"], as_index=False, sort=False)["weight"].sum()
+    while not pending.empty:
+        expanded = pending.merge(direct, left_on="sub", right_on="product", suffixes=("", "_sub"))
+        parts.append(pd.DataFrame({"product": expanded["product"], "ingredient": expanded["ingredient"],
+                                   "basis": expanded["basis"], "quantity": expanded["quantity"] * expanded["weight"],
+                                   "direct": False}))
+        pending = pending.merge(edges, left_on="sub", right_on="product", suffixes=("", "_sub"))
+        pending = pd.DataFrame({"product": pending["product"], "sub": pending["sub_sub"],
+                                "weight": pending["weight"] * pending["weight_sub"]})
+        pending = pending.groupby(["product", "sub"], as_index=False, sort=False)["weight"].sum()
+
+    return pd.concat(parts, ignore_index=True), invalid_lines, cyclic
+
+def build_cost_exposures(price_table, recipes, pieces_made):
+    # exposures[product, ingredient] is the part of a product's cost spent on an ingredient; a product's cost scales
+    # linearly with each ingredient's price. Lines priced in a basis their ingredient has no price for count as invalid
+    positions, prices = price_table
+    quantities, invalid_lines, cyclic = build_recipe_quantities(positions, recipes, pieces_made)
+    costs = quantities["quantity"].to_numpy() * prices[quantities["ingredient"], quantities["basis"]]
+    priced = ~np.isnan(costs)
+    products = quantities["product"].to_numpy()
+    invalid_lines += np.bincount(products[~priced & quantities["direct"].to_numpy(dtype=bool)],
+                                 minlength=len(pieces_made))
+    cells = products[priced] * len(positions) + quantities["ingredient"].to_numpy()[priced]
+    exposures = np.bincount(cells, weights=costs[priced],
+                            minlength=len(pieces_made) * len(positions)).reshape(len(pieces_made), len(positions))
+    return exposures, invalid_lines, cyclic
+
+SIMULATION_DISTRIBUTIONS = ["lognormal", "normal", "uniform"]
+
+def draw_price_ratios(volatilities, shocks, scenarios, distribution="lognormal", seed=None):
+    # ratios[ingredient, scenario] scales the ingredient's store price; every distribution averages 1 before the shock
+    rng = np.random.default_rng(seed)
+    volatilities = np.asarray(volatilities, dtype=float)[:, None]
+    shape = (len(volatilities), scenarios)
+    if distribution == "lognormal":
+        ratios = rng.standard_normal(shape)
+        ratios *= volatilities
+        ratios -= volatilities ** 2 / 2
+        np.exp(ratios, out=ratios)
+    elif distribution in ("normal", "uniform"):
+        ratios = rng.standard_normal(shape) if distribution == "normal" else rng.uniform(-1.0, 1.0, shape)
+        ratios *= volatilities
+        ratios += 1.0
+        np.maximum(ratios, 0.0, out=ratios)
+    else:
+        raise ValueError(f"Unknown price distribution \"{distribution}\".")
+
+    ratios *= 1.0 + np.asarray(shocks, dtype=float)[:, None]
+    return ratios
+
+_worker_price_ratios = None
+
+def _init_simulation_worker(ratio_args):
+    global _worker_price_ratios
+    _worker_price_ratios = draw_price_ratios(*ratio_args)
+
+def _simulate_products(exposures, piece_scales, prices, percentiles):
+    piece_costs = exposures @ _worker_price_ratios
+    piece_costs *= piece_scales[:, None]
+    return np.percentile(piece_costs, percentiles, axis=1).T, (piece_costs > prices[:, None]).mean(axis=1)
+
+class AppMain:
+    def __init__(self, storage=None):
+        self.storage = storage if storage is not None else open_storage(os.getcwd())
+        self._lock = threading.RLock()
+
+        self._catalog = None
+        self._catalog_stamp = None
+        self._price_index = None
+        self._price_table = None
+        self._store_unit_table = None
+        self._offer_index = None
+        self.catalog_version = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+        self._usage_index = None
+        self._indexed_recipes = {}
+        self.last_price_impact = []
+
+        self._unit_costs = UnitCostMemo()
+        self._unit_cost_table = None
+
+        self.use_cost_cache = True
+        self.verify_cost_cache = False
+        self._cost_cache = None
+        self._price_history = None
+
+        self.watching = False
+        self._watch_stamps = None
+        self._change_listeners = []
+
+        self._ingredient_index = None
+        self._ingredient_index_version = None
+        self._product_index = None
+        self._product_index_stamp = None
+
+    @property
+    def path(self):
+        return self.storage.path
+
+    @path.setter
+    def path(self, path):
+        self.storage.path = path
+        self.invalidate_cache()
+
+    def _get_catalog(self):
+        with self._lock:
+            if self._catalog is not None and self.watching:
+                self.cache_hits += 1
+                return self._catalog
+
+            stamp = self.storage.catalog_stamp()
+
+            if self._catalog is not None and stamp is not None and stamp == self._catalog_stamp:
+                self.cache_hits += 1
+                return self._catalog
+
+            self.cache_misses += 1
+            self._catalog = self.storage.load_ingredients()
+            self._catalog_stamp = stamp
+            self.catalog_version += 1
+            self._price_index = build_price_index(self._catalog)
+            self._price_table = build_price_table(self._price_index)
+            self._store_unit_table = None
+            self._offer_index = None
+            return self._catalog
+
+    def _get_price_index(self):
+        with self._lock:
+            self._get_catalog()
+            return self._price_index
+
+    def _get_price_table(self):
+        with self._lock:
+            self._get_catalog()
+            return self._price_table
+
+    def _get_store_unit_table(self):
+        with self._lock:
+            self._get_catalog()
+            if self._store_unit_table is None:
+                self._store_unit_table = build_store_unit_table(self._catalog)
+            return self._store_unit_table
+
+    def _get_offer_index(self):
+        with self._lock:
+            self._get_catalog()
+            if self._offer_index is None:
+                self._offer_index = build_offer_index(self._catalog, self.storage.load_offers())
+            return self._offer_index
+
+    def _get_offer_selection(self, offer):
+        # offer is "cheapest" or a store brand to pin, each selected once per catalog version
+        with self._lock:
+            offer_index = self._get_offer_index()
+            brand = None if offer == "cheapest" else offer
+            selection = offer_index["tables"].get(brand)
+            if selection is None:
+                if brand is not None and brand not in self.get_offer_brands():
+                    raise ValueError(f"Unknown store brand \"{brand}\".")
+                selection = offer_index["tables"][brand] = select_offers(offer_index, brand)
+            return selection
+
+    def _get_offer_table(self, offer=None):
+        if offer is None:
+            return self._get_price_table()
+        return self._get_offer_selection(offer)[0]
+
+    def get_offers(self, ingredient_name=None):
+        offer_index = self._get_offer_index()
+        if ingredient_name is None:
+            return offer_index["offers"].copy()
+        pos = offer_index["positions"].get(ingredient_name)
+        if pos is None:
+            return pd.DataFrame(columns=OFFER_COLUMNS + OFFER_PRICE_COLUMNS)
+        return offer_index["offers"].iloc[np.flatnonzero(offer_index["codes"] == pos)].reset_index(drop=True)
+
+    def get_offer(self, ingredient_name, ingredient_unit, offer="cheapest"):
+        (positions, _), chosen = self._get_offer_selection(offer)
+        pos = positions.get(ingredient_name)
+        if pos is None or ingredient_unit not in RECIPE_UNITS:
+            return None
+
+        row = chosen[pos, PRICE_BASES.index(RECIPE_UNITS[ingredient_unit][0])]
+        if row < 0:
+            return None
+        return self._get_offer_index()["offers"].iloc[row].to_dict()
+
+    def get_offer_brands(self):
+        brands = self._get_offer_index()["offers"]["Store Brand"].dropna()
+        return sorted(set(brands.tolist()))
+
+    def update_offers_file(self, data):
+        with self._lock:
+            if not self.storage.save_offers(pd.DataFrame(data, columns=OFFER_COLUMNS)):
+                return
+            self.invalidate_cache()
+            self._update_watch_stamps(catalog=True)
+
+        self._emit_change(self._change_event("save", catalog=True))
+
+    def get_catalog_version(self):
+        with self._lock:
+            self._get_catalog()
+            return self.catalog_version
+
+    def invalidate_cache(self):
+        with self._lock:
+            self._catalog = None
+            self._catalog_stamp = None
+            self._price_index = None
+            self._price_table = None
+            self._store_unit_table = None
+            self._offer_index = None
+
+    def get_cache_stats(self):
+        return {
+            "hits": self.cache_hits,
+            "misses": self.cache_misses,
+            "loaded": self._catalog is not None
+        }
 
     def get_ingredients_df(self):
-        df = pd.read_csv(f"{self.path}/{self.ingredients_file}")
+        df = self._get_catalog().copy()
         return df
 
-    def update_ingredients_file(self, data):
-        df = pd.DataFrame(data)
-        df = df.sort_values(by="Ingredient")
-        df.to_csv(f"{self.path}/{self.ingredients_file}", index=False)
+    def update_ingredients_file(self, data, changes=None):
+        if changes is not None and not changes["rows"] and not changes["removed"]:
+            return []
+        return self._save_catalog(pd.DataFrame(data), changes)
+
+    def _save_catalog(self, df, changes=None):
+        with self._lock:
+            try:
+                old_price_table = self._get_price_table()
+            except FileNotFoundError:
+                old_price_table = build_price_table({})
+
+            df = df.sort_values(by="Ingredient")
+            changed_rows, removed = None, ()
+            if changes is not None:
+                changed_rows = df.index.isin(changes["rows"])
+                names = set(df["Ingredient"].tolist())
+                removed = [name for name in changes["removed"] if name not in names]
+
+            # An edit made outside the app since the last snapshot gets its own snapshot before this save's
+            self._record_prices(old_price_table)
+            if not self.storage.save_ingredients(df, changed_rows, removed):
+                return []
+            self.invalidate_cache()
+            self._update_watch_stamps(catalog=True)
+
+            new_price_table = self._get_price_table()
+            self._record_prices(new_price_table)
+            changed = changed_ingredients(old_price_table, new_price_table)
+            self.last_price_impact = self._get_price_impact(old_price_table, new_price_table, changed)
+            price_impact = self.last_price_impact
+
+        self._emit_change(self._change_event("save", catalog=True, ingredients=changed))
+        return price_impact
+
+    def import_price_list(self, file_path, rejects_path=None, chunk_size=50000):
+        try:
+            catalog = self.get_ingredients_df()
+        except FileNotFoundError:
+            catalog = pd.DataFrame({column: pd.Series(dtype=dtype) for column, dtype in INGREDIENT_SCHEMA.items()})
+        catalog = catalog.astype({"Store Brand": object, "Store Unit": object}).reset_index(drop=True)
+
+        keys = catalog["Ingredient"].astype(str).str.strip().str.casefold()
+        first = ~keys.duplicated()
+        catalog_positions = pd.Series(np.flatnonzero(first), index=keys[first])
+        catalog_brands = catalog["Store Brand"].fillna("").astype(str).str.strip().str.casefold().to_numpy()
+
+        summary = {"rows": 0, "updated": 0, "unchanged": 0, "added": 0, "offers": 0, "rejected": 0, "price_impact": []}
+        pending = []
+        pending_rows = compacted_rows = 0
+        writer = None
+        rejects_file = open(rejects_path, "w", newline="", encoding="utf-8") if rejects_path else None
+        try:
+            for chunk in pd.read_csv(file_path, dtype=str, na_filter=False, chunksize=chunk_size):
+                missing = [column for column in PRICE_LIST_COLUMNS if column not in chunk]
+                if missing:
+                    raise ValueError(f"{os.path.basename(file_path)} is missing column(s): {', '.join(missing)}.")
+
+                parsed, reasons = validate_price_list(chunk)
+                keys = parsed["Ingredient"].str.casefold()
+                positions = keys.map(catalog_positions)
+                matched = positions.notna().to_numpy()
+                # Another store's price for a catalog ingredient is one of its offers
+                brand_keys = parsed["Store Brand"].str.casefold().to_numpy()
+                offer_lines = np.zeros(len(chunk), dtype=bool)
+                offer_lines[matched] = catalog_brands[positions[matched].astype(int)] != brand_keys[matched]
+
+                rejected = (reasons != "").to_numpy()
+                summary["rows"] += len(chunk)
+                summary["rejected"] += int(rejected.sum())
+                if rejects_file is not None:
+                    if writer is None:
+                        writer = csv.writer(rejects_file)
+                        writer.writerow(["Line", "Reason", *chunk.columns])
+                    writer.writerows(zip((chunk.index[rejected] + 2).tolist(), reasons[rejected].tolist(),
+                                         *(chunk[column][rejected].tolist() for column in chunk.columns)))
+
+                # Accepted lines are boiled down to the latest per ingredient whenever they double, so memory
+                # follows the number of ingredients, not the length of the price list
+                pending.append(parsed[~rejected].assign(key=keys[~rejected], position=positions[~rejected],
+                                                        offer=offer_lines[~rejected],
+                                                        brand_key=np.where(offer_lines, brand_keys, "")[~rejected]))
+                pending_rows += len(pending[-1])
+                if pending_rows > 2 * compacted_rows + chunk_size:
+                    pending = [pd.concat(pending).drop_duplicates(["key", "brand_key"], keep="last")]
+                    pending_rows = compacted_rows = len(pending[0])
+        finally:
+            if rejects_file is not None:
+                rejects_file.close()
+
+        if not pending_rows:
+            return summary
+
+        pending = pd.concat(pending).drop_duplicates(["key", "brand_key"], keep="last")
+        self._import_offers(catalog, pending[pending["offer"]], summary)
+        pending = pending[~pending["offer"]]
+
+        updates = pending[pending["position"].notna()]
+        new_rows = pending[pending["position"].isna()]
+        positions = updates["position"].to_numpy(dtype=int)
+        changed = np.zeros(len(updates), dtype=bool)
+        for column in ["Density (g/ml)", "Store Price (€)", "Store Amount", "Store Unit"]:
+            values = catalog[column].to_numpy(copy=True)
+            new_values = updates[column].to_numpy()
+            if column in PRICE_LIST_NUMBERS:
+                # A blank density in the price list keeps the one already in the catalog
+                if column == "Density (g/ml)":
+                    new_values = np.where(np.isnan(new_values), values[positions], new_values)
+                new_values = new_values.astype(values.dtype)
+                same = (values[positions] == new_values) | (np.isnan(values[positions]) & np.isnan(new_values))
+            else:
+                same = values[positions] == new_values
+            changed |= ~same
+            values[positions] = new_values
+            catalog[column] = values
+
+        summary["updated"] = int(changed.sum())
+        summary["unchanged"] += len(updates) - summary["updated"]
+        summary["added"] = len(new_rows)
+        if not summary["updated"] and not summary["added"]:
+            return summary
+
+        new_rows = new_rows[INGREDIENT_COLUMNS].astype(dict.fromkeys(PRICE_LIST_NUMBERS, "float32"))
+        summary["price_impact"] = self._save_catalog(pd.concat([catalog, new_rows], ignore_index=True))
+        return summary
+
+    def _import_offers(self, catalog, lines, summary):
+        # Upserts the offers by ingredient and store brand; the density stays the catalog ingredient's
+        if lines.empty:
+            return
+
+        offers = self.storage.load_offers().astype({"Store Brand": object, "Store Unit": object})
+        offers = offers.reset_index(drop=True)
+        offer_keys = (offers["Ingredient"].astype(str).str.strip().str.casefold() + "\0"
+                      + offers["Store Brand"].fillna("").astype(str).str.strip().str.casefold())
+        offer_positions = pd.Series(np.arange(len(offers)), index=offer_keys)
+        offer_positions = offer_positions[~offer_keys.duplicated(keep="last").to_numpy()]
+
+        lines = lines.assign(Ingredient=catalog["Ingredient"].to_numpy()[lines["position"].to_numpy(dtype=int)])
+        positions = (lines["key"] + "\0" + lines["brand_key"]).map(offer_positions)
+        updates = lines[positions.notna()]
+        rows = positions[positions.notna()].to_numpy(dtype=int)
+
+        changed = np.zeros(len(updates), dtype=bool)
+        for column in ["Store Price (€)", "Store Amount", "Store Unit"]:
+            values = offers[column].to_numpy(copy=True)
+            new_values = updates[column].to_numpy()
+            if column in PRICE_LIST_NUMBERS:
+                new_values = new_values.astype(values.dtype)
+            changed |= values[rows] != new_values
+            values[rows] = new_values
+            offers[column] = values
+
+        new_offers = lines[positions.isna()][OFFER_COLUMNS]
+        summary["offers"] = int(changed.sum()) + len(new_offers)
+        summary["unchanged"] += len(updates) - int(changed.sum())
+        if summary["offers"]:
+            offers = pd.concat([offers, new_offers.astype(dict.fromkeys(PRICE_LIST_NUMBERS[1:], "float32"))],
+                               ignore_index=True)
+            self.update_offers_file(offers.to_dict(orient="list"))
+
+    def add_change_listener(self, listener):
+        self._change_listeners.append(listener)
+
+    def remove_change_listener(self, listener):
+        self._change_listeners.remove(listener)
+
+    def _change_event(self, source, catalog=False, ingredients=(), products=False, recipes=()):
+        return {
+            "source": source,
+            "catalog": catalog,
+            "ingredients": sorted(ingredients, key=str),
+            "products": products,
+            "recipes": sorted(recipes, key=str)
+        }
+
+    def _emit_change(self, change):
+        for listener in list(self._change_listeners):
+            listener(change)
+
+    def _update_watch_stamps(self, catalog=False, products=False, recipes=()):
+        if self._watch_stamps is None:
+            return
+        if catalog:
+            self._watch_stamps["catalog"] = self.storage.catalog_stamp()
+        if products:
+            self._watch_stamps["products"] = self.storage.products_stamp()
+        if recipes:
+            self._watch_stamps["recipes"].update(self.storage.recipe_stamps(recipes))
+
+    def check_for_changes(self):
+        with self._lock:
+            stamps = {
+                "catalog": self.storage.catalog_stamp(),
+                "products": self.storage.products_stamp(),
+                "recipes": self.storage.recipe_stamps()
+            }
+            old_stamps, self._watch_stamps = self._watch_stamps, stamps
+            if old_stamps is None:
+                try:
+                    self._record_prices(self._get_price_table())
+                except FileNotFoundError:
+                    pass
+                return None
+
+            catalog_changed = stamps["catalog"] != old_stamps["catalog"]
+            products_changed = stamps["products"] != old_stamps["products"]
+            changed_recipes = [
+                product_name for product_name in stamps["recipes"].keys() | old_stamps["recipes"].keys()
+                if stamps["recipes"].get(product_name) != old_stamps["recipes"].get(product_name)
+            ]
+            if not catalog_changed and not products_changed and not changed_recipes:
+                return None
+
+            changed_prices = set()
+            if catalog_changed:
+                old_price_table = self._price_table
+                self.invalidate_cache()
+                try:
+                    new_price_table = self._get_price_table()
+                except FileNotFoundError:
+                    new_price_table = None
+                if new_price_table is None:
+                    changed_prices = set(old_price_table[0]) if old_price_table is not None else set()
+                else:
+                    self._record_prices(new_price_table)
+                    if old_price_table is not None:
+                        changed_prices = changed_ingredients(old_price_table, new_price_table)
+
+            if products_changed:
+                self._product_index = None
+                self._unit_costs.clear()
+            self._invalidate_unit_costs(changed_recipes)
+
+            if self._usage_index is not None:
+                for product_name in changed_recipes:
+                    self._unindex_recipe(product_name)
+                    try:
+                        self._index_recipe(product_name, self.storage.load_recipe_columns(product_name))
+                    except FileNotFoundError:
+                        continue
+
+        change = self._change_event("external", catalog_changed, changed_prices, products_changed, changed_recipes)
+        self._emit_change(change)
+        return change
+
+    def _get_usage_index(self):
+        with self._lock:
+            if self._usage_index is None:
+                self._usage_index = {}
+                self._indexed_recipes = {}
+                for product_name, recipe in self.storage.load_all_recipes().items():
+                    self._index_recipe(product_name, recipe)
+            return self._usage_index
+
+    def _index_recipe(self, product_name, recipe):
+        self._indexed_recipes[product_name] = {column: _column_values(recipe[column]) for column in RECIPE_COLUMNS}
+        self._indexed_recipes[product_name]["Amount Used"] = pd.to_numeric(
+            np.asarray(recipe["Amount Used"], dtype=object), errors="coerce"
+        ).astype(float).tolist()
+        for line, ingredient_name in enumerate(self._indexed_recipes[product_name]["Ingredient"]):
+            self._usage_index.setdefault(ingredient_name, {}).setdefault(product_name, []).append(line)
+
+    def _unindex_recipe(self, product_name):
+        recipe = self._indexed_recipes.pop(product_name, None)
+        if recipe is None:
+            return
+        for ingredient_name in set(recipe["Ingredient"]):
+            products = self._usage_index.get(ingredient_name, {})
+            products.pop(product_name, None)
+            if not products:
+                self._usage_index.pop(ingredient_name, None)
+
+    def invalidate_usage_index(self):
+        with self._lock:
+            self._usage_index = None
+            self._indexed_recipes = {}
+
+    def _get_unit_costs(self, price_table):
+        if self._unit_cost_table is not price_table:
+            if self._unit_cost_table is not None and self._unit_costs:
+                self._invalidate_unit_costs(changed_ingredients(self._unit_cost_table, price_table))
+            self._unit_cost_table = price_table
+        return self._unit_costs
+
+    def _invalidate_unit_costs(self, names):
+        # Drop the memoized sub-recipe costs that use any of names, then everything built on those, and so on up
+        stale = set()
+        frontier = set(names)
+        while frontier:
+            stale.update(name for name in frontier if name in self._unit_costs)
+            frontier = {product_name for name in frontier
+                        for product_name in self._unit_costs.used_by.get(name, ())}.difference(stale)
+        for product_name in stale:
+            del self._unit_costs[product_name]
+
+    def _cost_recipe_tree(self, price_table, recipe, unit_costs=None):
+        if unit_costs is None:
+            unit_costs = self._get_unit_costs(price_table)
+        return cost_recipe_tree(price_table, recipe, unit_costs, self.storage.get_product,
+                                self.storage.load_recipe_columns)
+
+    def _get_cost_cache(self):
+        with self._lock:
+            if not self.use_cost_cache:
+                return None
+
+            db_path = f"{self.storage.path}/{CostCache.cache_file}"
+            if self._cost_cache is None or self._cost_cache.db_path != db_path:
+                try:
+                    self._cost_cache = CostCache(db_path)
+                    self._cost_cache.connection
+                except sqlite3.Error as e:
+                    print(f"Error opening the cost cache: {e}.", file=sys.stderr)
+                    self.use_cost_cache = False
+                    self._cost_cache = None
+                    return None
+            self._cost_cache.verify = self.verify_cost_cache
+            return self._cost_cache
+
+    def _get_price_history(self):
+        with self._lock:
+            if self._price_history is None or self._price_history.path != self.storage.path:
+                self._price_history = PriceHistory(self.storage.path)
+            return self._price_history
+
+    def _record_prices(self, price_table):
+        # Snapshots the prices if they differ from the last snapshot, or as the first one
+        if not price_table[0]:
+            return
+        try:
+            self._get_price_history().record(price_table)
+        except OSError as e:
+            print(f"Error recording the price history: {e}.", file=sys.stderr)
+
+    def get_cost_history(self, product_names=None):
+        # Production cost per piece of each product at every price snapshot, the current prices included
+        with self._lock:
+            try:
+                self._record_prices(self._get_price_table())
+            except FileNotFoundError:
+                pass
+            indexed_recipes = dict(self._indexed_recipes) if self._usage_index is not None else {}
+
+        times, names, prices = self._get_price_history().price_tensor()
+        positions = {name: pos for pos, name in enumerate(names)}
+        products = self.storage.load_products().drop_duplicates("Product").set_index("Product")["Pieces Made"].to_dict()
+        product_names = list(products) if product_names is None else list(product_names)
+        for product_name in product_names:
+            if product_name not in products:
+                raise ValueError(f"Product \"{product_name}\" not found.")
+
+        # Only the asked products' recipes and the sub-recipes below them are read
+        recipes = {}
+        pending = list(product_names)
+        while pending:
+            product_name = pending.pop()
+            if product_name in recipes:
+                continue
+            recipe = indexed_recipes.get(product_name)
+            if recipe is None:
+                try:
+                    recipe = self.storage.load_recipe_columns(product_name)
+                except FileNotFoundError:
+                    pass
+            recipes[product_name] = recipe
+            if recipe is not None:
+                pending.extend(name for name in set(_column_values(recipe["Ingredient"]))
+                               if name in products and name not in positions)
+
+        pieces_made = {product_name: products[product_name] for product_name in recipes}
+        quantities, _, cyclic = build_recipe_quantities(positions, list(recipes.values()), pieces_made)
+        codes = quantities["product"].to_numpy()
+        order = np.argsort(codes, kind="stable")
+        # line_costs[line, snapshot], each line's cost at every snapshot at once; unpriced lines cost nothing
+        line_costs = prices.transpose(1, 2, 0)[quantities["ingredient"].to_numpy()[order],
+                                               quantities["basis"].to_numpy()[order]]
+        line_costs *= quantities["quantity"].to_numpy()[order, None]
+        np.copyto(line_costs, 0.0, where=np.isnan(line_costs))
+
+        costs = np.zeros((len(recipes), len(times)))
+        if len(order):
+            codes = codes[order]
+            starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]])
+            costs[codes[starts]] = np.add.reduceat(line_costs, starts, axis=0)
+
+        costs *= np.array([product_prices(1.0, pieces, None)[0] for pieces in pieces_made.values()])[:, None]
+        costs[[code for code, recipe in enumerate(recipes.values()) if recipe is None]] = np.nan
+        costs[cyclic] = np.nan
+
+        columns = {product_name: code for code, product_name in enumerate(recipes)}
+        return pd.DataFrame(costs[[columns[product_name] for product_name in product_names]].T,
+                            index=pd.DatetimeIndex(pd.to_datetime(times, unit="s"), name="Snapshot"),
+                            columns=product_names)
+
+    def get_unit_cost(self, product_name):
+        with self._lock:
+            price_table = self._get_price_table()
+            return recipe_unit_cost(product_name, price_table, self._get_unit_costs(price_table),
+                                    self.storage.get_product, self.storage.load_recipe_columns)
+
+    def get_products_using(self, ingredient_name):
+        with self._lock:
+            products = self._get_usage_index().get(ingredient_name, {})
+            return {product_name: list(lines) for product_name, lines in products.items()}
+
+    def get_price_impact(self, old_price_table, new_price_table):
+        with self._lock:
+            return self._get_price_impact(old_price_table, new_price_table)
+
+    def _get_price_impact(self, old_price_table, new_price_table, changed=None):
+        usage_index = self._get_usage_index()
+        if changed is None:
+            changed = changed_ingredients(old_price_table, new_price_table)
+
+        affected = {}
+        frontier = list(changed)
+        while frontier:
+            ingredient_name = frontier.pop()
+            for product_name in usage_index.get(ingredient_name, {}):
+                if product_name not in affected:
+                    frontier.append(product_name)
+                affected.setdefault(product_name, set()).add(ingredient_name)
+
+        product_rows = {product_name: self.storage.get_product(product_name) for product_name in affected}
+        products = [product_name for product_name, product_row in product_rows.items() if product_row is not None]
+        lines = {column: [] for column in RECIPE_COLUMNS}
+        line_products = []
+        for pos, product_name in enumerate(products):
+            recipe = self._indexed_recipes[product_name]
+            for column in RECIPE_COLUMNS:
+                lines[column].extend(recipe[column])
+            line_products.extend([pos] * len(recipe["Ingredient"]))
+
+        old_costs, _ = self._cost_recipe_tree(old_price_table, lines, {})
+        new_costs, _ = self._cost_recipe_tree(new_price_table, lines)
+        old_costs = np.bincount(line_products, weights=np.nan_to_num(old_costs), minlength=len(products))
+        new_costs = np.bincount(line_products, weights=np.nan_to_num(new_costs), minlength=len(products))
+
+        report = []
+        for product_name, old_cost, new_cost in zip(products, old_costs.tolist(), new_costs.tolist()):
+            _, old_price = product_prices(old_cost, *product_rows[product_name])
+            _, new_price = product_prices(new_cost, *product_rows[product_name])
+
+            report.append({
+                "Product": product_name,
+                "Changed Ingredients": sorted(affected[product_name], key=str),
+                "Old Cost (€)": round(old_cost, 4),
+                "New Cost (€)": round(new_cost, 4),
+                "Old Price (€)": round(old_price, 4),
+                "New Price (€)": round(new_price, 4),
+                "Change (€)": round(new_cost - old_cost, 4),
+                "Change (%)": round((new_cost - old_cost) / old_cost * 100, 2) if old_cost else None
+            })
+
+        report.sort(key=lambda row: abs(row["Change (€)"]), reverse=True)
+        return report
 
     def get_products_list(self):
-        df = pd.read_csv(f"{self.path}/{self.products_file}")
+        df = self.storage.load_products()
         product_list = df["Product"].values.tolist()
         return product_list
 
     def get_ingredient_list(self):
-        df = pd.read_csv(f"{self.path}/{self.ingredients_file}")
+        df = self._get_catalog()
         ingredient_list = df["Ingredient"].values.tolist()
         return ingredient_list
 
-    def get_ingredient_cost(self, ingredient_name, ingredient_unit):
-        df = pd.read_csv(f"{self.path}/{self.ingredients_file}")
+    def get_ingredient_index(self):
+        with self._lock:
+            catalog = self._get_catalog()
+            version = self.catalog_version
+            if self._ingredient_index is not None and self._ingredient_index_version == version:
+                return self._ingredient_index
+
+        index = SearchIndex(catalog["Ingredient"].tolist())
+        with self._lock:
+            if self.catalog_version == version:
+                self._ingredient_index, self._ingredient_index_version = index, version
+        return index
+
+    def get_product_index(self):
+        with self._lock:
+            if self._product_index is not None and self.watching:
+                return self._product_index
+            stamp = self.storage.products_stamp()
+            if self._product_index is not None and stamp is not None and stamp == self._product_index_stamp:
+                return self._product_index
+
+        index = SearchIndex(self.get_products_list())
+        with self._lock:
+            self._product_index, self._product_index_stamp = index, stamp
+        return index
+
+    def search_ingredients(self, text, limit=10):
+        return self.get_ingredient_index().search(text, limit)
 
-        ingredient_row = None
-        for i, row in df.iterrows():
-            if row["Ingredient"] == ingredient_name:
-                density = df.at[i, "Density (g/ml)"]
-                price = df.at[i, "Store Price (€)"]
-                amount = df.at[i, "Store Amount"]
-                unit = df.at[i, "Store Unit"]
-                ingredient_row = row
-                break
+    def search_products(self, text, limit=10):
+        return self.get_product_index().search(text, limit)
 
-        if ingredient_row is None:
+    def get_ingredient_cost(self, ingredient_name, ingredient_unit, offer=None):
+        if offer is not None:
+            return self._get_offer_cost(ingredient_name, ingredient_unit, offer)
+
+        unit_prices = self._get_price_index().get(ingredient_name)
+        if unit_prices is None or ingredient_unit not in RECIPE_UNITS:
             return None
 
-        price_per_g = None
-        price_per_ml = None
-        price_per_pc = None
-
-        if unit == "g":
-            price_per_g = price / amount
-            price_per_ml = price / amount * density
-        elif unit == "kg":
-            price_per_g = price / amount / 1E3
-            price_per_ml = price / amount / 1E3 * density
-        elif unit == "ml":
-            price_per_g = price / amount / density if density > 0 else None
-            price_per_ml = price / amount
-        elif unit == "l":
-            price_per_g = price / amount / 1E3 / density if density > 0 else None
-            price_per_ml = price / amount / 1E3
-        elif unit == "lb":
-            price_per_g = price / amount / 453.592
-            price_per_ml = price / amount / 453.592 * density
-        elif unit == "oz":
-            price_per_g = price / amount / 28.3495
-            price_per_ml = price / amount / 28.3495 * density
-        elif unit == "pc":
-            price_per_pc = price / amount
-        else:
+        basis, factor = RECIPE_UNITS[ingredient_unit]
+        price = unit_prices[basis]
+        if factor == 1:
+            return price
+
+        return price * factor if price else None
+
+    def _get_offer_cost(self, ingredient_name, ingredient_unit, offer):
+        positions, prices = self._get_offer_table(offer)
+        pos = positions.get(ingredient_name)
+        if pos is None or ingredient_unit not in RECIPE_UNITS:
             return None
 
-        if ingredient_unit == "g":
-            cost = price_per_g
-        elif ingredient_unit == "kg":
-            cost = price_per_g * 1E3 if price_per_g else None
-        elif ingredient_unit == "lb":
-            cost = price_per_g * 453.592 if price_per_g else None
-        elif ingredient_unit == "oz":
-            cost = price_per_g * 28.3495 if price_per_g else None
-        elif ingredient_unit == "ml":
-            cost = price_per_ml
-        elif ingredient_unit == "l":
-            cost = price_per_ml * 1E3 if price_per_ml else None
-        elif ingredient_unit == "cup":
-            cost = price_per_ml * 236.588 if price_per_ml else None
-        elif ingredient_unit == "tsp":
-            cost = price_per_ml * 4.92892 if price_per_ml else None
-        elif ingredient_unit == "tbsp":
-            cost = price_per_ml * 14.7868 if price_per_ml else None
-        elif ingredient_unit == "pc":
-            cost = price_per_pc
-        else:
+        basis, factor = RECIPE_UNITS[ingredient_unit]
+        price = float(prices[pos, PRICE_BASES.index(basis)])
+        if np.isnan(price):
             return None
+        if factor == 1:
+            return price
 
-        return cost
+        return price * factor if price else None
 
-    def get_product_data(self, product_name):
-        products_df = pd.read_csv(f"{self.path}/{self.products_file}")
+    def cost_recipe(self, recipe_df, offer=None):
+        # Sub-recipe costs are only memoized for the catalog offers
+        with self._lock:
+            costs, status = self._cost_recipe_tree(self._get_offer_table(offer), recipe_df,
+                                                   None if offer is None else {})
+        invalid_rows = np.flatnonzero(status)
 
-        product_row = None
-        for i, row in products_df.iterrows():
-            if row["Product"] == product_name:
-                pieces_made = products_df.at[i, "Pieces Made"]
-                multiplier = products_df.at[i, "Multiplier"]
-                product_row = row
-                break
+        return {
+            "costs": costs,
+            "status": [LINE_STATUSES[code] for code in status],
+            "total_cost": float(np.nansum(costs)),
+            "invalid_rows": invalid_rows.tolist()
+        }
 
+    def get_product_data(self, product_name):
+        product_row = self.storage.get_product(product_name)
         if product_row is None:
             return None
+        pieces_made, multiplier = product_row
 
         try:
-            recipe_df = pd.read_csv(f"{self.path}/products/{product_name}.csv")
+            recipe_df = self.storage.load_recipe(product_name)
         except FileNotFoundError:
             return None
+        except ValueError:
+            raise
         except Exception as e:
             print(f"Error loading product data: {e}.")
             return None
 
+        with self._lock:
+            try:
+                price_table = self._get_price_table()
+            except FileNotFoundError:
+                price_table = build_price_table({})
+            cost_cache = self._get_cost_cache()
+            if cost_cache is None:
+                costs, status = self._cost_recipe_tree(price_table, recipe_df)
+            else:
+                costs, status = cached_recipe_costs(product_name, price_table, self._get_unit_costs(price_table),
+                                                    self.storage, cost_cache, recipe_df)
+                cost_cache.flush()
+
         return {
             "pieces_made": pieces_made,
             "multiplier": multiplier,
-            "ingredients": recipe_df
+            "ingredients": recipe_df,
+            "costs": costs,
+            "status": [LINE_STATUSES[code] for code in status],
+            "total_cost": float(np.nansum(costs))
+        }
+
+    def plan_production(self, orders):
+        if isinstance(orders, dict):
+            orders = list(orders.items())
+        orders = pd.DataFrame(orders, columns=["Product", "Quantity"])
+        quantities = pd.to_numeric(orders["Quantity"], errors="coerce")
+        valid = quantities > 0
+        demand = quantities[valid].groupby(orders["Product"][valid], sort=False).sum().to_dict()
+
+        with self._lock:
+            catalog = self._get_catalog()
+            price_table = self._get_price_table()
+            unit_table = self._get_store_unit_table()
+            indexed_recipes = dict(self._indexed_recipes) if self._usage_index is not None else {}
+
+        products_df = self.storage.load_products()
+        products = products_df.drop_duplicates("Product").set_index("Product")["Pieces Made"].to_dict()
+        names, costs, store_units = [], [], []
+        invalid_lines = []
+        unknown_products = set()
+        level = 0
+        # Sub-recipe lines turn into demand for that product, planned one level further down
+        while demand:
+            level += 1
+            if level > len(products):
+                raise ValueError(f"Recipe cycle among: {', '.join(sorted(map(str, demand)))}.")
+
+            lines = {column: [] for column in RECIPE_COLUMNS}
+            line_products, line_scales = [], []
+            for product_name, pieces in demand.items():
+                recipe = indexed_recipes.get(product_name)
+                try:
+                    if recipe is None and product_name in products:
+                        recipe = self.storage.load_recipe_columns(product_name)
+                except FileNotFoundError:
+                    pass
+                if recipe is None or product_name not in products:
+                    unknown_products.add(product_name)
+                    continue
+
+                pieces_made = products[product_name]
+                pieces_made = 1.0 if pd.isna(pieces_made) or pieces_made <= 0 else float(pieces_made)
+                for column in RECIPE_COLUMNS:
+                    lines[column].extend(_column_values(recipe[column]))
+                line_products.extend([product_name] * len(recipe["Ingredient"]))
+                line_scales.extend([pieces / pieces_made] * len(recipe["Ingredient"]))
+
+            lines["Amount Used"] = pd.to_numeric(np.asarray(lines["Amount Used"], dtype=object), errors="coerce")
+            lines["Amount Used"] = np.asarray(lines["Amount Used"], dtype=float)
+            line_costs, status = cost_recipe_lines(price_table, lines)
+            line_units, _ = cost_recipe_lines(unit_table, lines)
+            scales = np.array(line_scales, dtype=float)
+            ok = status == 0
+            names.extend(np.array(lines["Ingredient"], dtype=object)[ok].tolist())
+            costs.append(line_costs[ok] * scales[ok])
+            store_units.append(line_units[ok] * scales[ok])
+
+            demand = {}
+            amounts = lines["Amount Used"]
+            for line in np.flatnonzero(~ok).tolist():
+                ingredient_name, unit = lines["Ingredient"][line], lines["Amount Unit"][line]
+                line_status = LINE_STATUSES[status[line]]
+                if status[line] == 1 and ingredient_name in products:
+                    if unit != "pc":
+                        line_status = LINE_STATUSES[4]
+                    elif not amounts[line] >= 0:
+                        line_status = LINE_STATUSES[3]
+                    else:
+                        demand[ingredient_name] = demand.get(ingredient_name, 0.0) + amounts[line] * scales[line]
+                        continue
+                invalid_lines.append({"Product": line_products[line], "Ingredient": ingredient_name,
+                                      "Status": line_status})
+
+        codes, ingredients = pd.factorize(pd.Series(names, dtype=object))
+        costs = np.bincount(codes, weights=np.concatenate(costs) if costs else None, minlength=len(ingredients))
+        needed = np.bincount(codes, weights=np.concatenate(store_units) if store_units else None,
+                             minlength=len(ingredients))
+
+        stores = catalog.drop_duplicates("Ingredient").set_index("Ingredient").reindex(ingredients)
+        store_amounts = np.array(decimal_floats(stores["Store Amount"]), dtype=float)
+        store_prices = np.array(decimal_floats(stores["Store Price (€)"]), dtype=float)
+        # Rounding first keeps float noise (2.0000000001 packs) from buying a whole extra pack
+        packs = np.ceil(np.round(needed / store_amounts, 9))
+
+        shopping_list = pd.DataFrame({
+            "Ingredient": ingredients.to_numpy(dtype=object),
+            "Store Brand": stores["Store Brand"].astype(object).to_numpy(),
+            "Amount Needed": needed.round(4),
+            "Store Unit": stores["Store Unit"].astype(object).to_numpy(),
+            "Store Amount": store_amounts,
+            "Packs": pd.Series(np.where(np.isfinite(packs), packs, np.nan)).astype("Int64"),
+            "Store Price (€)": store_prices,
+            "Cost (€)": costs.round(4),
+            "Pack Cost (€)": (packs * store_prices).round(4)
+        }, columns=PLAN_COLUMNS).sort_values("Ingredient", ignore_index=True)
+
+        return {
+            "shopping_list": shopping_list,
+            "total_cost": float(costs.sum()),
+            "pack_cost": float((packs * store_prices).sum()),
+            "unknown_products": sorted(unknown_products, key=str),
+            "invalid_lines": invalid_lines
         }
 
+    def simulate_margins(self, scenarios=10000, volatility=0.1, distribution="lognormal", volatilities=None,
+                         shocks=None, percentiles=(5, 50, 95), seed=None, processes=None, chunk_size=500):
+        if distribution not in SIMULATION_DISTRIBUTIONS:
+            raise ValueError(f"Unknown price distribution \"{distribution}\".")
+
+        with self._lock:
+            price_table = self._get_price_table()
+            indexed_recipes = dict(self._indexed_recipes) if self._usage_index is not None else {}
+
+        products_df = self.storage.load_products().drop_duplicates("Product")
+        product_names = products_df["Product"].tolist()
+        recipes, statuses = [], []
+        for product_name in product_names:
+            recipe, status = indexed_recipes.get(product_name), "ok"
+            if recipe is None:
+                try:
+                    recipe = self.storage.load_recipe_columns(product_name)
+                except FileNotFoundError:
+                    status = "missing recipe"
+                except Exception as e:
+                    status = f"unreadable recipe: {e}"
+            recipes.append(recipe)
+            statuses.append(status)
+        exposures, invalid_lines, cyclic = build_cost_exposures(price_table, recipes,
+                                                                dict(zip(product_names, products_df["Pieces Made"])))
+        statuses = ["recipe cycle" if status == "ok" and is_cyclic else status
+                    for status, is_cyclic in zip(statuses, cyclic.tolist())]
+
+        positions = price_table[0]
+        ingredient_volatilities = np.full(len(positions), float(volatility))
+        ingredient_shocks = np.zeros(len(positions))
+        for values, settings in [(ingredient_volatilities, volatilities), (ingredient_shocks, shocks)]:
+            for ingredient_name, value in (settings or {}).items():
+                if ingredient_name not in positions:
+                    raise ValueError(f"Ingredient \"{ingredient_name}\" not found.")
+                values[positions[ingredient_name]] = value
+
+        # Only the ingredients some recipe uses get drawn; workers redraw the same ratios from the seed
+        used = np.flatnonzero(exposures.any(axis=0))
+        exposures = exposures[:, used]
+        if seed is None:
+            seed = np.random.SeedSequence().entropy
+        ratio_args = (ingredient_volatilities[used], ingredient_shocks[used], scenarios, distribution, seed)
+
+        pieces_made = pd.to_numeric(products_df["Pieces Made"], errors="coerce").fillna(1.0).to_numpy(dtype=float)
+        multipliers = pd.to_numeric(products_df["Multiplier"], errors="coerce").fillna(1.0).to_numpy(dtype=float)
+        piece_scales = np.divide(1.0, pieces_made, out=np.zeros(len(pieces_made)), where=pieces_made > 0)
+        production_costs = exposures.sum(axis=1) * piece_scales
+        prices = production_costs * multipliers
+
+        # Margin percentiles mirror the cost ones, as the price stays put while the cost moves
+        percentiles = [float(q) for q in percentiles]
+        levels = sorted(set(percentiles) | {100.0 - q for q in percentiles})
+        chunks = [(exposures[i:i + chunk_size], piece_scales[i:i + chunk_size], prices[i:i + chunk_size], levels)
+                  for i in range(0, len(product_names), chunk_size)]
+        if processes == 1 or len(chunks) <= 1:
+            _init_simulation_worker(ratio_args)
+            results = [_simulate_products(*chunk) for chunk in chunks]
+        else:
+            from concurrent.futures import ProcessPoolExecutor
+            with ProcessPoolExecutor(max_workers=processes, initializer=_init_simulation_worker,
+                                     initargs=(ratio_args,)) as executor:
+                results = list(executor.map(_simulate_products, *zip(*chunks)))
+
+        cost_levels = np.concatenate([result[0] for result in results]) if results else np.empty((0, len(levels)))
+        loss_chances = np.concatenate([result[1] for result in results]) if results else np.empty(0)
+        margins = pd.DataFrame({
+            "Product": product_names,
+            "Pieces Made": products_df["Pieces Made"].to_numpy(),
+            "Multiplier": products_df["Multiplier"].to_numpy(),
+            "Production Cost (€)": production_costs.round(4),
+            "Product Price (€)": prices.round(4)
+        })
+        for q in percentiles:
+            margins[f"Cost P{q:g} (€)"] = cost_levels[:, levels.index(q)].round(4)
+        for q in percentiles:
+            margins[f"Margin P{q:g} (€)"] = (prices - cost_levels[:, levels.index(100.0 - q)]).round(4)
+        margins["Loss Chance"] = loss_chances.round(4)
+        margins.loc[[status != "ok" for status in statuses], margins.columns[3:]] = np.nan
+        margins["Invalid Lines"] = pd.array([count if recipe is not None else None
+                                             for count, recipe in zip(invalid_lines.tolist(), recipes)], dtype="Int64")
+        margins["Status"] = statuses
+
+        return {"margins": margins, "scenarios": scenarios, "seed": seed}
+
     def save_product_data(self, product_data):
         product_name = product_data["product_name"]
         pieces_made = product_data["pieces_made"]
         multiplier = product_data["multiplier"]
         recipe_list = product_data["ingredients"]
-        try:
-            products_df = pd.read_csv(f"{self.path}/{self.products_file}")
-        except FileNotFoundError:
-            products_df = pd.DataFrame(columns=["Product", "Pieces Made", "Multiplier"])
-        products_df = products_df[products_df["Product"] != product_name]
 
-        new_row = pd.DataFrame([{
-            "Product": product_name,
-            "Pieces Made": pieces_made,
-            "Multiplier": multiplier
-        }])
-        products_df = pd.concat([products_df, new_row], ignore_index=True)
-        products_df.to_csv(f"{self.path}/{self.products_file}", index=False)
+        recipe_df = pd.DataFrame.from_records(recipe_list, columns=RECIPE_COLUMNS)
+
+        with self._lock:
+            cycle = find_recipe_cycle(product_name, recipe_df, self._get_price_table(), self.storage.get_product,
+                                      self.storage.load_recipe_columns)
+            if cycle:
+                raise ValueError(f"Product \"{product_name}\" can't use itself as a sub-recipe ({' → '.join(cycle)}).")
 
-        os.makedirs(f"{self.path}/products", exist_ok=True)
+            if not self.storage.save_product(product_name, pieces_made, multiplier, recipe_df):
+                return
+            if self._usage_index is not None:
+                self._unindex_recipe(product_name)
+                self._index_recipe(product_name, recipe_df)
+            self._invalidate_unit_costs([product_name])
+            self._product_index = None
+            self._update_watch_stamps(products=True, recipes=[product_name])
 
-        recipe_df = pd.DataFrame.from_dict(recipe_list)
-        recipe_df.to_csv(f"{self.path}/products/{product_name}.csv", index=False)
+        self._emit_change(self._change_event("save", products=True, recipes=[product_name]))
 
     def delete_product_data(self, product_name):
-        try:
-            products_df = pd.read_csv(f"{self.path}/{self.products_file}")
-        except FileNotFoundError:
-            raise FileNotFoundError("Products file not found.")
+        with self._lock:
+            self.storage.delete_product(product_name)
+            if self._usage_index is not None:
+                self._unindex_recipe(product_name)
+            self._invalidate_unit_costs([product_name])
+            self._product_index = None
+            self._update_watch_stamps(products=True, recipes=[product_name])
+
+        self._emit_change(self._change_event("save", products=True, recipes=[product_name]))
+
+    def cost_all_products(self, processes=None, chunk_size=64, offer=None):
+        products_df = self.storage.load_products()
+        products = list(zip(
+            products_df["Product"].astype(str).tolist(),
+            products_df["Pieces Made"].tolist(),
+            products_df["Multiplier"].tolist()
+        ))
+        chunks = [products[i:i + chunk_size] for i in range(0, len(products), chunk_size)]
+        with self._lock:
+            price_table = self._get_offer_table(offer)
+            unit_costs = dict(self._get_unit_costs(price_table)) if offer is None else {}
+            cost_cache = self._get_cost_cache()
+
+        # Set up before the first result is asked for, so an unknown offer fails before any output is written
+        return self._cost_chunks(chunks, price_table, unit_costs, cost_cache, processes)
+
+    def _cost_chunks(self, chunks, price_table, unit_costs, cost_cache, processes):
+        if processes == 1 or len(chunks) <= 1:
+            _init_cost_worker(price_table, unit_costs, cost_cache)
+            for chunk in chunks:
+                yield from _cost_products(self.storage, chunk)
+            return
+
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=processes, initializer=_init_cost_worker,
+                                 initargs=(price_table, unit_costs, cost_cache)) as executor:
+            for results in executor.map(_cost_products, [self.storage] * len(chunks), chunks):
+                yield from results
+
+if AppProfile.enabled:
+    AppProfile.instrument_class(AppMain)
+
+COST_FIELDS = ["Product", "Pieces Made", "Multiplier", "Total Cost (€)", "Production Cost (€)", "Product Price (€)",
+               "Invalid Lines", "Status"]
+
+def _blank_non_finite(result):
+    # Blank and uncostable numbers are written as null in JSON, which has no NaN, and as empty CSV fields
+    return {key: None if isinstance(value, float) and not math.isfinite(value) else value
+            for key, value in result.items()}
+
+def write_costs(results, output, output_format):
+    count = 0
+    if output_format == "jsonl":
+        for result in results:
+            output.write(json.dumps(_blank_non_finite(result), ensure_ascii=False, allow_nan=False) + "\n")
+            count += 1
+    else:
+        writer = csv.DictWriter(output, fieldnames=COST_FIELDS)
+        writer.writeheader()
+        for result in results:
+            writer.writerow(_blank_non_finite(result))
+            count += 1
+    return count
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m AppMain", description="Dahlia's Delights headless tools")
+    parser.add_argument("--path", default=os.getcwd(), help="directory holding Ingredients.csv and Products.csv")
+    parser.add_argument("--db", help="use this SQLite database instead of the CSV files")
+    subparsers = parser.add_subparsers(dest="command", required=True)
 
-        if product_name not in products_df["Product"].values:
-            raise ValueError(f"Product \"{product_name}\" not found.")
+    cost_all_parser = subparsers.add_parser("cost-all", help="cost every product in Products.csv")
+    cost_all_parser.add_argument("-o", "--output", help="output file (default: stdout)")
+    cost_all_parser.add_argument("-f", "--format", choices=["csv", "jsonl"],
+                                 help="output format (default: from the output file extension, else csv)")
+    cost_all_parser.add_argument("-j", "--processes", type=int, default=None,
+                                 help="worker processes (default: one per CPU, 1 runs in-process)")
+    cost_all_parser.add_argument("--chunk-size", type=int, default=64, help="products per worker task")
+    cost_all_parser.add_argument("--offer", help="price from the \"cheapest\" offer per ingredient, or from this store "
+                                                 "brand's offers where it has one (default: the catalog offers)")
+    cost_all_parser.add_argument("--no-cache", action="store_true", help="don't read or write the cost cache")
+    cost_all_parser.add_argument("--verify-cache", action="store_true",
+                                 help="check every cached cost against a fresh one and replace the stale ones "
+                                      "(runs in-process)")
 
-        products_df = products_df[products_df["Product"] != product_name]
-        products_df.to_csv(f"{self.path}/{self.products_file}", index=False)
+    migrate_parser = subparsers.add_parser("migrate-sqlite", help="copy the CSV files into an SQLite database")
+    migrate_parser.add_argument("target_db", help="SQLite database to create or update")
 
-        recipe_file = f"{self.path}/products/{product_name}.csv"
-        if os.path.exists(recipe_file):
-            os.remove(recipe_file)
+    subparsers.add_parser("migrate-recipes", help="consolidate products/*.csv into the columnar recipe store")
+
+    import_parser = subparsers.add_parser("import-prices", help="update the ingredients from a supplier price list, "
+                                                                "adding other stores' prices as offers")
+    import_parser.add_argument("price_list", help="CSV file with Ingredient, Store Brand, Store Price (€), "
+                                                  "Store Amount, Store Unit and optionally Density (g/ml) columns")
+    import_parser.add_argument("--rejects", help="write the rejected lines and their reasons to this CSV file")
+    import_parser.add_argument("--chunk-size", type=int, default=50000, help="price list lines read at a time")
+
+    plan_parser = subparsers.add_parser("plan", help="turn an order book into a shopping list")
+    plan_parser.add_argument("orders", help="CSV file with Product and Quantity columns")
+    plan_parser.add_argument("-o", "--output", help="shopping list CSV file (default: stdout)")
+
+    simulate_parser = subparsers.add_parser("simulate", help="simulate ingredient price swings and report "
+                                                             "percentiles of product costs and margins")
+    simulate_parser.add_argument("-n", "--scenarios", type=int, default=10000, help="price scenarios to draw")
+    simulate_parser.add_argument("--distribution", choices=SIMULATION_DISTRIBUTIONS, default="lognormal",
+                                 help="distribution of the price ratios (default: lognormal)")
+    simulate_parser.add_argument("--volatility", type=float, default=0.1,
+                                 help="spread of the price ratios around 1 (default: 0.1 = 10%%)")
+    simulate_parser.add_argument("--ingredient-volatility", action="append", default=[], metavar="NAME=VOLATILITY",
+                                 help="spread for one ingredient (repeatable)")
+    simulate_parser.add_argument("--shock", action="append", default=[], metavar="NAME=CHANGE",
+                                 help="shift one ingredient's price in every scenario, e.g. Butter=0.3 (repeatable)")
+    simulate_parser.add_argument("-p", "--percentiles", type=float, nargs="+", default=[5, 50, 95],
+                                 help="percentiles to report (default: 5 50 95)")
+    simulate_parser.add_argument("--seed", type=int, help="random seed (default: random)")
+    simulate_parser.add_argument("-j", "--processes", type=int, default=1,
+                                 help="worker processes (default: 1, in-process)")
+    simulate_parser.add_argument("-o", "--output", help="output CSV file (default: stdout)")
+
+    offers_parser = subparsers.add_parser("offers", help="list the store offers of ingredients, or replace them "
+                                                         "from a CSV file")
+    offers_parser.add_argument("ingredients", nargs="*", help="ingredients to list (default: all)")
+    offers_parser.add_argument("--unit", choices=list(RECIPE_UNITS),
+                               help="only list the offer each ingredient is priced from in this recipe unit")
+    offers_parser.add_argument("--offer", default="cheapest", help="with --unit, the \"cheapest\" offer or this store "
+                                                                   "brand's offer where it has one (default: cheapest)")
+    offers_parser.add_argument("--import", dest="offers_file", metavar="FILE",
+                               help="replace the offers with this CSV file's Ingredient, Store Brand, Store Price (€), "
+                                    "Store Amount and Store Unit columns")
+    offers_parser.add_argument("-o", "--output", help="output CSV file (default: stdout)")
+
+    history_parser = subparsers.add_parser("history", help="production cost per piece of products at every price "
+                                                           "snapshot, recorded whenever the catalog prices change")
+    history_parser.add_argument("products", nargs="*", help="products to cost (default: all)")
+    history_parser.add_argument("-o", "--output", help="output CSV file (default: stdout)")
+
+    args = parser.parse_args(argv)
+
+    app_main = AppMain(SqliteStorage(args.db) if args.db else open_storage(args.path))
+
+    if args.command == "migrate-sqlite":
+        count = copy_storage(app_main.storage, SqliteStorage(args.target_db))
+        print(f"Copied {count} products to {args.target_db}.", file=sys.stderr)
+    elif args.command == "migrate-recipes":
+        count = ColumnarStorage(args.path).import_recipes(CsvStorage(args.path))
+        print(f"Consolidated {count} recipes into {args.path}/{ColumnarStorage.recipes_index_file}.", file=sys.stderr)
+    elif args.command == "import-prices":
+        summary = app_main.import_price_list(args.price_list, args.rejects, args.chunk_size)
+        print(f"Read {summary['rows']} lines: {summary['updated']} updated, {summary['unchanged']} unchanged, "
+              f"{summary['added']} added, {summary['offers']} store offers added or updated, "
+              f"{summary['rejected']} rejected.", file=sys.stderr)
+        if summary["price_impact"]:
+            print(f"Product costs changed for {len(summary['price_impact'])} product(s).", file=sys.stderr)
+    elif args.command == "plan":
+        orders = pd.read_csv(args.orders, dtype={"Product": str})
+        plan = app_main.plan_production(orders[["Product", "Quantity"]].itertuples(index=False))
+        plan["shopping_list"].to_csv(args.output if args.output else sys.stdout, index=False)
+        print(f"Planned {len(orders)} order lines: ingredients €{plan['total_cost']:.2f}, "
+              f"{int(plan['shopping_list']['Packs'].sum())} packs for €{plan['pack_cost']:.2f}.", file=sys.stderr)
+        if plan["unknown_products"]:
+            print(f"Unknown products: {', '.join(plan['unknown_products'])}.", file=sys.stderr)
+        if plan["invalid_lines"]:
+            print(f"{len(plan['invalid_lines'])} recipe line(s) could not be planned.", file=sys.stderr)
+    elif args.command == "offers" and args.offers_file:
+        offers = read_csv_schema(args.offers_file, OFFER_SCHEMA)
+        app_main.update_offers_file(offers.to_dict(orient="list"))
+        print(f"Imported {len(offers)} offers.", file=sys.stderr)
+    elif args.command == "offers":
+        if args.unit:
+            names = args.ingredients or app_main.get_ingredient_list()
+            try:
+                rows = {name: app_main.get_offer(name, args.unit, args.offer) for name in names}
+            except ValueError as e:
+                parser.error(str(e))
+            offers = pd.DataFrame([row for row in rows.values() if row is not None],
+                                  columns=OFFER_COLUMNS + OFFER_PRICE_COLUMNS)
+            missing = [name for name, row in rows.items() if row is None]
+        else:
+            offers = app_main.get_offers()
+            if args.ingredients:
+                offers = offers[offers["Ingredient"].isin(args.ingredients)]
+            missing = sorted(set(args.ingredients).difference(offers["Ingredient"].tolist()))
+        offers.to_csv(args.output if args.output else sys.stdout, index=False)
+        if missing:
+            priced = f" priced per {args.unit}" if args.unit else ""
+            print(f"No offers{priced} for: {', '.join(missing)}.", file=sys.stderr)
+    elif args.command == "history":
+        start = time.perf_counter()
+        history = app_main.get_cost_history(args.products or None)
+        history.round(4).to_csv(args.output if args.output else sys.stdout)
+        print(f"Costed {history.shape[1]} products at {len(history)} price snapshots in "
+              f"{time.perf_counter() - start:.2f}s.", file=sys.stderr)
+    elif args.command == "simulate":
+        settings = []
+        for values in [args.ingredient_volatility, args.shock]:
+            setting = {}
+            for value in values:
+                name, _, number = value.rpartition("=")
+                try:
+                    setting[name] = float(number)
+                except ValueError:
+                    parser.error(f"expected NAME=NUMBER, got \"{value}\"")
+            settings.append(setting)
+
+        start = time.perf_counter()
+        simulation = app_main.simulate_margins(args.scenarios, args.volatility, args.distribution, settings[0],
+                                               settings[1], args.percentiles, args.seed, args.processes)
+        simulation["margins"].to_csv(args.output if args.output else sys.stdout, index=False)
+        print(f"Simulated {simulation['scenarios']} price scenarios for {len(simulation['margins'])} products in "
+              f"{time.perf_counter() - start:.2f}s (seed {simulation['seed']}).", file=sys.stderr)
+
+    if args.command == "cost-all":
+        output_format = args.format
+        if output_format is None:
+            output_format = "jsonl" if args.output and args.output.endswith((".jsonl", ".json")) else "csv"
+
+        app_main.use_cost_cache = not args.no_cache
+        app_main.verify_cost_cache = args.verify_cache
+        processes = 1 if args.verify_cache else args.processes
+
+        start = time.perf_counter()
+        try:
+            results = app_main.cost_all_products(processes=processes, chunk_size=args.chunk_size, offer=args.offer)
+        except ValueError as e:
+            parser.error(str(e))
+        if args.output:
+            with open(args.output, "w", newline="", encoding="utf-8") as output:
+                count = write_costs(results, output, output_format)
+        else:
+            count = write_costs(results, sys.stdout, output_format)
+        print(f"Costed {count} products in {time.perf_counter() - start:.2f}s.", file=sys.stderr)
+        cost_cache = app_main._get_cost_cache()
+        if args.verify_cache and cost_cache is not None:
+            stats = cost_cache.get_stats()
+            print(f"Verified {stats['hits']} cached costs: {stats['mismatches']} stale.", file=sys.stderr)
 
 if __name__ == "__main__":
-    main = AppMain()
\ No newline at end of file
+    main()
\ No newline at end of file
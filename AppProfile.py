@@ -0,0 +1,176 @@
+import os
+import sys
+import json
+import time
+import atexit
+import inspect
+import threading
+import functools
+
+PROFILE_OUTPUT = os.environ.get("DAHLIA_PROFILE", "")
+CPROFILE_OUTPUT = os.environ.get("DAHLIA_PROFILE_CPROFILE", "")
+TRACEMALLOC_OUTPUT = os.environ.get("DAHLIA_PROFILE_TRACEMALLOC", "")
+
+enabled = bool(PROFILE_OUTPUT)
+
+COUNTER_FIELDS = ["calls", "seconds", "reads", "writes", "bytes_read", "bytes_written", "rows_scanned"]
+
+_lock = threading.Lock()
+_local = threading.local()
+_profiles = []
+started = time.perf_counter()
+methods = {}
+actions = {}
+totals = dict.fromkeys(COUNTER_FIELDS, 0)
+
+def _counters(table, name):
+    counters = table.get(name)
+    if counters is None:
+        counters = table[name] = dict.fromkeys(COUNTER_FIELDS, 0)
+    return counters
+
+def _stack():
+    stack = getattr(_local, "stack", None)
+    if stack is None:
+        stack = _local.stack = []
+    return stack
+
+def current_action():
+    return getattr(_local, "action", None)
+
+def _record_io(file_path, rows, count_field, bytes_field):
+    if not enabled:
+        return
+
+    nbytes = 0
+    if file_path is not None:
+        try:
+            nbytes = os.path.getsize(file_path)
+        except OSError:
+            pass
+
+    with _lock:
+        targets = [totals] + [_counters(methods, name) for name in set(_stack())]
+        if current_action() is not None:
+            targets.append(_counters(actions, current_action()))
+        for counters in targets:
+            counters[count_field] += 1
+            counters[bytes_field] += nbytes
+            counters["rows_scanned"] += rows
+
+def record_read(file_path=None, rows=0):
+    _record_io(file_path, rows, "reads", "bytes_read")
+
+def record_write(file_path=None, rows=0):
+    _record_io(file_path, rows, "writes", "bytes_written")
+
+def instrument(fn, name, action=False):
+    code = getattr(fn, "__code__", None)
+    # Qt drops signal arguments a slot can't take, but only when it can see the slot's real signature
+    max_args = code.co_argcount if action and code is not None and not code.co_flags & inspect.CO_VARARGS else None
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        if max_args is not None:
+            args = args[:max_args]
+        stack = _stack()
+        outer_action = current_action()
+        if action and outer_action is None:
+            _local.action = name
+
+        stack.append(name)
+        start = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - start
+            stack.pop()
+            _local.action = outer_action
+            with _lock:
+                counters = _counters(actions if action else methods, name)
+                counters["calls"] += 1
+                counters["seconds"] += elapsed
+                if not action and not stack:
+                    totals["calls"] += 1
+                    totals["seconds"] += elapsed
+
+    return wrapper
+
+def instrument_class(cls, action=False):
+    for attribute, value in list(vars(cls).items()):
+        if attribute.startswith("__") or not callable(value):
+            continue
+        setattr(cls, attribute, instrument(value, f"{cls.__name__}.{attribute}", action))
+    return cls
+
+def _thread_profile():
+    profile = getattr(_local, "profile", None)
+    if profile is None:
+        import cProfile
+        profile = _local.profile = cProfile.Profile()
+        with _lock:
+            _profiles.append(profile)
+    return profile
+
+def run_task(action, fn, *args):
+    if not enabled:
+        return fn(*args)
+
+    profile = _thread_profile() if CPROFILE_OUTPUT else None
+    outer_action = current_action()
+    _local.action = action
+    if profile is not None:
+        profile.enable()
+    try:
+        return fn(*args)
+    finally:
+        if profile is not None:
+            profile.disable()
+        _local.action = outer_action
+
+def _sorted_counters(table):
+    return dict(sorted(((name, dict(counters)) for name, counters in table.items()),
+                       key=lambda item: item[1]["seconds"], reverse=True))
+
+def summary():
+    with _lock:
+        return {
+            "elapsed_seconds": time.perf_counter() - started,
+            "totals": dict(totals),
+            "methods": _sorted_counters(methods),
+            "actions": _sorted_counters(actions)
+        }
+
+def status_text():
+    with _lock:
+        return (f"{totals['calls']} calls · {totals['reads']} reads ({totals['bytes_read'] / 1E6:.1f} MB) · "
+                f"{totals['writes']} writes · {totals['rows_scanned']} rows")
+
+def write_reports():
+    if CPROFILE_OUTPUT and _profiles:
+        import pstats
+        _thread_profile().disable()
+        pstats.Stats(*_profiles).dump_stats(CPROFILE_OUTPUT)
+
+    if TRACEMALLOC_OUTPUT:
+        import tracemalloc
+        if tracemalloc.is_tracing():
+            statistics = tracemalloc.take_snapshot().statistics("lineno")
+            with open(TRACEMALLOC_OUTPUT, "w", encoding="utf-8") as output:
+                for statistic in statistics[:50]:
+                    output.write(f"{statistic}\n")
+
+    report = json.dumps(summary(), indent=2, ensure_ascii=False)
+    if PROFILE_OUTPUT in ("1", "-", "stderr"):
+        print(report, file=sys.stderr)
+    else:
+        with open(PROFILE_OUTPUT, "w", encoding="utf-8") as output:
+            output.write(report)
+
+if enabled:
+    if CPROFILE_OUTPUT:
+        _thread_profile().enable()
+    if TRACEMALLOC_OUTPUT:
+        import tracemalloc
+        tracemalloc.start()
+    atexit.register(write_reports)
@@ -0,0 +1,84 @@
+import re
+import bisect
+import itertools
+from AppImports import lazy_import
+
+np = lazy_import("numpy")
+pd = lazy_import("pandas")
+
+WORD_PATTERN = re.compile(r"\w+")
+
+def trigrams(text):
+    grams = set()
+    for word in WORD_PATTERN.findall(text.lower()):
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+class SearchIndex:
+    """Prefix and typo-tolerant trigram search over a list of names"""
+    min_coverage = 0.4
+
+    def __init__(self, names):
+        self.names = list(dict.fromkeys(name for name in names if isinstance(name, str)))
+
+        keys = sorted((name.lower(), pos) for pos, name in enumerate(self.names))
+        self.keys = [key for key, _ in keys]
+        self.key_positions = [pos for _, pos in keys]
+
+        name_grams = [trigrams(name) for name in self.names]
+        gram_counts = np.array([len(grams) for grams in name_grams], dtype=np.int64)
+        codes, grams = pd.factorize(np.fromiter(itertools.chain.from_iterable(name_grams), dtype=object,
+                                                count=int(gram_counts.sum())))
+        positions = np.repeat(np.arange(len(self.names), dtype=np.int32), gram_counts)
+        order = np.argsort(codes, kind="stable")
+        bounds = np.cumsum(np.bincount(codes, minlength=len(grams)))[:-1]
+        self.postings = dict(zip(grams.tolist(), np.split(positions[order], bounds)))
+        self.gram_counts = gram_counts.astype(float)
+        self.common_limit = max(len(self.names) // 10, 100)
+
+    def __len__(self):
+        return len(self.names)
+
+    def prefix_matches(self, prefix, limit):
+        start = bisect.bisect_left(self.keys, prefix)
+        matches = []
+        for key, pos in zip(self.keys[start:start + limit], self.key_positions[start:start + limit]):
+            if not key.startswith(prefix):
+                break
+            matches.append(pos)
+        return matches
+
+    def trigram_matches(self, query, limit):
+        query_grams = trigrams(query)
+        postings = sorted((self.postings[gram] for gram in query_grams if gram in self.postings), key=len)
+        if not postings:
+            return []
+
+        # Trigrams shared by a large part of the names say little about a match and cost the most to count,
+        # so they are skipped unless the query has too few rarer ones to go on
+        selective = [positions for positions in postings if len(positions) <= self.common_limit]
+        if len(selective) < len(query_grams) / 2:
+            selective = postings
+        query_count = len(query_grams) - (len(postings) - len(selective))
+        shared = np.bincount(np.concatenate(selective), minlength=len(self.names))
+        candidates = np.flatnonzero(shared >= self.min_coverage * query_count)
+
+        # Rank by how much of the query a name covers, then by how little else the name contains
+        shared = shared[candidates]
+        scores = shared + shared / (query_count + self.gram_counts[candidates] - shared)
+        if len(candidates) > limit:
+            top = np.argpartition(-scores, limit)[:limit]
+            candidates, scores = candidates[top], scores[top]
+        return candidates[np.argsort(-scores, kind="stable")].tolist()
+
+    def search(self, text, limit=10):
+        query = text.strip().lower()
+        if not query:
+            return self.names[:limit]
+
+        matches = self.prefix_matches(query, limit)
+        if len(matches) < limit:
+            found = set(matches)
+            matches += [pos for pos in self.trigram_matches(query, limit + len(matches)) if pos not in found]
+        return [self.names[pos] for pos in matches[:limit]]
@@ -0,0 +1,903 @@
+import io
+import os
+import csv
+import json
+import shutil
+import hashlib
+import sqlite3
+import threading
+import AppProfile
+from AppImports import lazy_import
+from AppProfile import record_read, record_write
+
+np = lazy_import("numpy")
+pd = lazy_import("pandas")
+
+INGREDIENT_SCHEMA = {
+    "Ingredient": "object",
+    "Density (g/ml)": "float32",
+    "Store Brand": "category",
+    "Store Price (€)": "float32",
+    "Store Amount": "float32",
+    "Store Unit": "category"
+}
+PRODUCT_SCHEMA = {"Product": "object", "Pieces Made": "float64", "Multiplier": "float64"}
+RECIPE_SCHEMA = {"Ingredient": "object", "Amount Used": "float32", "Amount Unit": "category"}
+OFFER_SCHEMA = {column: dtype for column, dtype in INGREDIENT_SCHEMA.items() if column != "Density (g/ml)"}
+
+INGREDIENT_COLUMNS = list(INGREDIENT_SCHEMA)
+PRODUCT_COLUMNS = list(PRODUCT_SCHEMA)
+RECIPE_COLUMNS = list(RECIPE_SCHEMA)
+OFFER_COLUMNS = list(OFFER_SCHEMA)
+
+def file_stamp(file_path):
+    try:
+        stat = os.stat(file_path)
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+def content_digest(data):
+    return hashlib.blake2b(data, digest_size=16).digest()
+
+def write_atomic(file_path, data):
+    # Readers and a crash mid-write only ever see the old file or the complete new one
+    temp_path = f"{file_path}.tmp"
+    try:
+        with open(temp_path, "wb") as temp_file:
+            temp_file.write(data)
+            temp_file.flush()
+            os.fsync(temp_file.fileno())
+        if os.path.exists(file_path):
+            shutil.copymode(file_path, temp_path)
+        os.replace(temp_path, file_path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+def parse_recipe_columns(text):
+    reader = csv.reader(io.StringIO(text, newline=""))
+    header = next(reader)
+    columns = list(zip(*reader)) or [()] * len(header)
+    return dict(zip(header, (list(column) for column in columns)))
+
+def read_recipe_columns(file_path):
+    with open(file_path, newline="", encoding="utf-8") as recipe_file:
+        recipe = parse_recipe_columns(recipe_file.read())
+    record_read(file_path, len(recipe["Ingredient"]) if "Ingredient" in recipe else 0)
+    return recipe
+
+def render_recipe(recipe):
+    output = io.StringIO(newline="")
+    writer = csv.writer(output)
+    writer.writerow(RECIPE_COLUMNS)
+    writer.writerows(zip(*(narrow_floats(recipe[column], dtype) for column, dtype in RECIPE_SCHEMA.items())))
+    return output.getvalue().encode("utf-8")
+
+def _typed_column(values, dtype, column, source):
+    if getattr(values, "dtype", None) == dtype:
+        return values
+    if dtype == "category":
+        return pd.Categorical(values)
+    if not dtype.startswith("float"):
+        return np.asarray(values, dtype=dtype)
+
+    try:
+        return np.asarray(values, dtype=dtype)
+    except (TypeError, ValueError):
+        pass
+
+    # Blank cells are missing values; anything else that doesn't parse is reported by row
+    values = pd.Series(values, dtype=object)
+    numbers = pd.to_numeric(values, errors="coerce")
+    invalid = np.flatnonzero(numbers.isna() & values.notna() & (values.astype(str).str.strip() != ""))
+    if len(invalid):
+        rows = ", ".join(str(row + 1) for row in invalid[:5])
+        raise ValueError(f"{source}: \"{column}\" must be a valid number (row {rows}).")
+    return numbers.to_numpy(dtype=dtype)
+
+def apply_schema(columns, schema, source):
+    missing = [column for column in schema if column not in columns]
+    if missing:
+        raise ValueError(f"{source} is missing column(s): {', '.join(missing)}.")
+
+    typed = {column: _typed_column(columns[column], dtype, column, source) for column, dtype in schema.items()}
+    return pd.DataFrame(typed, index=columns.index if isinstance(columns, pd.DataFrame) else None)
+
+def read_csv_schema(file_path, schema, data=None):
+    try:
+        df = pd.read_csv(file_path if data is None else io.BytesIO(data), dtype=schema)
+    except ValueError:
+        df = pd.read_csv(file_path if data is None else io.BytesIO(data), dtype=str)
+    return apply_schema(df, schema, os.path.basename(file_path))
+
+def narrow_floats(values, dtype):
+    # Floats widened from a float32 column (e.g. by to_dict) are written as 0.53 again, not 0.5299999713897705,
+    # and whole-number columns as 1000, the way they were read
+    if dtype == "float32" and getattr(values, "dtype", None) is not None and values.dtype.kind == "f":
+        values = np.asarray(values, dtype=dtype)
+        if np.all(values % 1 == 0):
+            return values.astype(np.int64)
+    return values
+
+def decimal_floats(values):
+    if values.dtype != "float32":
+        return values.tolist()
+
+    # Widen float32 back to the decimal it was read from (1.99, not 1.9900000095), float32 keeping 7 digits
+    values = values.to_numpy(dtype=float)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        digits = np.nan_to_num(6 - np.floor(np.log10(np.abs(values))), posinf=0, neginf=0).clip(0, 300)
+        scale = 10.0 ** digits
+        return np.where(np.isfinite(values), np.round(values * scale) / scale, values).tolist()
+
+def _sql_value(value):
+    return None if pd.isna(value) else value
+
+class CsvStorage:
+    """Ingredients.csv, Products.csv, optional Offers.csv and one products/<name>.csv file per recipe"""
+    # Whether a recipe's stamp is the same across runs for as long as the recipe is unchanged
+    stable_recipe_stamps = True
+
+    def __init__(self, path):
+        self.path = path
+        self.ingredients_file = "Ingredients.csv"
+        self.products_file = "Products.csv"
+        self.offers_file = "Offers.csv"
+
+        self._lock = threading.RLock()
+        self._products = None
+        self._products_stamp = None
+        self._product_rows = {}
+        self._digests = {}
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state["_lock"] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.RLock()
+
+    def catalog_stamp(self):
+        stamp = file_stamp(f"{self.path}/{self.ingredients_file}")
+        return None if stamp is None else (stamp, file_stamp(f"{self.path}/{self.offers_file}"))
+
+    def products_stamp(self):
+        return file_stamp(f"{self.path}/{self.products_file}")
+
+    def recipe_stamps(self, product_names=None):
+        if product_names is not None:
+            return {product_name: file_stamp(f"{self.path}/products/{product_name}.csv") for product_name in product_names}
+
+        try:
+            entries = list(os.scandir(f"{self.path}/products"))
+        except FileNotFoundError:
+            return {}
+
+        stamps = {}
+        for entry in entries:
+            if entry.name.endswith(".csv") and entry.is_file():
+                stat = entry.stat()
+                stamps[entry.name[:-4]] = stat.st_mtime_ns, stat.st_size
+        return stamps
+
+    def watch_paths(self):
+        # The products folder rather than every recipe file in it, which would be one OS watch per product
+        return [f"{self.path}/{self.ingredients_file}", f"{self.path}/{self.offers_file}",
+                f"{self.path}/{self.products_file}", f"{self.path}/products"]
+
+    def _read_file(self, file_path):
+        stamp = file_stamp(file_path)
+        with open(file_path, "rb") as input_file:
+            data = input_file.read()
+        with self._lock:
+            self._digests[file_path] = stamp, content_digest(data)
+        return data
+
+    def _write_file(self, file_path, data, rows):
+        digest = content_digest(data)
+        with self._lock:
+            # Content that matches what was last read or written, in a file nobody touched since, isn't rewritten
+            if self._digests.get(file_path) == (file_stamp(file_path), digest):
+                return False
+            write_atomic(file_path, data)
+            self._digests[file_path] = file_stamp(file_path), digest
+        record_write(file_path, rows)
+        return True
+
+    def load_ingredients(self):
+        file_path = f"{self.path}/{self.ingredients_file}"
+        df = read_csv_schema(file_path, INGREDIENT_SCHEMA, self._read_file(file_path))
+        record_read(file_path, len(df))
+        return df
+
+    def save_ingredients(self, df, changed_rows=None, removed=()):
+        columns = {column: narrow_floats(df[column], dtype) for column, dtype in INGREDIENT_SCHEMA.items() if column in df}
+        data = df.assign(**columns).to_csv(index=False).encode("utf-8")
+        return self._write_file(f"{self.path}/{self.ingredients_file}", data, len(df))
+
+    def load_offers(self):
+        file_path = f"{self.path}/{self.offers_file}"
+        if not os.path.exists(file_path):
+            return apply_schema({column: [] for column in OFFER_COLUMNS}, OFFER_SCHEMA, self.offers_file)
+        df = read_csv_schema(file_path, OFFER_SCHEMA, self._read_file(file_path))
+        record_read(file_path, len(df))
+        return df
+
+    def save_offers(self, df):
+        columns = {column: narrow_floats(df[column], dtype) for column, dtype in OFFER_SCHEMA.items() if column in df}
+        data = df[OFFER_COLUMNS].assign(**columns).to_csv(index=False).encode("utf-8")
+        return self._write_file(f"{self.path}/{self.offers_file}", data, len(df))
+
+    def load_products(self):
+        file_path = f"{self.path}/{self.products_file}"
+        stamp = file_stamp(file_path)
+
+        with self._lock:
+            if self._products is None or stamp is None or stamp != self._products_stamp:
+                products_df = read_csv_schema(file_path, PRODUCT_SCHEMA, self._read_file(file_path))
+                record_read(file_path, len(products_df))
+                product_rows = {}
+                for row, product_name in enumerate(products_df["Product"].tolist()):
+                    product_rows.setdefault(product_name, row)
+                self._products, self._product_rows, self._products_stamp = products_df, product_rows, stamp
+
+            return self._products
+
+    def get_product(self, product_name):
+        with self._lock:
+            products_df = self.load_products()
+            row = self._product_rows.get(product_name)
+
+        if row is None:
+            return None
+
+        return products_df["Pieces Made"].iat[row], products_df["Multiplier"].iat[row]
+
+    def load_recipe(self, product_name):
+        return apply_schema(self.load_recipe_columns(product_name), RECIPE_SCHEMA, f"{product_name}.csv")
+
+    def load_recipe_columns(self, product_name):
+        file_path = f"{self.path}/products/{product_name}.csv"
+        recipe = parse_recipe_columns(self._read_file(file_path).decode("utf-8"))
+        record_read(file_path, len(recipe["Ingredient"]) if "Ingredient" in recipe else 0)
+        return recipe
+
+    def load_all_recipes(self):
+        recipes = {}
+        for product_name in self.load_products()["Product"].tolist():
+            try:
+                recipes[product_name] = self.load_recipe_columns(product_name)
+            except FileNotFoundError:
+                continue
+        return recipes
+
+    def _save_product_rows(self, product_rows):
+        try:
+            products_df = self.load_products()
+        except FileNotFoundError:
+            products_df = pd.DataFrame(columns=PRODUCT_COLUMNS)
+        saved = {product_name: (pieces_made, multiplier) for product_name, pieces_made, multiplier in product_rows}
+
+        # Products already listed keep their row, so saving one unchanged leaves the file as it was
+        names = products_df["Product"]
+        products_df = products_df[~names.isin(saved) | ~names.duplicated()].reset_index(drop=True)
+        listed = products_df["Product"].isin(saved).to_numpy()
+        values = [saved[product_name] for product_name in products_df["Product"][listed].tolist()]
+        for pos, column in enumerate(["Pieces Made", "Multiplier"]):
+            column_values = products_df[column].to_numpy(dtype=PRODUCT_SCHEMA[column], copy=True)
+            column_values[listed] = [value[pos] for value in values]
+            products_df[column] = column_values
+
+        # Both columns are written as floats, so a product saved with whole numbers reads back the same
+        listed_names = set(products_df["Product"].tolist())
+        new_rows = pd.DataFrame([(product_name, *value) for product_name, value in saved.items()
+                                 if product_name not in listed_names], columns=PRODUCT_COLUMNS)
+        new_rows = new_rows.astype(PRODUCT_SCHEMA)
+        products_df = pd.concat([products_df, new_rows], ignore_index=True) if len(products_df) else new_rows
+        return self._write_products(products_df)
+
+    def _write_products(self, products_df):
+        data = products_df.to_csv(index=False).encode("utf-8")
+        return self._write_file(f"{self.path}/{self.products_file}", data, len(products_df))
+
+    def _save_recipes(self, recipes):
+        os.makedirs(f"{self.path}/products", exist_ok=True)
+        written = False
+        for product_name, recipe in recipes:
+            file_path = f"{self.path}/products/{product_name}.csv"
+            written |= self._write_file(file_path, render_recipe(recipe), len(recipe["Ingredient"]))
+        return written
+
+    def _delete_recipe(self, product_name):
+        recipe_file = f"{self.path}/products/{product_name}.csv"
+        with self._lock:
+            self._digests.pop(recipe_file, None)
+        if os.path.exists(recipe_file):
+            os.remove(recipe_file)
+
+    def save_product(self, product_name, pieces_made, multiplier, recipe_df):
+        recipe_written = self._save_recipes([(product_name, recipe_df)])
+        return self._save_product_rows([(product_name, pieces_made, multiplier)]) or recipe_written
+
+    def save_products(self, products):
+        product_rows = []
+        recipes = []
+        for product_name, pieces_made, multiplier, recipe in products:
+            product_rows.append((product_name, pieces_made, multiplier))
+            recipes.append((product_name, recipe))
+
+        recipes_written = self._save_recipes(recipes)
+        return self._save_product_rows(product_rows) or recipes_written
+
+    def delete_product(self, product_name):
+        try:
+            products_df = self.load_products()
+        except FileNotFoundError:
+            raise FileNotFoundError("Products file not found.")
+
+        if product_name not in self._product_rows:
+            raise ValueError(f"Product \"{product_name}\" not found.")
+
+        self._write_products(products_df[products_df["Product"] != product_name])
+        self._delete_recipe(product_name)
+
+class ColumnarStorage(CsvStorage):
+    """CSV catalog and product list, with every recipe line in memory-mapped Recipes.<version>.npy segments"""
+    stable_recipe_stamps = False
+    recipes_file = "Recipes.npy"
+    recipes_index_file = "Recipes.json"
+    line_dtype = [("product", "<i4"), ("ingredient", "<i4"), ("amount", "<f8"), ("unit", "<i4")]
+    max_segments = 32
+
+    def __init__(self, path):
+        super().__init__(path)
+        self._segments = None
+        self._index = None
+        self._index_stamp = None
+
+    def __getstate__(self):
+        state = super().__getstate__()
+        state["_segments"] = None
+        state["_index"] = None
+        state["_index_stamp"] = None
+        return state
+
+    def _load_store(self):
+        index_path = f"{self.path}/{self.recipes_index_file}"
+        with self._lock:
+            try:
+                return self._refresh_store(index_path, file_stamp(index_path))
+            except FileNotFoundError:
+                # A compaction removed the segments of the index just read; the index that replaced it names the new ones
+                return self._refresh_store(index_path, file_stamp(index_path))
+
+    def _refresh_store(self, index_path, stamp):
+        if self._index is None or stamp is None or stamp != self._index_stamp:
+            if stamp is None:
+                index = {"products": [], "files": [], "spans": [], "ingredients": [], "units": [], "version": 0,
+                         "dead": 0}
+                segments = []
+            else:
+                with open(index_path, encoding="utf-8") as index_file:
+                    index = json.load(index_file)
+                if "files" not in index:
+                    # Stores written before segments kept every line in Recipes.npy, in product order
+                    offsets = index.pop("offsets")
+                    index.update(files=[self.recipes_file], spans=[[0, start, end] for start, end
+                                                                   in zip(offsets[:-1], offsets[1:])], version=0, dead=0)
+                segments = [np.load(f"{self.path}/{file_name}", mmap_mode="r") for file_name in index["files"]]
+                record_read(index_path)
+            index["positions"] = {name: pos for pos, name in enumerate(index["products"])}
+            index["ingredient_values"] = np.array(index["ingredients"] + [None], dtype=object)
+            index["unit_values"] = np.array(index["units"] + [None], dtype=object)
+            self._index, self._segments, self._index_stamp = index, segments, stamp
+
+        return self._index, self._segments
+
+    def _recipe_slice(self, product_name):
+        index, segments = self._load_store()
+
+        pos = index["positions"].get(product_name)
+        if pos is None:
+            raise FileNotFoundError(f"No recipe stored for \"{product_name}\".")
+
+        segment, start, end = index["spans"][pos]
+        record_read(rows=end - start)
+        return segments[segment][start:end]
+
+    def recipe_stamps(self, product_names=None):
+        index, segments = self._load_store()
+        spans = index["spans"]
+        positions = index["positions"]
+        if product_names is None:
+            product_names = index["products"]
+
+        stamps = {}
+        for product_name in product_names:
+            pos = positions.get(product_name)
+            if pos is None:
+                stamps[product_name] = None
+            else:
+                segment, start, end = spans[pos]
+                stamps[product_name] = hash(segments[segment][start:end].tobytes())
+        return stamps
+
+    def watch_paths(self):
+        return [f"{self.path}/{self.ingredients_file}", f"{self.path}/{self.offers_file}",
+                f"{self.path}/{self.products_file}", f"{self.path}/{self.recipes_index_file}"]
+
+    def _lines_to_columns(self, lines):
+        index, _ = self._load_store()
+
+        return {
+            "Ingredient": index["ingredient_values"][lines["ingredient"]].tolist(),
+            "Amount Used": lines["amount"].tolist(),
+            "Amount Unit": index["unit_values"][lines["unit"]].tolist()
+        }
+
+    def load_recipe(self, product_name):
+        return apply_schema(self.load_recipe_columns(product_name), RECIPE_SCHEMA, f"Recipe \"{product_name}\"")
+
+    def load_recipe_columns(self, product_name):
+        return self._lines_to_columns(self._recipe_slice(product_name))
+
+    def load_all_recipes(self):
+        index, segments = self._load_store()
+        lines = np.concatenate(segments) if segments else np.empty(0, dtype=self.line_dtype)
+        bases = np.cumsum([0] + [len(segment) for segment in segments]).tolist()
+        record_read(f"{self.path}/{self.recipes_index_file}", len(lines) - index["dead"])
+        columns = self._lines_to_columns(lines)
+
+        recipes = {}
+        for product_name, (segment, start, end) in zip(index["products"], index["spans"]):
+            start, end = bases[segment] + start, bases[segment] + end
+            recipes[product_name] = {column: values[start:end] for column, values in columns.items()}
+        return recipes
+
+    def _encode_lines(self, recipe, product_pos, ingredients, units):
+        names = list(recipe["Ingredient"])
+        lines = np.empty(len(names), dtype=self.line_dtype)
+        lines["product"] = product_pos
+        lines["ingredient"] = [-1 if pd.isna(name) else ingredients.setdefault(name, len(ingredients)) for name in names]
+        lines["amount"] = pd.to_numeric(np.asarray(recipe["Amount Used"], dtype=object), errors="coerce")
+        lines["unit"] = [-1 if pd.isna(unit) else units.setdefault(unit, len(units)) for unit in recipe["Amount Unit"]]
+        return lines
+
+    def _write_segment(self, lines, version):
+        # Segments are never rewritten, so an index only ever names complete files
+        file_name = f"{os.path.splitext(self.recipes_file)[0]}.{version}.npy"
+        output = io.BytesIO()
+        np.save(output, lines)
+        write_atomic(f"{self.path}/{file_name}", output.getvalue())
+        record_write(f"{self.path}/{file_name}", len(lines))
+        return file_name
+
+    def _publish(self, index):
+        # Replacing the index is the one step that switches readers over to the new recipes
+        index = {key: index[key] for key in ["products", "files", "spans", "ingredients", "units", "version", "dead"]}
+        write_atomic(f"{self.path}/{self.recipes_index_file}", json.dumps(index, ensure_ascii=False).encode("utf-8"))
+        self._segments = None
+        self._index = None
+
+    def _write_store(self, recipes):
+        ingredients = {}
+        units = {}
+        spans = []
+        chunks = []
+        start = 0
+        for pos, recipe in enumerate(recipes.values()):
+            chunks.append(self._encode_lines(recipe, pos, ingredients, units))
+            spans.append([0, start, start + len(chunks[-1])])
+            start += len(chunks[-1])
+
+        with self._lock:
+            old_index, _ = self._load_store()
+            version = old_index["version"] + 1
+            files = [self._write_segment(np.concatenate(chunks), version)] if start else []
+            self._publish({"products": list(recipes), "files": files, "spans": spans, "ingredients": list(ingredients),
+                           "units": list(units), "version": version, "dead": 0})
+
+            # Readers still holding an old segment keep their mapping; new readers get the new index
+            prefix, extension = os.path.splitext(self.recipes_file)
+            for entry in os.scandir(self.path):
+                if (entry.name == self.recipes_file or entry.name.startswith(f"{prefix}.")
+                        and entry.name.endswith(extension)) and entry.name not in files:
+                    try:
+                        os.remove(entry.path)
+                    except OSError:
+                        pass
+
+    def _update_store(self, recipes, removed=()):
+        # Changed recipes go into one new segment and the lines they replace are left behind as dead, until the
+        # dead lines or the segments pile up and the store is compacted into one segment again
+        with self._lock:
+            index, _ = self._load_store()
+            products = list(index["products"])
+            spans = [list(span) for span in index["spans"]]
+            positions = dict(index["positions"])
+            ingredients = {name: pos for pos, name in enumerate(index["ingredients"])}
+            units = {unit: pos for pos, unit in enumerate(index["units"])}
+            dead = index["dead"]
+
+            for product_name in removed:
+                pos = positions.pop(product_name, None)
+                if pos is not None:
+                    dead += spans[pos][2] - spans[pos][1]
+                    spans[pos] = None
+                    products[pos] = None
+
+            chunks = []
+            start = 0
+            for product_name, recipe in recipes.items():
+                pos = positions.get(product_name)
+                if pos is None:
+                    pos = positions[product_name] = len(products)
+                    products.append(product_name)
+                    spans.append(None)
+                else:
+                    dead += spans[pos][2] - spans[pos][1]
+                chunks.append(self._encode_lines(recipe, pos, ingredients, units))
+                spans[pos] = [len(index["files"]), start, start + len(chunks[-1])]
+                start += len(chunks[-1])
+
+            live = [pos for pos, product_name in enumerate(products) if product_name is not None]
+            if dead > sum(spans[pos][2] - spans[pos][1] for pos in live) or len(index["files"]) >= self.max_segments:
+                all_recipes = self.load_all_recipes()
+                for product_name in removed:
+                    all_recipes.pop(product_name, None)
+                all_recipes.update(recipes)
+                self._write_store(all_recipes)
+                return
+
+            files = list(index["files"])
+            version = index["version"]
+            if start:
+                version += 1
+                files.append(self._write_segment(np.concatenate(chunks), version))
+            self._publish({"products": [products[pos] for pos in live], "files": files,
+                           "spans": [spans[pos] for pos in live], "ingredients": list(ingredients),
+                           "units": list(units), "version": version, "dead": dead})
+
+    def _recipe_unchanged(self, stored, recipe):
+        if stored is None or len(stored["Ingredient"]) != len(recipe["Ingredient"]):
+            return False
+        amounts = pd.to_numeric(np.asarray(recipe["Amount Used"], dtype=object), errors="coerce")
+        return (list(recipe["Ingredient"]) == stored["Ingredient"] and list(recipe["Amount Unit"]) == stored["Amount Unit"]
+                and np.array_equal(amounts, np.asarray(stored["Amount Used"], dtype=float), equal_nan=True))
+
+    def _save_recipes(self, recipes):
+        with self._lock:
+            index, _ = self._load_store()
+            changed = {}
+            for product_name, recipe in recipes:
+                stored = self.load_recipe_columns(product_name) if product_name in index["positions"] else None
+                if not self._recipe_unchanged(stored, recipe):
+                    changed[product_name] = {column: list(recipe[column]) for column in RECIPE_COLUMNS}
+            if changed:
+                self._update_store(changed)
+            return bool(changed)
+
+    def _delete_recipe(self, product_name):
+        with self._lock:
+            index, _ = self._load_store()
+            if product_name in index["positions"]:
+                self._update_store({}, [product_name])
+
+    def import_recipes(self, source):
+        recipes = source.load_all_recipes()
+        self._write_store(recipes)
+        return len(recipes)
+
+class SqliteStorage:
+    """SQLite database with indexed ingredient, product and recipe-line tables"""
+    stable_recipe_stamps = False
+    schema = """
+        CREATE TABLE IF NOT EXISTS ingredients (
+            ingredient TEXT PRIMARY KEY,
+            density REAL,
+            store_brand TEXT,
+            store_price REAL,
+            store_amount REAL,
+            store_unit TEXT
+        );
+        CREATE TABLE IF NOT EXISTS products (
+            product TEXT PRIMARY KEY,
+            pieces_made REAL,
+            multiplier REAL
+        );
+        CREATE TABLE IF NOT EXISTS recipe_lines (
+            product TEXT NOT NULL REFERENCES products(product) ON DELETE CASCADE,
+            line INTEGER NOT NULL,
+            ingredient TEXT,
+            amount_used REAL,
+            amount_unit TEXT,
+            PRIMARY KEY (product, line)
+        );
+        CREATE INDEX IF NOT EXISTS recipe_lines_ingredient ON recipe_lines(ingredient);
+        CREATE TABLE IF NOT EXISTS offers (
+            ingredient TEXT NOT NULL,
+            store_brand TEXT,
+            store_price REAL,
+            store_amount REAL,
+            store_unit TEXT
+        );
+        CREATE INDEX IF NOT EXISTS offers_ingredient ON offers(ingredient);
+    """
+    ingredient_fields = ["ingredient", "density", "store_brand", "store_price", "store_amount", "store_unit"]
+    offer_fields = ["ingredient", "store_brand", "store_price", "store_amount", "store_unit"]
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.path = os.path.dirname(os.path.abspath(db_path))
+        self.catalog_writes = 0
+
+        self._lock = threading.RLock()
+        self._connection = None
+        self._stamps = None
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state["_lock"] = None
+        state["_connection"] = None
+        state["_stamps"] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.RLock()
+
+    @property
+    def connection(self):
+        if self._connection is None:
+            self._connection = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._connection.execute("PRAGMA foreign_keys = ON")
+            self._connection.executescript(self.schema)
+        return self._connection
+
+    def catalog_stamp(self):
+        with self._lock:
+            data_version = self.connection.execute("PRAGMA data_version").fetchone()[0]
+        return data_version, self.catalog_writes
+
+    def _get_stamps(self):
+        # Hashing the tables reads the whole database, so it is only redone once another connection committed;
+        # this connection's own writes update the stamps of what they wrote
+        with self._lock:
+            data_version = self.connection.execute("PRAGMA data_version").fetchone()[0]
+            if self._stamps is None or self._stamps["data_version"] != data_version:
+                self._stamps = {
+                    "data_version": data_version,
+                    "products": None,
+                    "recipes": {product_name: self._recipe_stamp(recipe.values())
+                                for product_name, recipe in self.load_all_recipes().items()}
+                }
+            return self._stamps
+
+    def _recipe_stamp(self, columns):
+        return hash(tuple(tuple(column) for column in columns))
+
+    def _restamp_product(self, product_name):
+        if self._stamps is None:
+            return
+        self._stamps["products"] = None
+        rows = self._recipe_rows(product_name)
+        if rows:
+            self._stamps["recipes"][product_name] = self._recipe_stamp(zip(*rows))
+        else:
+            self._stamps["recipes"].pop(product_name, None)
+
+    def products_stamp(self):
+        with self._lock:
+            stamps = self._get_stamps()
+            if stamps["products"] is None:
+                stamps["products"] = hash(tuple(self.connection.execute("SELECT * FROM products ORDER BY rowid")))
+            return stamps["products"]
+
+    def recipe_stamps(self, product_names=None):
+        recipes = self._get_stamps()["recipes"]
+        if product_names is None:
+            product_names = list(recipes)
+        return {product_name: recipes.get(product_name) for product_name in product_names}
+
+    def watch_paths(self):
+        return [self.db_path]
+
+    def load_ingredients(self):
+        with self._lock:
+            rows = self.connection.execute(
+                f"SELECT {', '.join(self.ingredient_fields)} FROM ingredients ORDER BY ingredient"
+            ).fetchall()
+        record_read(rows=len(rows))
+        return apply_schema(pd.DataFrame(rows, columns=INGREDIENT_COLUMNS), INGREDIENT_SCHEMA, "ingredients table")
+
+    def save_ingredients(self, df, changed_rows=None, removed=()):
+        # The ingredient is the table's key, so a repeated name would overwrite or drop one of its rows
+        duplicates = df["Ingredient"][df["Ingredient"].duplicated()].unique().tolist()
+        if duplicates:
+            raise ValueError(f"Duplicate ingredient(s): {', '.join(map(str, duplicates))}.")
+
+        if changed_rows is not None:
+            df = df[changed_rows]
+        columns = [decimal_floats(df[column]) for column in INGREDIENT_COLUMNS]
+        rows = [tuple(_sql_value(value) for value in row) for row in zip(*columns)]
+
+        with self._lock:
+            if changed_rows is None:
+                stored = self.connection.execute(f"SELECT {', '.join(self.ingredient_fields)} FROM ingredients").fetchall()
+                if len(stored) == len(rows) and set(stored) == set(rows):
+                    return False
+            elif not rows and not removed:
+                return False
+
+            with self.connection:
+                if changed_rows is None:
+                    self.connection.execute("DELETE FROM ingredients")
+                    self.connection.executemany(
+                        f"INSERT INTO ingredients VALUES ({', '.join('?' * len(self.ingredient_fields))})", rows
+                    )
+                else:
+                    # Only the edited rows are touched; renamed ingredients arrive as a removal plus a new row
+                    updates = ", ".join(f"{field} = excluded.{field}" for field in self.ingredient_fields[1:])
+                    self.connection.executemany("DELETE FROM ingredients WHERE ingredient = ?",
+                                                [(name,) for name in removed])
+                    self.connection.executemany(
+                        f"INSERT INTO ingredients VALUES ({', '.join('?' * len(self.ingredient_fields))}) "
+                        f"ON CONFLICT(ingredient) DO UPDATE SET {updates}", rows
+                    )
+                self.catalog_writes += 1
+        record_write(rows=len(rows))
+        return True
+
+    def upsert_ingredient(self, ingredient):
+        values = tuple(_sql_value(ingredient.get(column)) for column in INGREDIENT_COLUMNS)
+        updates = ", ".join(f"{field} = excluded.{field}" for field in self.ingredient_fields[1:])
+        with self._lock, self.connection:
+            self.connection.execute(
+                f"INSERT INTO ingredients VALUES ({', '.join('?' * len(values))}) "
+                f"ON CONFLICT(ingredient) DO UPDATE SET {updates}", values
+            )
+            self.catalog_writes += 1
+
+    def _offer_rows(self):
+        return self.connection.execute(f"SELECT {', '.join(self.offer_fields)} FROM offers ORDER BY rowid").fetchall()
+
+    def load_offers(self):
+        with self._lock:
+            rows = self._offer_rows()
+        record_read(rows=len(rows))
+        return apply_schema(pd.DataFrame(rows, columns=OFFER_COLUMNS), OFFER_SCHEMA, "offers table")
+
+    def save_offers(self, df):
+        columns = [decimal_floats(df[column]) for column in OFFER_COLUMNS]
+        rows = [tuple(_sql_value(value) for value in row) for row in zip(*columns)]
+        with self._lock:
+            if self._offer_rows() == rows:
+                return False
+            with self.connection:
+                self.connection.execute("DELETE FROM offers")
+                self.connection.executemany(
+                    f"INSERT INTO offers VALUES ({', '.join('?' * len(self.offer_fields))})", rows
+                )
+                self.catalog_writes += 1
+        record_write(rows=len(rows))
+        return True
+
+    def delete_ingredient(self, ingredient_name):
+        with self._lock, self.connection:
+            deleted = self.connection.execute("DELETE FROM ingredients WHERE ingredient = ?", (ingredient_name,)).rowcount
+            self.catalog_writes += 1
+        if not deleted:
+            raise ValueError(f"Ingredient \"{ingredient_name}\" not found.")
+
+    def load_products(self):
+        with self._lock:
+            rows = self.connection.execute(
+                "SELECT product, pieces_made, multiplier FROM products ORDER BY rowid"
+            ).fetchall()
+        record_read(rows=len(rows))
+        return apply_schema(pd.DataFrame(rows, columns=PRODUCT_COLUMNS), PRODUCT_SCHEMA, "products table")
+
+    def get_product(self, product_name):
+        with self._lock:
+            return self.connection.execute(
+                "SELECT pieces_made, multiplier FROM products WHERE product = ?", (product_name,)
+            ).fetchone()
+
+    def _recipe_rows(self, product_name):
+        with self._lock:
+            rows = self.connection.execute(
+                "SELECT ingredient, amount_used, amount_unit FROM recipe_lines WHERE product = ? ORDER BY line",
+                (product_name,)
+            ).fetchall()
+        record_read(rows=len(rows))
+        return rows
+
+    def load_recipe(self, product_name):
+        return apply_schema(self.load_recipe_columns(product_name), RECIPE_SCHEMA, f"Recipe \"{product_name}\"")
+
+    def load_recipe_columns(self, product_name):
+        rows = self._recipe_rows(product_name)
+        columns = list(zip(*rows)) or [()] * len(RECIPE_COLUMNS)
+        return dict(zip(RECIPE_COLUMNS, (list(column) for column in columns)))
+
+    def load_all_recipes(self):
+        recipes = {}
+        with self._lock:
+            rows = self.connection.execute(
+                "SELECT product, ingredient, amount_used, amount_unit FROM recipe_lines ORDER BY product, line"
+            ).fetchall()
+        record_read(rows=len(rows))
+        for product_name, ingredient, amount_used, amount_unit in rows:
+            recipe = recipes.setdefault(product_name, {column: [] for column in RECIPE_COLUMNS})
+            recipe["Ingredient"].append(ingredient)
+            recipe["Amount Used"].append(amount_used)
+            recipe["Amount Unit"].append(amount_unit)
+        return recipes
+
+    def _write_product(self, product_name, pieces_made, multiplier, recipe):
+        lines = [
+            (product_name, line, *(_sql_value(value) for value in row))
+            for line, row in enumerate(zip(*(recipe[column] for column in RECIPE_COLUMNS)))
+        ]
+        self.connection.execute(
+            "INSERT INTO products VALUES (?, ?, ?) "
+            "ON CONFLICT(product) DO UPDATE SET pieces_made = excluded.pieces_made, multiplier = excluded.multiplier",
+            (product_name, _sql_value(pieces_made), _sql_value(multiplier))
+        )
+        self.connection.execute("DELETE FROM recipe_lines WHERE product = ?", (product_name,))
+        self.connection.executemany("INSERT INTO recipe_lines VALUES (?, ?, ?, ?, ?)", lines)
+        self._restamp_product(product_name)
+        record_write(rows=len(lines) + 1)
+
+    def save_product(self, product_name, pieces_made, multiplier, recipe_df):
+        lines = [tuple(_sql_value(value) for value in row)
+                 for row in zip(*(recipe_df[column] for column in RECIPE_COLUMNS))]
+        with self._lock:
+            if (self.get_product(product_name) == (_sql_value(pieces_made), _sql_value(multiplier))
+                    and self._recipe_rows(product_name) == lines):
+                return False
+            with self.connection:
+                self._write_product(product_name, pieces_made, multiplier, recipe_df)
+        return True
+
+    def save_products(self, products):
+        with self._lock, self.connection:
+            for product in products:
+                self._write_product(*product)
+
+    def delete_product(self, product_name):
+        with self._lock, self.connection:
+            deleted = self.connection.execute("DELETE FROM products WHERE product = ?", (product_name,)).rowcount
+            self._restamp_product(product_name)
+        if not deleted:
+            raise ValueError(f"Product \"{product_name}\" not found.")
+
+if AppProfile.enabled:
+    for storage_class in (CsvStorage, ColumnarStorage, SqliteStorage):
+        AppProfile.instrument_class(storage_class)
+
+def open_storage(path):
+    if os.path.exists(f"{path}/{ColumnarStorage.recipes_index_file}"):
+        return ColumnarStorage(path)
+    return CsvStorage(path)
+
+def copy_storage(source, target):
+    target.save_ingredients(source.load_ingredients())
+    target.save_offers(source.load_offers())
+
+    products_df = source.load_products()
+
+    def products():
+        for product_name, pieces_made, multiplier in products_df[PRODUCT_COLUMNS].itertuples(index=False):
+            try:
+                recipe = source.load_recipe_columns(product_name)
+            except FileNotFoundError:
+                recipe = {column: [] for column in RECIPE_COLUMNS}
+            yield product_name, pieces_made, multiplier, recipe
+
+    target.save_products(products())
+    return len(products_df)
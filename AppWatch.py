@@ -0,0 +1,94 @@
+import os
+import sys
+import threading
+
+class CatalogWatcher:
+    """Watches the catalog files for outside edits, through Qt when an event loop is running, else by polling"""
+    def __init__(self, app_main, on_change=None, interval=1.0, use_qt=None):
+        self.app_main = app_main
+        self.on_change = on_change if on_change is not None else app_main.check_for_changes
+        self.interval = interval
+        self.use_qt = self._qt_available() if use_qt is None else use_qt
+
+        self._watcher = None
+        self._check_timer = None
+        self._poll_timer = None
+        self._stop_event = None
+        self._thread = None
+
+    def _qt_available(self):
+        if "PySide6.QtCore" not in sys.modules:
+            return False
+        from PySide6.QtCore import QCoreApplication
+        return QCoreApplication.instance() is not None
+
+    def start(self):
+        # The first check only takes the baseline stamps; through on_change it runs wherever later checks do, which
+        # keeps stat-ing a large catalog off the GUI thread
+        self.on_change()
+        self.app_main.watching = True
+
+        if self.use_qt:
+            self._start_qt()
+        else:
+            self._start_polling()
+
+    def stop(self):
+        self.app_main.watching = False
+
+        if self._watcher is not None:
+            self._check_timer.stop()
+            self._poll_timer.stop()
+            self._watcher.deleteLater()
+            self._watcher = None
+
+        if self._thread is not None:
+            self._stop_event.set()
+            self._thread.join()
+            self._thread = None
+
+    def _start_qt(self):
+        from PySide6.QtCore import QFileSystemWatcher, QTimer
+
+        self._watcher = QFileSystemWatcher()
+        self._watcher.fileChanged.connect(self._schedule_check)
+        self._watcher.directoryChanged.connect(self._schedule_check)
+
+        self._check_timer = QTimer(self._watcher)
+        self._check_timer.setSingleShot(True)
+        self._check_timer.setInterval(200)
+        self._check_timer.timeout.connect(self._check)
+
+        self._poll_timer = QTimer(self._watcher)
+        self._poll_timer.setInterval(int(self.interval * 1000))
+        self._poll_timer.timeout.connect(self._check)
+
+        # Polling also picks up what the watches miss: paths the OS refuses to watch, and recipe files rewritten in
+        # place inside a watched folder, which only report their own changes
+        self._poll_timer.start()
+        self._watch_paths()
+
+    def _watch_paths(self):
+        watched = set(self._watcher.files()) | set(self._watcher.directories())
+        paths = [path for path in self.app_main.storage.watch_paths() if path not in watched and os.path.exists(path)]
+        if paths:
+            self._watcher.addPaths(paths)
+
+    def _schedule_check(self, path):
+        self._check_timer.start()
+
+    def _check(self):
+        self._watch_paths()
+        self.on_change()
+
+    def _start_polling(self):
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._poll, name="CatalogWatcher", daemon=True)
+        self._thread.start()
+
+    def _poll(self):
+        while not self._stop_event.wait(self.interval):
+            try:
+                self.on_change()
+            except Exception as e:
+                print(f"Error checking for catalog changes: {e}.")
@@ -0,0 +1,34 @@
+import os
+import sys
+import shutil
+import pytest
+import pandas as pd
+
+REPO_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_PATH)
+
+from AppMain import AppMain, RECIPE_COLUMNS
+from AppStorage import open_storage
+
+def recipe(*lines):
+    return pd.DataFrame(list(lines), columns=RECIPE_COLUMNS)
+
+@pytest.fixture
+def catalog_path(tmp_path):
+    # A copy of the sample catalog, with a product that uses another one as a sub-recipe
+    shutil.copy(f"{REPO_PATH}/Ingredients.csv", tmp_path)
+    shutil.copy(f"{REPO_PATH}/Products.csv", tmp_path)
+    shutil.copytree(f"{REPO_PATH}/products", tmp_path / "products")
+
+    storage = open_storage(str(tmp_path))
+    storage.save_product("Layer", 4, 3, recipe(["Butter", 100, "g"], ["Cake flour", 200, "g"]))
+    storage.save_product("Cake", 1, 2, recipe(["Layer", 2, "pc"], ["Heavy cream", 1, "cup"],
+                                              ["Cake box (20x20)", 1, "pc"]))
+    return str(tmp_path)
+
+@pytest.fixture
+def app(catalog_path):
+    return AppMain(open_storage(catalog_path))
+
+def cost_all(app_main, **kwargs):
+    return {result["Product"]: result for result in app_main.cost_all_products(processes=1, **kwargs)}
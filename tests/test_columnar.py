@@ -0,0 +1,50 @@
+import pytest
+from AppMain import AppMain, main
+from AppStorage import CsvStorage, ColumnarStorage, open_storage
+from conftest import cost_all
+
+def uncached_costs(storage):
+    app_main = AppMain(storage)
+    app_main.use_cost_cache = False
+    return cost_all(app_main)
+
+def test_migration_keeps_recipes_and_costs(catalog_path, capsys):
+    expected = uncached_costs(CsvStorage(catalog_path))
+    recipes = CsvStorage(catalog_path).load_all_recipes()
+
+    main(["--path", catalog_path, "migrate-recipes"])
+    assert f"Consolidated {len(recipes)} recipes" in capsys.readouterr().err
+
+    storage = open_storage(catalog_path)
+    assert isinstance(storage, ColumnarStorage)
+    columnar_recipes = storage.load_all_recipes()
+    assert list(columnar_recipes) == list(recipes)
+    for product_name, columns in recipes.items():
+        assert columnar_recipes[product_name]["Ingredient"] == list(columns["Ingredient"])
+        assert columnar_recipes[product_name]["Amount Unit"] == list(columns["Amount Unit"])
+        assert columnar_recipes[product_name]["Amount Used"] == pytest.approx(
+            [float(amount) for amount in columns["Amount Used"]])
+        assert storage.load_recipe_columns(product_name) == columnar_recipes[product_name]
+    assert uncached_costs(storage) == expected
+
+def test_columnar_saves_survive_compaction(catalog_path):
+    ColumnarStorage(catalog_path).import_recipes(CsvStorage(catalog_path))
+    app_main = AppMain(open_storage(catalog_path))
+
+    # Each save appends a segment, more than the store keeps before it compacts them
+    for amount in range(1, ColumnarStorage.max_segments + 5):
+        app_main.save_product_data({"product_name": "Layer", "pieces_made": 4, "multiplier": 3,
+                                    "ingredients": [{"Ingredient": "Butter", "Amount Used": amount, "Amount Unit": "g"},
+                                                    {"Ingredient": "Cake flour", "Amount Used": 200,
+                                                     "Amount Unit": "g"}]})
+    app_main.delete_product_data("Cashew Sans Rival")
+
+    storage = open_storage(catalog_path)
+    assert storage.load_recipe_columns("Layer")["Amount Used"] == [ColumnarStorage.max_segments + 4, 200]
+    assert sorted(storage.load_all_recipes()) == ["Cake", "Layer"]
+    with pytest.raises(FileNotFoundError):
+        storage.load_recipe("Cashew Sans Rival")
+    assert len(storage._load_store()[1]) <= ColumnarStorage.max_segments
+    results = uncached_costs(storage)
+    assert results["Layer"]["Total Cost (€)"] == pytest.approx(
+        (ColumnarStorage.max_segments + 4) * 3.19 / 250 + 200 * 1.99 / 1000, abs=1e-4)
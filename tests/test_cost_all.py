@@ -0,0 +1,22 @@
+import csv
+import json
+from AppMain import main
+
+def test_blank_pieces_made_stay_blank(catalog_path, capsys):
+    products_path = f"{catalog_path}/Products.csv"
+    with open(products_path, encoding="utf-8") as products_file:
+        text = products_file.read()
+    with open(products_path, "w", encoding="utf-8") as products_file:
+        products_file.write(text.replace("Layer,4.0,3.0", "Layer,,3.0"))
+
+    main(["--path", catalog_path, "cost-all", "-o", f"{catalog_path}/Costs.csv"])
+    with open(f"{catalog_path}/Costs.csv", newline="", encoding="utf-8") as costs_file:
+        rows = {row["Product"]: row for row in csv.DictReader(costs_file)}
+    assert rows["Layer"]["Pieces Made"] == ""
+    assert rows["Layer"]["Status"] == "ok"
+    assert "nan" not in rows["Layer"].values()
+
+    main(["--path", catalog_path, "cost-all", "--format", "jsonl"])
+    results = {result["Product"]: result for result in map(json.loads, capsys.readouterr().out.splitlines())}
+    assert results["Layer"]["Pieces Made"] is None
+    assert results["Layer"]["Total Cost (€)"] == float(rows["Layer"]["Total Cost (€)"])
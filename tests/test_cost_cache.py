@@ -0,0 +1,121 @@
+import os
+import sqlite3
+import numpy as np
+import pytest
+from AppMain import AppMain, main
+from AppCostCache import CostCache
+from AppStorage import open_storage
+from conftest import recipe, cost_all
+
+def uncached_costs(catalog_path):
+    app_main = AppMain(open_storage(catalog_path))
+    app_main.use_cost_cache = False
+    return cost_all(app_main)
+
+def test_second_session_hits_cache(catalog_path):
+    first = cost_all(AppMain(open_storage(catalog_path)))
+
+    app_main = AppMain(open_storage(catalog_path))
+    assert cost_all(app_main) == first
+    stats = app_main._get_cost_cache().get_stats()
+    assert stats["hits"] == len(first) and stats["misses"] == 0
+
+def test_price_edit_misses_cache(app, catalog_path):
+    cost_all(app)
+    df = app.get_ingredients_df()
+    df.loc[df["Ingredient"] == "Butter", "Store Price (€)"] = 6.38
+    app.update_ingredients_file(df.to_dict(orient="list"))
+
+    app_main = AppMain(open_storage(catalog_path))
+    results = cost_all(app_main)
+    assert results == uncached_costs(catalog_path)
+    # Every product uses butter, directly or through its sub-recipe
+    assert app_main._get_cost_cache().get_stats()["misses"] == len(results)
+    assert results["Layer"]["Total Cost (€)"] == pytest.approx(100 * 6.38 / 250 + 200 * 1.99 / 1000, abs=1e-4)
+
+def test_sub_recipe_edit_misses_cache(app, catalog_path):
+    before = cost_all(app)
+    app.save_product_data({"product_name": "Layer", "pieces_made": 4, "multiplier": 3,
+                           "ingredients": [{"Ingredient": "Butter", "Amount Used": 200, "Amount Unit": "g"},
+                                           {"Ingredient": "Cake flour", "Amount Used": 200, "Amount Unit": "g"}]})
+
+    app_main = AppMain(open_storage(catalog_path))
+    results = cost_all(app_main)
+    assert results == uncached_costs(catalog_path)
+    assert results["Cake"]["Total Cost (€)"] == pytest.approx(
+        before["Cake"]["Total Cost (€)"] + 2 / 4 * 100 * 3.19 / 250, abs=1e-4)
+    stats = app_main._get_cost_cache().get_stats()
+    assert stats["misses"] == 2 and stats["hits"] == len(results) - 2
+
+def test_eviction_stays_within_max_bytes(tmp_path):
+    cost_cache = CostCache(str(tmp_path / CostCache.cache_file), max_bytes=4000)
+    keys = [f"key {i:04}".encode() for i in range(200)]
+    for i, key in enumerate(keys):
+        cost_cache.put(key, np.full(10, float(i)), np.zeros(10))
+        if i % 10 == 9:
+            # The first entry is read before each flush, which keeps it the most recently used
+            assert cost_cache.get(keys[0]) is not None
+            cost_cache.flush(force=True)
+            assert cost_cache.get_stats()["bytes"] <= cost_cache.max_bytes
+
+    assert cost_cache.get_stats()["entries"] < len(keys)
+    assert cost_cache.get(keys[0]) is not None
+    assert cost_cache.get(keys[1]) is None
+    assert cost_cache.get(keys[-1])[0].tolist() == [199.0] * 10
+    cost_cache.close()
+
+def test_verify_cache_detects_corrupted_entry(catalog_path, capsys):
+    expected = uncached_costs(catalog_path)
+    cost_all(AppMain(open_storage(catalog_path)))
+    with sqlite3.connect(f"{catalog_path}/{CostCache.cache_file}") as connection:
+        key, costs = connection.execute("SELECT key, costs FROM costs").fetchone()
+        connection.execute("UPDATE costs SET costs = ? WHERE key = ?",
+                           ((np.frombuffer(costs) + 1.0).tobytes(), key))
+
+    app_main = AppMain(open_storage(catalog_path))
+    app_main.verify_cost_cache = True
+    assert cost_all(app_main) == expected
+    assert app_main._get_cost_cache().get_stats()["mismatches"] == 1
+
+    # The replaced entry is fine again, which the command line check reports
+    capsys.readouterr()
+    main(["--path", catalog_path, "cost-all", "--verify-cache", "-o", f"{catalog_path}/Costs.csv"])
+    assert "0 stale" in capsys.readouterr().err
+
+def test_verify_cache_command_reports_stale_entry(catalog_path, capsys):
+    cost_all(AppMain(open_storage(catalog_path)))
+    with sqlite3.connect(f"{catalog_path}/{CostCache.cache_file}") as connection:
+        connection.execute("UPDATE costs SET costs = zeroblob(length(costs))")
+
+    main(["--path", catalog_path, "cost-all", "--verify-cache", "-o", f"{catalog_path}/Costs.csv"])
+    err = capsys.readouterr().err
+    assert "stale costs for" in err
+    assert f"{len(uncached_costs(catalog_path))} stale" in err
+
+def test_gui_and_cli_share_entries(app, catalog_path):
+    # Typed recipes hold float32 amounts, which must digest like the text cost-all parses
+    app.storage.save_product("Cream", 1, 2, recipe(["Heavy cream", 0.3, "cup"], ["Powdered sugar", 0.15, "cup"]))
+    cost_all(AppMain(open_storage(catalog_path)))
+
+    app_main = AppMain(open_storage(catalog_path))
+    for product_name in ["Cream", "Layer", "Cake"]:
+        app_main.get_product_data(product_name)
+    stats = app_main._get_cost_cache().get_stats()
+    assert stats["misses"] == 0 and stats["hits"] == 3
+    assert stats["entries"] == 4
+
+def test_unusable_cache_keeps_output_clean(catalog_path, capsys):
+    os.mkdir(f"{catalog_path}/{CostCache.cache_file}")
+    main(["--path", catalog_path, "cost-all"])
+    captured = capsys.readouterr()
+    assert captured.out.startswith("Product,")
+    assert "Error opening the cost cache" in captured.err
+
+def test_cache_uses_rollback_journal(tmp_path):
+    # Caches written in WAL mode are switched back, as WAL can't lock on network drives
+    db_path = str(tmp_path / CostCache.cache_file)
+    with sqlite3.connect(db_path) as connection:
+        connection.execute("PRAGMA journal_mode = WAL")
+    cost_cache = CostCache(db_path)
+    assert cost_cache.connection.execute("PRAGMA journal_mode").fetchone()[0] == "delete"
+    cost_cache.close()
@@ -0,0 +1,53 @@
+import os
+import pytest
+from AppMain import AppMain, main
+from AppHistory import PriceHistory
+from AppStorage import open_storage
+from conftest import cost_all
+
+def set_price(app_main, ingredient_name, price):
+    df = app_main.get_ingredients_df()
+    df.loc[df["Ingredient"] == ingredient_name, "Store Price (€)"] = price
+    app_main.update_ingredients_file(df.to_dict(orient="list"))
+
+def test_history_costs_each_snapshot_per_piece(app):
+    expected = [cost_all(app)]
+    for price in [4.0, 5.0]:
+        set_price(app, "Butter", price)
+        expected.append(cost_all(app))
+
+    history = app.get_cost_history()
+    assert len(history) == 3
+    for row, results in zip(history.itertuples(index=False), expected):
+        for product_name, value in zip(history.columns, row):
+            assert value == pytest.approx(results[product_name]["Production Cost (€)"], abs=1e-4)
+
+def test_unchanged_prices_add_no_snapshot(app, catalog_path):
+    app.get_cost_history()
+    app.get_cost_history()
+    set_price(app, "Cake flour", 1.99)
+    assert len(PriceHistory(catalog_path).load()[0]) == 1
+
+def test_external_edit_is_recorded(app, catalog_path):
+    app.check_for_changes()
+    assert len(PriceHistory(catalog_path).load()[0]) == 1
+
+    other = AppMain(open_storage(catalog_path))
+    df = other.get_ingredients_df()
+    df.loc[df["Ingredient"] == "Butter", "Store Price (€)"] = 6.38
+    other.storage.save_ingredients(df)
+    os.utime(f"{catalog_path}/Ingredients.csv", (1, 1))
+    app.check_for_changes()
+
+    times, names, records = PriceHistory(catalog_path).load()
+    assert len(times) == 2
+    assert [names[i] for i in records["ingredient"][records["snapshot"] == 1]] == ["Butter"]
+
+def test_history_command_errors_go_to_stderr(catalog_path, capsys, monkeypatch):
+    def record(self, price_table, timestamp=None):
+        raise OSError("No space left on device")
+    monkeypatch.setattr(PriceHistory, "record", record)
+    main(["--path", catalog_path, "history"])
+    captured = capsys.readouterr()
+    assert captured.out.startswith("Snapshot,")
+    assert "Error recording the price history" in captured.err
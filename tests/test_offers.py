@@ -0,0 +1,54 @@
+import pytest
+from AppMain import main
+from AppStorage import OFFER_COLUMNS
+from conftest import cost_all
+
+OFFERS = [
+    ["Butter", "Hofer", 2.49, 250, "g"],
+    ["Butter", "Lidl", 7.0, 0.5, "kg"],
+    ["Cake flour", "Hofer", 2.5, 1, "kg"]
+]
+
+@pytest.fixture
+def offer_app(app):
+    app.update_offers_file({column: [offer[i] for offer in OFFERS] for i, column in enumerate(OFFER_COLUMNS)})
+    return app
+
+def test_cheapest_offer(offer_app):
+    assert offer_app.get_offer("Butter", "g")["Store Brand"] == "Hofer"
+    assert offer_app.get_ingredient_cost("Butter", "g", "cheapest") == pytest.approx(2.49 / 250)
+    # The catalog's Finis flour beats the Hofer offer
+    assert offer_app.get_offer("Cake flour", "g")["Store Brand"] == "Finis"
+    assert offer_app.get_ingredient_cost("Butter", "g") == pytest.approx(3.19 / 250)
+
+def test_pinned_brand_falls_back_to_catalog(offer_app):
+    assert offer_app.get_ingredient_cost("Butter", "g", "Lidl") == pytest.approx(7.0 / 500)
+    assert offer_app.get_offer("Cake flour", "g", "Lidl")["Store Brand"] == "Finis"
+    assert offer_app.get_ingredient_cost("Cake flour", "g", "Hofer") == pytest.approx(2.5 / 1000)
+
+def test_unknown_brand_is_rejected(offer_app):
+    with pytest.raises(ValueError, match="Unknown store brand \"Aldi\""):
+        offer_app.get_ingredient_cost("Butter", "g", "Aldi")
+    with pytest.raises(ValueError):
+        offer_app.cost_all_products(offer="Aldi")
+
+def test_cost_all_with_offers(offer_app):
+    catalog = cost_all(offer_app)
+    cheapest = cost_all(offer_app, offer="cheapest")
+    lidl = cost_all(offer_app, offer="Lidl")
+
+    butter = 100 / 4 * 2
+    assert cheapest["Layer"]["Total Cost (€)"] == pytest.approx(
+        catalog["Layer"]["Total Cost (€)"] - 100 * (3.19 - 2.49) / 250, abs=1e-4)
+    assert cheapest["Cake"]["Total Cost (€)"] == pytest.approx(
+        catalog["Cake"]["Total Cost (€)"] - butter * (3.19 - 2.49) / 250, abs=1e-4)
+    assert lidl["Layer"]["Total Cost (€)"] == pytest.approx(
+        catalog["Layer"]["Total Cost (€)"] + 100 * (7.0 / 500 - 3.19 / 250), abs=1e-4)
+
+def test_command_line_rejects_unknown_brand(offer_app, catalog_path, capsys):
+    for command in [["cost-all", "--offer", "Aldi"], ["offers", "--unit", "g", "--offer", "Aldi"]]:
+        with pytest.raises(SystemExit) as exit_info:
+            main(["--path", catalog_path, *command])
+        assert exit_info.value.code == 2
+        captured = capsys.readouterr()
+        assert "Unknown store brand \"Aldi\"" in captured.err and not captured.out
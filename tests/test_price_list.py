@@ -0,0 +1,77 @@
+import csv
+import warnings
+from io import StringIO
+import pandas as pd
+import pytest
+from AppMain import validate_price_list
+
+PRICE_LIST = """Ingredient,Density (g/ml),Store Brand,Store Price (€),Store Amount,Store Unit
+Butter,,Spar,3.49,250,g
+Cake flour,0.45,Finis,1.99,1000,g
+Vanilla sugar,,Spar,0.89,8,g
+Cornstarch,,Arm & Hammer,free,250,g
+Heavy cream,heavy,Billa,2.69,500,ml
+Powdered sugar,,Spar,0.99,500,bag
+,,Spar,1.00,1,g
+"""
+
+def write_price_list(tmp_path, text=PRICE_LIST):
+    path = tmp_path / "PriceList.csv"
+    path.write_text(text, encoding="utf-8")
+    return str(path)
+
+def test_validation_reasons():
+    chunk = pd.read_csv(StringIO(PRICE_LIST), dtype=str, na_filter=False)
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        parsed, reasons = validate_price_list(chunk)
+    assert reasons.tolist() == ["", "", "", "store price must be a valid number", "density must be a valid number",
+                                "unknown store unit", "missing ingredient name"]
+    assert parsed.loc[0, "Store Price (€)"] == pytest.approx(3.49)
+
+def test_import_upserts_and_reports_rejects(app, tmp_path):
+    rejects_path = str(tmp_path / "Rejects.csv")
+    summary = app.import_price_list(write_price_list(tmp_path), rejects_path)
+
+    assert {key: summary[key] for key in ["rows", "updated", "unchanged", "added", "rejected"]} == {
+        "rows": 7, "updated": 2, "unchanged": 0, "added": 1, "rejected": 4}
+    assert app.get_ingredient_cost("Butter", "g") == pytest.approx(3.49 / 250)
+    assert app.get_ingredient_cost("Vanilla sugar", "g") == pytest.approx(0.89 / 8)
+    # A blank density keeps the catalog's
+    df = app.get_ingredients_df().set_index("Ingredient")
+    assert df.loc["Butter", "Density (g/ml)"] == pytest.approx(0.96)
+    assert df.loc["Cake flour", "Density (g/ml)"] == pytest.approx(0.45)
+    assert df.loc["Cornstarch", "Store Price (€)"] == pytest.approx(1.99)
+
+    with open(rejects_path, newline="", encoding="utf-8") as rejects_file:
+        rejects = list(csv.reader(rejects_file))
+    assert [row[:2] for row in rejects[1:]] == [["5", "store price must be a valid number"],
+                                                ["6", "density must be a valid number"],
+                                                ["7", "unknown store unit"], ["8", "missing ingredient name"]]
+
+def test_import_reads_in_chunks(app, tmp_path):
+    lines = [f"Butter,,Spar,{2 + i / 100:.2f},250,g" for i in range(50)]
+    text = PRICE_LIST.splitlines()[0] + "\n" + "\n".join(lines) + "\n"
+    summary = app.import_price_list(write_price_list(tmp_path, text), chunk_size=7)
+    # The last line for an ingredient wins
+    assert summary["rows"] == 50 and summary["updated"] == 1
+    assert app.get_ingredient_cost("Butter", "g") == pytest.approx(2.49 / 250)
+
+def test_other_brands_become_offers(app, tmp_path):
+    text = PRICE_LIST.splitlines()[0] + """
+butter,,Hofer,2.49,250,g
+Butter,,Lidl,7.00,0.5,kg
+Cake flour,,Hofer,2.50,1,kg
+"""
+    summary = app.import_price_list(write_price_list(tmp_path, text))
+    assert summary["offers"] == 3 and summary["rejected"] == 0 and summary["updated"] == 0
+    assert app.get_offer("Butter", "g")["Store Brand"] == "Hofer"
+    assert app.get_ingredient_cost("Butter", "g", "Lidl") == pytest.approx(7.0 / 500)
+    assert app.get_ingredient_cost("Butter", "g") == pytest.approx(3.19 / 250)
+
+    # A later price list updates the store's offer instead of adding another one
+    text = text.replace("2.49", "2.29")
+    summary = app.import_price_list(write_price_list(tmp_path, text))
+    assert summary["offers"] == 1 and summary["unchanged"] == 2
+    assert len(app.get_offers("Butter")) == 3
+    assert app.get_ingredient_cost("Butter", "g", "cheapest") == pytest.approx(2.29 / 250)
@@ -0,0 +1,59 @@
+import pytest
+import AppStorage
+
+@pytest.fixture
+def writes(monkeypatch):
+    paths = []
+    write_atomic = AppStorage.write_atomic
+
+    def counting_write(file_path, data):
+        paths.append(file_path)
+        return write_atomic(file_path, data)
+    monkeypatch.setattr(AppStorage, "write_atomic", counting_write)
+    return paths
+
+def test_unchanged_saves_do_no_io(app, writes):
+    catalog = app.get_ingredients_df().to_dict(orient="list")
+    assert app.update_ingredients_file(catalog) == []
+    product_data = app.get_product_data("Layer")
+    app.save_product_data({"product_name": "Layer", "pieces_made": product_data["pieces_made"],
+                           "multiplier": product_data["multiplier"],
+                           "ingredients": product_data["ingredients"].to_dict(orient="records")})
+    assert writes == []
+
+def test_changed_saves_write_only_their_files(app, catalog_path, writes):
+    df = app.get_ingredients_df()
+    df.loc[df["Ingredient"] == "Butter", "Store Price (€)"] = 3.49
+    impact = app.update_ingredients_file(df.to_dict(orient="list"))
+    assert writes == [f"{catalog_path}/Ingredients.csv"]
+    assert sorted(row["Product"] for row in impact) == ["Cake", "Cashew Sans Rival", "Layer"]
+
+    writes.clear()
+    app.save_product_data({"product_name": "Layer", "pieces_made": 4, "multiplier": 3,
+                           "ingredients": [{"Ingredient": "Butter", "Amount Used": 120, "Amount Unit": "g"},
+                                           {"Ingredient": "Cake flour", "Amount Used": 200, "Amount Unit": "g"}]})
+    assert writes == [f"{catalog_path}/products/Layer.csv"]
+
+def test_model_tracks_dirty_rows(app):
+    pytest.importorskip("PySide6")
+    from AppGUI import IngredientsModel
+
+    model = IngredientsModel()
+    model.load_df(app.get_ingredients_df())
+    assert not model.modified
+    with pytest.raises(AttributeError):
+        model.modified = False
+
+    butter = model.data_columns["Ingredient"].index("Butter")
+    price = model.columns.index("Store Price (€)")
+    model.setData(model.index(butter, price), "3.49")
+    assert model.changes() == {"rows": [butter], "removed": []}
+
+    # An edit made while a save is running stays changed once that save is done
+    snapshot = model.snapshot()
+    model.setData(model.index(0, price), "2.49")
+    model.mark_saved(snapshot)
+    assert model.changes() == {"rows": [0], "removed": []}
+
+    model.reset_modified()
+    assert not model.modified
@@ -0,0 +1,94 @@
+import os
+import numpy as np
+import pytest
+from AppMain import AppMain, build_price_index, build_price_table, build_cost_exposures
+from AppStorage import open_storage
+from conftest import recipe, cost_all
+
+def test_zero_volatility_matches_cost_all(app):
+    expected = cost_all(app)
+    margins = app.simulate_margins(scenarios=100, volatility=0.0, seed=1)["margins"].set_index("Product")
+
+    assert (margins["Status"] == "ok").all()
+    for product_name, result in expected.items():
+        row = margins.loc[product_name]
+        assert row["Invalid Lines"] == result["Invalid Lines"]
+        for column in ["Production Cost (€)", "Cost P5 (€)", "Cost P50 (€)", "Cost P95 (€)"]:
+            assert row[column] == pytest.approx(result["Production Cost (€)"], abs=1e-3)
+        assert row["Product Price (€)"] == pytest.approx(result["Product Price (€)"], abs=1e-3)
+        assert row["Loss Chance"] == 0
+
+def test_price_shock_follows_exposure(app):
+    base = app.simulate_margins(scenarios=10, volatility=0.0, seed=1)["margins"].set_index("Product")
+    shocked = app.simulate_margins(scenarios=10, volatility=0.0, shocks={"Butter": 0.5},
+                                   seed=1)["margins"].set_index("Product")
+    # Cake uses half a layer, so 50 g of butter per piece
+    assert shocked.loc["Cake", "Cost P50 (€)"] - base.loc["Cake", "Cost P50 (€)"] == pytest.approx(
+        0.5 * 50 * 3.19 / 250, abs=1e-3)
+
+def test_exposure_matrix(app):
+    price_table = build_price_table(build_price_index(app.get_ingredients_df()))
+    positions = price_table[0]
+    recipes = [recipe(["Butter", 100, "g"], ["Cake flour", 200, "g"]),
+               recipe(["Layer", 2, "pc"], ["Butter", 10, "g"], ["Unknown", 1, "g"], ["Butter", 1, "spoon"])]
+    exposures, invalid_lines, cyclic = build_cost_exposures(price_table, recipes, {"Layer": 4, "Cake": 1})
+
+    assert exposures.shape == (2, len(positions))
+    assert exposures[0, positions["Butter"]] == pytest.approx(100 * 3.19 / 250)
+    assert exposures[0, positions["Cake flour"]] == pytest.approx(200 * 1.99 / 1000)
+    # The sub-recipe is flattened into the ingredients it uses, per piece of it
+    assert exposures[1, positions["Butter"]] == pytest.approx((2 / 4 * 100 + 10) * 3.19 / 250)
+    assert exposures[1, positions["Cake flour"]] == pytest.approx(2 / 4 * 200 * 1.99 / 1000)
+    assert np.count_nonzero(exposures) == 4
+    assert invalid_lines.tolist() == [0, 2]
+    assert not cyclic.any()
+
+def test_exposure_matrix_with_cycle(app):
+    price_table = build_price_table(build_price_index(app.get_ingredients_df()))
+    # E uses F twice and F uses E; G only uses E, and H has no recipe
+    recipes = [recipe(["F", 1, "pc"], ["F", 1, "pc"], ["Butter", 10, "g"]),
+               recipe(["E", 1, "pc"], ["Butter", 5, "g"]),
+               recipe(["E", 1, "pc"], ["Butter", 5, "g"]),
+               None,
+               recipe(["H", 1, "pc"], ["G", 1, "g"], ["Butter", 5, "g"])]
+    exposures, invalid_lines, cyclic = build_cost_exposures(price_table, recipes,
+                                                            {"E": 1, "F": 1, "G": 1, "H": 1, "K": 1})
+
+    assert cyclic.tolist() == [True, True, True, False, False]
+    assert invalid_lines.tolist() == [2, 1, 1, 0, 2]
+    assert exposures[4, price_table[0]["Butter"]] == pytest.approx(5 * 3.19 / 250)
+
+def test_simulation_reports_cycles_and_invalid_lines(app, catalog_path):
+    app.storage.save_product("E", 1, 2, recipe(["F", 1, "pc"], ["Butter", 10, "g"]))
+    app.storage.save_product("F", 1, 2, recipe(["E", 1, "pc"], ["Butter", 5, "g"]))
+    app.storage.save_product("D", 1, 2, recipe(["Nope", 1, "g"], ["Butter", 5, "gallons"], ["Butter", 5, "g"]))
+    app.storage.save_product("G", 1, 2, recipe(["H", 1, "pc"], ["Butter", 5, "g"]))
+    app.storage.save_product("H", 1, 2, recipe(["Butter", 5, "g"]))
+    os.remove(f"{catalog_path}/products/H.csv")
+
+    app_main = AppMain(open_storage(catalog_path))
+    expected = cost_all(app_main)
+    margins = app_main.simulate_margins(scenarios=10, volatility=0.0, seed=1)["margins"].set_index("Product")
+
+    assert margins.loc[["E", "F"], "Status"].tolist() == ["recipe cycle", "recipe cycle"]
+    assert margins.loc[["E", "F"], "Production Cost (€)"].isna().all()
+    assert margins.loc["H", "Status"] == "missing recipe"
+    for product_name in ["E", "F", "D", "G"]:
+        assert margins.loc[product_name, "Invalid Lines"] == expected[product_name]["Invalid Lines"]
+    assert margins.loc["D", "Invalid Lines"] == 2 and margins.loc["G", "Invalid Lines"] == 1
+    assert margins.loc["D", "Production Cost (€)"] == pytest.approx(expected["D"]["Production Cost (€)"], abs=1e-3)
+
+def test_cost_all_reports_cycles_like_simulation(app, catalog_path):
+    app.storage.save_product("E", 1, 2, recipe(["F", 1, "pc"], ["Butter", 10, "g"]))
+    app.storage.save_product("F", 1, 2, recipe(["E", 1, "pc"], ["Butter", 5, "g"]))
+    app.storage.save_product("J", 1, 2, recipe(["E", 1, "pc"], ["Butter", 5, "g"]))
+
+    app_main = AppMain(open_storage(catalog_path))
+    expected = cost_all(app_main)
+    margins = app_main.simulate_margins(scenarios=10, volatility=0.0, seed=1)["margins"].set_index("Product")
+
+    for product_name, result in expected.items():
+        assert result["Status"] == margins.loc[product_name, "Status"]
+    for product_name in ["E", "F", "J"]:
+        assert expected[product_name]["Status"] == "recipe cycle"
+        assert "Total Cost (€)" not in expected[product_name]